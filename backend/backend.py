@@ -1,68 +1,298 @@
 import sys, pathlib
-import chromadb
+import copy
+import json
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Tuple
 
 sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
 
 from utils.get_model import get_base_model
-from utils.settings import VISION_MODEL, CHAT_MODEL
-from utils.get_database import get_database
+from utils.settings import (
+    VISION_MODEL,
+    CHAT_MODEL,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    PROMPT_CONTEXT_TOKENS,
+)
+from utils.get_database import (
+    get_database,
+    get_document_registry,
+    get_answer_cache,
+    get_lexical_index,
+    get_table_store,
+    embed_query,
+)
+from utils.lexical import identifier_terms, is_exact_token_query
+from utils.tables import row_chunk_id, row_document
+from utils.tokens import count_tokens, truncate_to_tokens
+from utils.cache import EmbeddingCache, LRUCache, hash_bytes
 from loguru import logger
 
+# Shared by all requests: textdb and imgdb are searched in parallel
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
 
-def get_available_files():
-    """Get list of available files from database"""
-    try:
-        storage = chromadb.PersistentClient("database/storage")
-        available_files = set()
+# Retrieval results keyed by (question, filename, collection versions), and
+# query vectors keyed by question, which stay valid across collection changes
+_retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+_query_embedding_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
+
+# Seconds spent in get_knowledge, split by whether the result cache was hit
+_latency_lock = threading.Lock()
+_latency = {"hit": [0, 0.0], "miss": [0, 0.0]}
 
-        # Check both textdb and imgdb for filenames
-        for collection_name in ["textdb", "imgdb"]:
-            try:
-                collection = storage.get_collection(name=collection_name)
-                result = collection.get(include=["metadatas"])
 
-                for metadata in result["metadatas"]:
-                    if metadata and "filename" in metadata:
-                        available_files.add(metadata["filename"])
-            except Exception as e:
-                logger.warning(f"Error checking {collection_name}: {e}")
+def get_available_files():
+    """Get list of available files from the document registry"""
+    try:
+        available_files = get_document_registry().filenames()
 
         # Add "all" option at the beginning
-        files_list = ["all"] + sorted(list(available_files))
+        files_list = ["all"] + available_files
         return files_list
     except Exception as e:
         logger.error(f"Error getting available files: {e}")
         return ["all", "manual"]  # Fallback to all and manual
 
 
-def get_knowledge(question: str, filename: Optional[str] = None):
-    """Get knowledge with detailed chunk information for citations"""
-    logger.info(f"Getting knowledge for question: {question}, filename: {filename}")
+def _normalize_question(question: str) -> str:
+    # The embedding model is uncased, so case and whitespace do not change results
+    return EmbeddingCache.normalize(question).lower()
 
-    textdb, imagedb = get_database("textdb"), get_database("imgdb")
 
-    if filename and filename != "all":
-        # Use metadata filters to query only chunks from the given filename
+def _record_latency(outcome: str, seconds: float) -> None:
+    with _latency_lock:
+        _latency[outcome][0] += 1
+        _latency[outcome][1] += seconds
 
-        text_results = textdb.query(
-            query_texts=question, n_results=3, where={"filename": filename}
-        )
 
-        image_results = imagedb.query(
-            query_texts=question, n_results=2, where={"filename": filename}
-        )
+def get_retrieval_cache_stats() -> Dict[str, float]:
+    """Hit rate of the retrieval and query embedding caches and mean retrieval latency"""
+    with _latency_lock:
+        latency = {
+            f"avg_{outcome}_ms": (total / count * 1000 if count else 0.0)
+            for outcome, (count, total) in _latency.items()
+        }
+    stats = {
+        **_retrieval_cache.stats(),
+        **latency,
+        "embedding_cache": _query_embedding_cache.stats(),
+    }
+    if ANSWER_CACHE_ENABLED:
+        stats["answer_cache"] = get_answer_cache().stats()
+    return stats
 
-    else:
-        # Original behavior - query all (filename is None or "all")
 
-        text_results = textdb.query(query_texts=question, n_results=3)
+def _embed_question(question: str):
+    """Embed a question, reusing the vector of an identical earlier question"""
+    normalized = _normalize_question(question)
+    query_embedding = _query_embedding_cache.get(normalized)
+    if query_embedding is None:
+        query_embedding = embed_query(question)
+        _query_embedding_cache.put(normalized, query_embedding)
+    return query_embedding
+
+
+def _timed_query(collection, query_embedding, n_results: int, where: Optional[Dict]):
+    """Run a collection query and return (results, seconds)"""
+    started = time.perf_counter()
+    results = collection.query(
+        query_embeddings=[query_embedding], n_results=n_results, where=where
+    )
+    return results, time.perf_counter() - started
+
 
-        image_results = imagedb.query(query_texts=question, n_results=2)
+def _fuse(dense_results: Dict, lexical_hits: List[Dict], n_results: int, k: int = 60) -> Dict:
+    """
+    Reciprocal rank fusion of a Chroma query result and lexical hits.
+
+    Returns the top n_results in the shape of a Chroma query result.
+    """
+    scores = defaultdict(float)
+    records = {}
+
+    dense = zip(
+        (dense_results.get("ids") or [[]])[0],
+        (dense_results.get("documents") or [[]])[0],
+        (dense_results.get("metadatas") or [[]])[0],
+    )
+    for rank, (id, document, metadata) in enumerate(dense):
+        scores[id] += 1 / (k + rank + 1)
+        records.setdefault(id, (document, metadata))
+
+    for rank, hit in enumerate(lexical_hits):
+        scores[hit["id"]] += 1 / (k + rank + 1)
+        records.setdefault(hit["id"], (hit["document"], hit["metadata"]))
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    return {
+        "ids": [ranked],
+        "documents": [[records[id][0] for id in ranked]],
+        "metadatas": [[records[id][1] for id in ranked]],
+    }
+
+
+def _table_row_hits(question: str, filename: Optional[str], n_results: int) -> List[Dict]:
+    """
+    Table rows containing every identifier of the question, looked up in the
+    structured table store, as lexical-style hits on their textdb chunks.
+    """
+    terms = identifier_terms(question)
+    if not terms:
+        return []
+
+    hits = []
+    for row in get_table_store().find_rows(terms, filename, limit=n_results):
+        document = row_document(row["text"], row["caption"])
+        hits.append(
+            {
+                "id": row_chunk_id(
+                    row["table_id"], row["filename"], row["page_idx"], row["row_idx"], document
+                ),
+                "document": document,
+                "metadata": {
+                    "page_idx": row["page_idx"],
+                    "path": row["img_path"],
+                    "type": "table_row",
+                    "filename": row["filename"],
+                    "table_id": row["table_id"],
+                    "row_idx": row["row_idx"],
+                },
+            }
+        )
+    return hits
+
+
+def _with_records(collection, hits: List[Dict]) -> List[Dict]:
+    """Lexical hits with their document and metadata, read from the Chroma collection"""
+    if not hits:
+        return []
+    records = collection.get(ids=[hit["id"] for hit in hits], include=["documents", "metadatas"])
+    by_id = {
+        id: (document, metadata or {})
+        for id, document, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+    }
+    return [
+        {**hit, "document": by_id[hit["id"]][0], "metadata": by_id[hit["id"]][1]}
+        for hit in hits
+        if hit["id"] in by_id
+    ]
+
+
+def _merge_hits(first: List[Dict], then: List[Dict]) -> List[Dict]:
+    """One ranking of `first` followed by the hits of `then` not already in it"""
+    ids = {hit["id"] for hit in first}
+    return first + [hit for hit in then if hit["id"] not in ids]
+
+
+def get_knowledge(
+    question: str,
+    filename: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+):
+    """
+    Get knowledge with detailed chunk information for citations.
+
+    Each collection is searched lexically (BM25) and densely, and the two
+    rankings are fused. The question is embedded once and textdb and imgdb are
+    searched with that vector concurrently. Table rows containing every
+    identifier of the question ("RS485", "+48V") are looked up in the table
+    store and ranked first among the lexical text hits. Questions made only of
+    identifiers that match lexically skip the embedding and dense search
+    entirely. If a `timings` dict is given, it is filled with the seconds
+    spent per stage (lexical, embed, text_search, image_search, total).
+
+    Results are cached per (normalized question, filename, collection versions),
+    so a repeated question skips the vector store until a collection changes;
+    timings then only report `total` and `cache_hit`.
+    """
+    logger.info(f"Getting knowledge for question: {question}, filename: {filename}")
+    started = time.perf_counter()
+
+    normalized = _normalize_question(question)
+    versions = get_document_registry().versions()
+    cache_key = (normalized, filename or "all", tuple(sorted(versions.items())))
+    cached = _retrieval_cache.get(cache_key)
+    if cached is not None:
+        elapsed = time.perf_counter() - started
+        _record_latency("hit", elapsed)
+        if timings is not None:
+            timings.update({"total": elapsed, "cache_hit": 1.0})
+        # Callers may annotate the chunks, so never hand out the cached objects
+        return copy.deepcopy(cached)
+
+    textdb, imagedb = get_database("textdb"), get_database("imgdb")
+
+    # Use metadata filters to query only chunks from the given filename;
+    # None or "all" queries every document
+    document_filter = filename if filename and filename != "all" else None
+    where = {"filename": document_filter} if document_filter else None
+
+    lexical_index = get_lexical_index()
+    lexical_started = time.perf_counter()
+    table_rows = _table_row_hits(question, document_filter, 3)
+    exact_text = (
+        _merge_hits(
+            table_rows,
+            _with_records(
+                textdb, lexical_index.search(question, "textdb", 3, document_filter, exact=True)
+            ),
+        )
+        if is_exact_token_query(question)
+        else []
+    )
+    if exact_text:
+        exact_image = _with_records(
+            imagedb, lexical_index.search(question, "imgdb", 2, document_filter, exact=True)
+        )
+        text_results = _fuse({}, exact_text, 3)
+        image_results = _fuse({}, exact_image, 2)
+        stage_timings = {"lexical": time.perf_counter() - lexical_started}
+    else:
+        lexical_text = _merge_hits(
+            table_rows,
+            _with_records(textdb, lexical_index.search(question, "textdb", 3, document_filter)),
+        )
+        lexical_image = _with_records(
+            imagedb, lexical_index.search(question, "imgdb", 2, document_filter)
+        )
+        lexical_seconds = time.perf_counter() - lexical_started
+
+        embed_started = time.perf_counter()
+        query_embedding = _embed_question(question)
+        embed_seconds = time.perf_counter() - embed_started
+
+        text_future = _search_pool.submit(_timed_query, textdb, query_embedding, 3, where)
+        image_future = _search_pool.submit(_timed_query, imagedb, query_embedding, 2, where)
+        text_results, text_seconds = text_future.result()
+        image_results, image_seconds = image_future.result()
+
+        text_results = _fuse(text_results, lexical_text, 3)
+        image_results = _fuse(image_results, lexical_image, 2)
+        stage_timings = {
+            "lexical": lexical_seconds,
+            "embed": embed_seconds,
+            "text_search": text_seconds,
+            "image_search": image_seconds,
+        }
+
+    stage_timings.update({"total": time.perf_counter() - started, "cache_hit": 0.0})
+    if timings is not None:
+        timings.update(stage_timings)
+    logger.debug(
+        "Retrieval timings: "
+        + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stage_timings.items())
+    )
 
     if not text_results.get("documents") or not text_results["documents"][0]:
         logger.warning("No relevant text content found.")
 
+        _retrieval_cache.put(cache_key, ([], []))
+        _record_latency("miss", time.perf_counter() - started)
         return [], []
 
     if not image_results.get("metadatas") or not image_results["metadatas"][0]:
@@ -94,6 +324,10 @@ def get_knowledge(question: str, filename: Optional[str] = None):
         for i, meta in enumerate(image_results["metadatas"][0]):
             image_chunks_with_meta.append(
                 {
+                    "content": image_results["documents"][0][i]
+                    if image_results.get("documents")
+                    and i < len(image_results["documents"][0])
+                    else "",
                     "metadata": meta,
                     "chunk_id": image_results["ids"][0][i]
                     if i < len(image_results["ids"][0])
@@ -102,12 +336,116 @@ def get_knowledge(question: str, filename: Optional[str] = None):
                 }
             )
 
+    _retrieval_cache.put(
+        cache_key, copy.deepcopy((text_chunks_with_meta, image_chunks_with_meta))
+    )
+    _record_latency("miss", time.perf_counter() - started)
     return text_chunks_with_meta, image_chunks_with_meta
 
 
-def form_context_info(question: str, filename: Optional[str] = None):
+def _chunk_fingerprints(chunk_ids: Dict[str, List[str]]) -> Dict[str, Dict[str, str]]:
+    """Hash of the stored document and metadata of each chunk, per collection"""
+    fingerprints = {}
+    for name, ids in chunk_ids.items():
+        if not ids:
+            continue
+        stored = get_database(name).get(ids=ids, include=["documents", "metadatas"])
+        fingerprints[name] = {
+            id: hash_bytes(json.dumps([document, metadata], sort_keys=True))
+            for id, document, metadata in zip(
+                stored["ids"], stored["documents"], stored["metadatas"]
+            )
+        }
+    return fingerprints
+
+
+def _chunks_unchanged(fingerprints: Dict[str, Dict[str, str]]) -> bool:
+    current = _chunk_fingerprints(
+        {name: list(ids) for name, ids in fingerprints.items()}
+    )
+    return all(current.get(name) == ids for name, ids in fingerprints.items())
+
+
+def get_cached_answer(
+    question: str,
+    filename: Optional[str] = None,
+    model: str = CHAT_MODEL,
+    follow_up: bool = False,
+) -> Optional[Dict]:
+    """
+    Look up an answer generated for a paraphrase of this question.
+
+    Returns the cached payload (answer, citations, text_chunks, image_chunks,
+    similarity) when the answer cache is enabled, a question with the same
+    document filter and model is at least ANSWER_CACHE_THRESHOLD similar, and
+    the chunks that answer was based on are unchanged. Returns None otherwise.
+
+    Follow-up questions (asked after earlier turns of a conversation) are never
+    looked up: their meaning depends on the conversation ("and the second
+    step?"), which the cache key does not capture.
+    """
+    if not ANSWER_CACHE_ENABLED or follow_up:
+        return None
+
+    cached = get_answer_cache().lookup(
+        filename or "all",
+        model,
+        _embed_question(question),
+        ANSWER_CACHE_THRESHOLD,
+        _chunks_unchanged,
+    )
+    if cached is not None:
+        logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f}): {question}")
+    return cached
+
+
+def cache_answer(
+    question: str,
+    filename: Optional[str],
+    answer: str,
+    citations: List[Dict],
+    text_chunks: List[Dict],
+    image_chunks: List[Dict],
+    model: str = CHAT_MODEL,
+    follow_up: bool = False,
+) -> None:
+    """
+    Store a generated answer in the answer cache (no-op unless it is enabled).
+
+    The answer depends on the chunks it cites, or on every retrieved chunk
+    when it cites none; any change to those chunks invalidates it. Answers to
+    follow-up questions also depend on the conversation and are not stored.
+    """
+    if not ANSWER_CACHE_ENABLED or follow_up:
+        return
+
+    cited = {citation["chunk_id"] for citation in citations}
+    chunk_ids = {
+        name: [chunk["chunk_id"] for chunk in chunks if not cited or chunk["chunk_id"] in cited]
+        for name, chunks in (("textdb", text_chunks), ("imgdb", image_chunks))
+    }
+    get_answer_cache().put(
+        filename or "all",
+        model,
+        question,
+        _embed_question(question),
+        _chunk_fingerprints(chunk_ids),
+        {
+            "answer": answer,
+            "citations": citations,
+            "text_chunks": text_chunks,
+            "image_chunks": image_chunks,
+        },
+    )
+
+
+def form_context_info(
+    question: str,
+    filename: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+):
     """Form context info with detailed chunk metadata for citations"""
-    text_chunks, image_chunks = get_knowledge(question, filename)
+    text_chunks, image_chunks = get_knowledge(question, filename, timings)
 
     logger.debug("logging extracted texts ......")
     for chunk in text_chunks:
@@ -130,40 +468,84 @@ def form_context_info(question: str, filename: Optional[str] = None):
         image_chunks,
     )  # Return both legacy and new format
 
-def create_citation_context(text_chunks: List[Dict], image_chunks: List[Dict]) -> str:
-    """Create context with citation markers for the LLM."""
+# Chunks are not cut below this many tokens; a smaller remainder is left unused
+MIN_TRUNCATED_TOKENS = 64
+
+
+def create_citation_context(
+    text_chunks: List[Dict],
+    image_chunks: List[Dict],
+    budget: int = PROMPT_CONTEXT_TOKENS,
+    model: str = CHAT_MODEL,
+    stats: Optional[Dict[str, int]] = None,
+) -> str:
+    """
+    Create context with citation markers for the LLM, within a token budget.
+
+    Sources are added in relevance order (text chunks, then images and
+    tables) and kept whole while they fit. The first source that does not
+    fit is cut to the remaining budget; sources that cannot get even
+    MIN_TRUNCATED_TOKENS are left out. Counts of included, truncated and
+    dropped sources plus the context size are written to `stats`.
+    """
     context_parts = []
-    
-    # Add text chunks - use simple [1], [2] format
-    for chunk in text_chunks:
+    remaining = budget
+    counts = {"included": 0, "truncated": 0, "dropped": 0}
+
+    sources = [(chunk, False) for chunk in text_chunks] + [
+        (chunk, True) for chunk in image_chunks
+    ]
+    for chunk, is_image in sources:
         citation_num = chunk.get("citation_num", "?")
         content = chunk.get("content", "")
         meta = chunk.get("metadata", {})
         filename = meta.get("filename", "unknown")
         page = meta.get("page_idx", "?")
-        
-        context_parts.append(
-            f"[{citation_num}]\n{content[:500]}...\n(from {filename}, page {page})"
-        )
-    
-    # Add image/table information
-    for chunk in image_chunks:
-        citation_num = chunk.get("citation_num", "?")
-        meta = chunk.get("metadata", {})
-        filename = meta.get("filename", "unknown")
-        page = meta.get("page_idx", "?")
-        img_type = meta.get("type", "image")
-        
-        context_parts.append(
-            f"[{citation_num}]\n{img_type.capitalize()} content\n(from {filename}, page {page})"
-        )
-    
-    return "\n\n".join(context_parts)
 
+        # Use simple [1], [2] format; images and tables are labelled by type
+        header = f"[{citation_num}]"
+        if is_image:
+            header += f"\n{meta.get('type', 'image').capitalize()} content"
+        footer = f"(from {filename}, page {page})"
+
+        part = "\n".join(filter(None, [header, content, footer]))
+        cost = count_tokens(part, model) + 1  # separating blank line
+        if cost <= remaining:
+            context_parts.append(part)
+            remaining -= cost
+            counts["included"] += 1
+            continue
+
+        room = remaining - count_tokens(f"{header}\n...\n{footer}", model) - 1
+        if content and room >= MIN_TRUNCATED_TOKENS:
+            part = f"{header}\n{truncate_to_tokens(content, room, model)}...\n{footer}"
+            context_parts.append(part)
+            remaining -= count_tokens(part, model) + 1
+            counts["truncated"] += 1
+        else:
+            counts["dropped"] += 1
+
+    citation_context = "\n\n".join(context_parts)
+    if stats is not None:
+        stats.update(counts, context_tokens=count_tokens(citation_context, model))
+    return citation_context
+
+
+def build_prompt_with_citations(
+    question: str,
+    text_chunks: List[Dict],
+    image_chunks: List[Dict],
+    stats: Optional[Dict[str, int]] = None,
+) -> Tuple[str, str]:
+    """
+    Build system prompt and context with citations for the LLM.
 
-def build_prompt_with_citations(question: str, text_chunks: List[Dict], image_chunks: List[Dict]) -> Tuple[str, str]:
-    """Build system prompt and context with citations for the LLM."""
-    citation_context = create_citation_context(text_chunks, image_chunks)
+    When `stats` is given, it receives the context statistics of
+    create_citation_context and the estimated size of the whole prompt
+    (prompt_tokens).
+    """
+    stats = {} if stats is None else stats
+    citation_context = create_citation_context(text_chunks, image_chunks, stats=stats)
     
     complete_prompt = f"""Answer the following question using the reference sources below.
 
@@ -190,7 +572,8 @@ EXAMPLES OF WRONG CITATIONS:
 ✗ "...as described in [N]"
 
 Now write your answer with correct [number] citations:"""
-    
+
+    stats["prompt_tokens"] = count_tokens(complete_prompt)
     return complete_prompt, citation_context
     
 
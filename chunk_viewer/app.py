@@ -1,6 +1,5 @@
 import sys
 import pathlib
-import chromadb
 from flask import Flask, render_template, jsonify, send_file, abort, request
 from flask_cors import CORS
 import os
@@ -12,15 +11,16 @@ PROJECT_ROOT = CURRENT_DIR.parent
 # Add parent directory to path to access main project modules
 sys.path.append(str(PROJECT_ROOT))
 
+# Storage path relative to main project, unless configured otherwise; set
+# before importing settings so the shared client and side-stores all use it
+DB_PATH = PROJECT_ROOT / "database" / "storage"
+os.environ.setdefault("STORAGE_PATH", str(DB_PATH))
+
 from utils import get_database, settings
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 CORS(app)
 
-# Initialize ChromaDB client - path relative to main project
-DB_PATH = PROJECT_ROOT / "database" / "storage"
-storage = chromadb.PersistentClient(str(DB_PATH))
-
 @app.route('/')
 def index():
     """Render the main chunk viewer page"""
@@ -31,25 +31,11 @@ def index():
 def get_available_files():
     """Get list of available files from database"""
     try:
-        available_files = set()
-
-        # available_files.add("manual")  # Always include 'manual' as a default option
-        
-        # Check both textdb and imgdb for filenames
-        for collection_name in ['textdb', 'imgdb']:
-            try:
-                collection = storage.get_collection(name=collection_name)
-                result = collection.get(include=['metadatas'])
-                
-                for metadata in result['metadatas']:
-                    if metadata and 'filename' in metadata:
-                        available_files.add(metadata['filename'])
-            except Exception as e:
-                print(f"Error checking {collection_name}: {e}")
+        available_files = get_database.get_document_registry().filenames()
         
         return jsonify({
             'success': True,
-            'files': sorted(list(available_files))
+            'files': available_files
         })
     except Exception as e:
         return jsonify({
@@ -67,7 +53,7 @@ def get_chunks():
         
         # Get chunks from textdb
         try:
-            textdb = storage.get_collection(name='textdb')
+            textdb = get_database.get_database('textdb')
             text_result = textdb.get(include=['documents', 'metadatas'])
             
             for i in range(len(text_result['ids'])):
@@ -89,7 +75,7 @@ def get_chunks():
         
         # Get chunks from imgdb
         try:
-            imgdb = storage.get_collection(name='imgdb')
+            imgdb = get_database.get_database('imgdb')
             img_result = imgdb.get(include=['documents', 'metadatas'])
             
             for i in range(len(img_result['ids'])):
@@ -153,7 +139,7 @@ def update_chunk(source, chunk_id):
         if new_doc is None and new_metadata is None:
             return jsonify({'success': False, 'error': 'Nothing to update. Provide document and/or metadata.'}), 400
 
-        collection = storage.get_collection(name=source)
+        collection = get_database.get_database(source)
 
         # Validate the chunk exists
         try:
@@ -168,6 +154,8 @@ def update_chunk(source, chunk_id):
         update_kwargs = {'ids': [chunk_id]}
         if new_doc is not None:
             update_kwargs['documents'] = [new_doc]
+            # Reuse the cached vector when the text did not actually change
+            update_kwargs['embeddings'] = get_database.embed_documents([new_doc])
         if new_metadata is not None:
             # Merge metadata over existing metadata (shallow merge)
             current_meta = existing.get('metadatas', [{}])[0] or {}
@@ -178,6 +166,12 @@ def update_chunk(source, chunk_id):
 
         # Return the updated record
         updated = collection.get(ids=[chunk_id], include=['documents', 'metadatas'])
+
+        get_database.get_lexical_index().add(
+            source, updated['ids'], updated['documents'], updated['metadatas']
+        )
+        get_database.get_document_registry().bump_version(source)
+        get_database.get_answer_cache().invalidate_chunks([chunk_id])
         result = {
             'id': updated['ids'][0],
             'document': (updated['documents'][0] if updated.get('documents') else None),
@@ -1,9 +1,9 @@
 """
 Script to check the status of chunks in the database
 """
+import os
 import sys
 import pathlib
-import chromadb
 
 # Get the base paths relative to this file
 CURRENT_DIR = pathlib.Path(__file__).parent
@@ -12,12 +12,16 @@ PROJECT_ROOT = CURRENT_DIR.parent
 # Add parent directory to path
 sys.path.append(str(PROJECT_ROOT))
 
+# Storage path relative to main project, unless configured otherwise
+os.environ.setdefault("STORAGE_PATH", str(PROJECT_ROOT / "database" / "storage"))
+
+from utils import get_database
+
 def check_database():
     """Check the contents of the ChromaDB collections"""
     
-    # Initialize ChromaDB client - path relative to main project
-    DB_PATH = PROJECT_ROOT / "database" / "storage"
-    storage = chromadb.PersistentClient(str(DB_PATH))
+    # Shared process-wide ChromaDB client
+    storage = get_database.get_storage()
     
     # Get all collections
     collections = storage.list_collections()
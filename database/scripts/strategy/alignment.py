@@ -0,0 +1,142 @@
+import bisect
+import pathlib
+from typing import Dict, List, Optional, Tuple
+
+Span = Tuple[int, int]
+
+
+class MarkdownIndex:
+    """
+    Character spans of MinerU content items in the document markdown.
+
+    MinerU writes the markdown in content_list order, so items are located with
+    a single forward cursor instead of searching the whole document for every
+    chunk. Context windows then become slices around a known span.
+
+    An item not found ahead of the cursor is only looked for in the `window`
+    characters behind it, so items missing from the markdown cost one forward
+    scan each instead of a scan of the whole document.
+    """
+
+    def __init__(self, markdown: str, window: int = 20000):
+        self.markdown = markdown
+        self.window = window
+        self.cursor = 0
+        self.misses = 0
+
+    @staticmethod
+    def _patterns(item: Dict) -> List[str]:
+        """Strings that identify an item in the markdown, most specific first"""
+        img_path = item.get("img_path", "")
+        image_patterns = (
+            [
+                f"![]({img_path})",
+                f"![](images/{pathlib.Path(img_path).name})",
+                pathlib.Path(img_path).name,
+            ]
+            if img_path
+            else []
+        )
+
+        item_type = item.get("type")
+        if item_type == "image":
+            return image_patterns
+        if item_type == "table":
+            # First 100 chars of the HTML body, then the table image
+            return [item.get("table_body", "")[:100]] + image_patterns
+        return [item.get("text", "").strip()]
+
+    def locate(self, item: Dict) -> Optional[Span]:
+        """Find the span of the next item, advancing the cursor past it"""
+        patterns = [pattern for pattern in self._patterns(item) if pattern]
+        if not patterns:
+            return None
+
+        for pattern in patterns:
+            index = self.markdown.find(pattern, self.cursor)
+            if index != -1:
+                self.cursor = index + len(pattern)
+                return index, index + len(pattern)
+
+            # Out-of-order item: accept a nearby earlier match without moving the cursor
+            index = self.markdown.find(
+                pattern, max(0, self.cursor - self.window), self.cursor + len(pattern) - 1
+            )
+            if index != -1:
+                return index, index + len(pattern)
+
+        self.misses += 1
+        return None
+
+    def align(self, items: List[Dict]) -> List[Optional[Span]]:
+        """Locate all items in document order"""
+        return [self.locate(item) for item in items]
+
+    def context(self, span: Span, context_length: int) -> str:
+        """Markdown around a span, extended by context_length on both sides"""
+        start = max(0, span[0] - context_length)
+        return self.markdown[start : span[1] + context_length]
+
+
+class PageText:
+    """
+    The joined text of one page, with a map from page offsets to markdown spans.
+
+    Text chunks are split from `text`, so a chunk's markdown span is found by
+    locating it in the page text and translating both ends through the spans of
+    the items it covers.
+    """
+
+    def __init__(self, items: List[Dict], spans: List[Optional[Span]]):
+        self.text = " ".join([item.get("text", "") for item in items])
+
+        # (page offset, item text, markdown span) per item, in page order
+        self.offsets: List[int] = []
+        self.segments: List[Tuple[str, Optional[Span]]] = []
+        offset = 0
+        for item, span in zip(items, spans):
+            text = item.get("text", "")
+            self.offsets.append(offset)
+            self.segments.append((text, span))
+            offset += len(text) + 1
+
+        self.cursor = 0
+
+    def _to_markdown(self, position: int, is_start: bool) -> Optional[int]:
+        """Translate a page-text offset to a markdown offset"""
+        i = max(0, bisect.bisect_right(self.offsets, position) - 1)
+        text, span = self.segments[i]
+
+        if span is not None:
+            # Item spans cover the stripped text
+            lead = len(text) - len(text.lstrip())
+            inner = min(max(0, position - self.offsets[i] - lead), span[1] - span[0])
+            return span[0] + inner
+
+        # Unlocated item: fall back to the nearest located neighbour
+        neighbours = (
+            self.segments[i + 1 :] if is_start else reversed(self.segments[:i])
+        )
+        for _, span in neighbours:
+            if span is not None:
+                return span[0] if is_start else span[1]
+        return None
+
+    def chunk_span(self, chunk: str) -> Optional[Span]:
+        """Markdown span covered by a chunk split from this page's text"""
+        # Chunks come in order and overlap, so search forward from the last one
+        position = self.text.find(chunk, self.cursor)
+        if position == -1:
+            position = self.text.find(chunk)
+            if position == -1:
+                return None
+        else:
+            self.cursor = position + 1
+
+        start = self._to_markdown(position, is_start=True)
+        end = self._to_markdown(position + len(chunk), is_start=False)
+        if start is None and end is None:
+            return None
+        if start is None or end is None or end < start:
+            start = end = start if start is not None else end
+        return start, end
@@ -0,0 +1,57 @@
+import os
+import sys, pathlib
+import json
+from typing import Dict, Iterable, Set
+
+sys.path.append(pathlib.Path(__file__).parents[3].as_posix())
+
+from utils.settings import STORAGE_PATH
+from utils.registry import COLLECTIONS
+
+JOURNAL_DIR = pathlib.Path(STORAGE_PATH) / "journals"
+
+
+class IngestJournal:
+    """
+    Append-only checkpoint log of one document's ingestion.
+
+    Chunk ids are appended once their batch has been written to the vector
+    store. A run that crashes leaves the journal behind, and the next run skips
+    every journaled chunk instead of starting over. The journal is closed
+    (removed) only after the document has been recorded as complete.
+    """
+
+    def __init__(self, filename: str, directory: pathlib.Path = JOURNAL_DIR):
+        self.path = pathlib.Path(directory) / f"{filename}.jsonl"
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def completed_ids(self) -> Dict[str, Set[str]]:
+        """Ids already written for this document, per collection"""
+        completed = {name: set() for name in COLLECTIONS}
+        if not self.path.exists():
+            return completed
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append
+                    continue
+                completed.setdefault(entry["collection"], set()).add(entry["id"])
+        return completed
+
+    def record(self, collection_name: str, ids: Iterable[str]) -> None:
+        """Durably append ids that have been written to a collection"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for id in ids:
+                f.write(json.dumps({"collection": collection_name, "id": id}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        """Mark the document complete by removing its journal"""
+        self.path.unlink(missing_ok=True)
@@ -2,157 +2,284 @@ import sys, pathlib
 import chromadb
 import json
 import base64
-from collections import defaultdict
+from collections import Counter, defaultdict
 from tqdm import tqdm
-from typing import Union
+from typing import Dict, Optional, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from logging import getLogger
 
 logger = getLogger(__name__)
 sys.path.append(pathlib.Path(__file__).parents[2].as_posix())
 
-from utils import functions, get_database, get_model, settings, metadata
+from utils import cache, functions, get_database, get_model, images, settings, metadata, tables
+from utils.registry import DocumentRegistry
+from database.scripts.strategy import alignment
+from database.scripts.strategy.store import ChromaStore
+from database.scripts.strategy.journal import IngestJournal
+from database.scripts.strategy.streaming import StreamingMarkdown, iter_json_array, iter_pages
 
 TEXT_LENGTH_FILTER = 200
 
+# Bump whenever the summarization prompt changes so cached summaries are not reused
+PROMPT_VERSION = "v1"
+
 
 class MarkdownEmbedding:
-    def __init__(self, json_path: str, markdown_path: str, filename: str = None):
+    def __init__(
+        self,
+        json_path: str,
+        markdown_path: str,
+        filename: str = None,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        concurrency: int = settings.VISION_CONCURRENCY,
+        timeout: float = settings.VISION_TIMEOUT,
+        store=None,
+        streaming: bool = False,
+    ):
         self.json_path = json_path
         self.markdown_path = markdown_path
         self.filename = filename or pathlib.Path(json_path).stem
 
         # Initialize base model using gemma3:27b
-        self.base_model = get_model.get_base_model(use_model=settings.VISION_MODEL)
-
-        # Initialize vector databases
-        self.textdb = get_database.get_database("textdb")
-        self.imgdb = get_database.get_database("imgdb")
+        self.base_model = get_model.get_base_model(
+            use_model=settings.VISION_MODEL, timeout=timeout
+        )
+        self.concurrency = max(1, concurrency)
+        self.summary_cache = cache.SummaryCache()
+        self.image_preprocessor = images.ImagePreprocessor()
+
+        # Decorative and repeated images are not summarized; they are recorded
+        # in the registry with the reason (and the image that covers them)
+        self.image_classifier = images.ImageClassifier()
+        self.skipped_images = []
+
+        # Repeated images still get their own imgdb entry, reusing the summary
+        # of their first occurrence: summaries of images written in this run,
+        # images submitted for a summary, and duplicates waiting for one
+        self.image_summaries = {}
+        self.submitted_images = set()
+        self.pending_duplicates = defaultdict(list)
+
+        # Tables with an extracted HTML body are indexed row by row without a
+        # vision call; their cells are also kept in the structured table store
+        self.table_ids = []
+        self.table_rows = 0
+
+        # Destination of chunks: the local vector databases by default, or a
+        # QueueStore when running inside a parallel ingestion worker.
+        # Writes are buffered so each collection is written (and embedded) in bulk
+        self.store = store or ChromaStore(batch_size)
+        self.text_writer = self.store.writers["textdb"]
+        self.img_writer = self.store.writers["imgdb"]
+
+        # Chunk ids already stored for this document (filled in incremental mode)
+        # and ids produced by the current run, per collection
+        self.existing_ids = {"textdb": set(), "imgdb": set()}
+        self.seen_ids = {"textdb": set(), "imgdb": set()}
+
+        # Pages whose text could not be processed; their stored text chunks
+        # are kept rather than treated as stale
+        self.failed_pages = set()
+        # Images and tables whose summary failed in this run
+        self.failed_items = 0
 
         # Initialize text splitter
         self.text_splitter = get_database.get_text_splitter(
             chunk_size=1000, chunk_overlap=200
         )
 
-        # Load JSON and markdown content
-        with open(self.json_path, "r", encoding="utf-8") as f:
-            self.json_data = json.load(f)
-
-        with open(self.markdown_path, "r", encoding="utf-8") as f:
-            self.markdown_content = f.read()
-
-    def _get_context_around_text(self, text: str, context_length: int) -> str:
-        """Get context around a specific text in markdown"""
-        text_index = self.markdown_content.find(text)
-        if text_index == -1:
-            return text  # If text not found, return original text
-
-        start_index = max(0, text_index - context_length)
-        end_index = min(
-            len(self.markdown_content), text_index + len(text) + context_length
+        # In streaming mode the content list and markdown are read page by page
+        # by run(), so memory stays bounded by a page instead of the document
+        self.streaming = streaming
+        if streaming:
+            self.json_data = None
+            markdown = StreamingMarkdown(self.markdown_path)
+        else:
+            # Load JSON and markdown content
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                self.json_data = json.load(f)
+
+            with open(self.markdown_path, "r", encoding="utf-8") as f:
+                self.markdown_content = f.read()
+            markdown = self.markdown_content
+
+        # Character spans of content items in the markdown, filled by run()
+        self.markdown_index = alignment.MarkdownIndex(markdown)
+
+    def _get_context(self, span, context_length: int, default: str = "") -> str:
+        """Get markdown context around an aligned span, or default if it was not found"""
+        if span is None:
+            return default
+        return self.markdown_index.context(span, context_length)
+
+    def _chunk_id(self, item) -> str:
+        """Stable imgdb id for an image or table item"""
+        item_type = item.get("type")
+        content = (
+            item.get("img_path", "")
+            if item_type == "image"
+            else json.dumps(item, sort_keys=True, ensure_ascii=False)
+        )
+        return metadata.make_chunk_id(
+            self.filename, item_type, item.get("page_idx", 0), content
         )
 
-        return self.markdown_content[start_index:end_index]
-
-    def _find_image_context(self, img_path: str, context_length: int) -> str:
-        """Find context around image in markdown"""
-        # Look for image reference pattern in markdown
-        image_patterns = [
-            f"![]({img_path})",
-            f"![](images/{pathlib.Path(img_path).name})",
-            pathlib.Path(img_path).name,
-        ]
-
-        for pattern in image_patterns:
-            index = self.markdown_content.find(pattern)
-            if index != -1:
-                start = max(0, index - context_length)
-                end = min(
-                    len(self.markdown_content), index + len(pattern) + context_length
-                )
-                return self.markdown_content[start:end]
-
-        return ""
-
-    def _find_table_context(self, table_body: str, context_length: int) -> str:
-        """Find context around table in markdown"""
-        # Try to find table content or similar patterns
-        if not table_body:
-            return ""
-
-        # Look for parts of table content in markdown
-        table_text = table_body[:100]  # First 100 chars as search pattern
-        index = self.markdown_content.find(table_text)
-
-        if index != -1:
-            start = max(0, index - context_length)
-            end = min(
-                len(self.markdown_content), index + len(table_text) + context_length
+    def _is_new_chunk(self, collection_name: str, chunk_id: str) -> bool:
+        """Record a chunk as part of this run and report whether it must be written"""
+        self.seen_ids[collection_name].add(chunk_id)
+        return chunk_id not in self.existing_ids[collection_name]
+
+    def _delete_stale_chunks(self) -> Dict[str, int]:
+        """
+        Delete stored chunks of this document that the current run no longer
+        produces. Text chunks of pages that failed in this run are kept.
+        """
+        failed_prefixes = tuple(
+            f"{self.filename}:text:{page_idx}:" for page_idx in self.failed_pages
+        )
+        removed = {}
+        for name in ("textdb", "imgdb"):
+            stale = sorted(
+                id
+                for id in self.existing_ids[name] - self.seen_ids[name]
+                if not (failed_prefixes and id.startswith(failed_prefixes))
             )
-            return self.markdown_content[start:end]
-
-        return ""
+            if stale:
+                self.store.delete(name, stale)
+            removed[name] = len(stale)
+        return removed
 
     def _process_text_by_page(self, text_by_page):
-        """Process text content grouped by page"""
+        """Process text content grouped by page, as (item, span) pairs"""
         total_pages = len(text_by_page)
 
-        for page_idx, text_items in tqdm(
+        for page_idx, page_items in tqdm(
             text_by_page.items(),
             desc="Processing text pages",
             unit="pages",
             total=total_pages,
         ):
-            try:
-                # Combine all text from the same page
-                page_text = " ".join([item.get("text", "") for item in text_items])
-
-                # Split text into chunks
-                chunks = self.text_splitter.split_text(page_text)
-
-                # Process chunks with nested progress bar
-                chunk_desc = f"Page {page_idx} text chunks"
-                for i, chunk in enumerate(
-                    tqdm(chunks, desc=chunk_desc, unit="chunks", leave=False)
-                ):
-                    # Get context around this chunk
-                    context = self._get_context_around_text(chunk, 500)
-
-                    # Prepare metadata
-                    metadata_dict = {
-                        "page_idx": page_idx,
-                        "summary": context,  # Include context as summary
-                        "path": "",
-                        "type": "text",
-                        "filename": self.filename,
-                    }
-
-                    # Insert into textdb
-                    self.textdb.add(
-                        documents=[context],
-                        metadatas=[metadata_dict],
-                        ids=[f"text_{page_idx}_{i}"],
-                    )
+            self._process_text_page(page_idx, page_items)
+
+    def _process_text_page(self, page_idx, page_items):
+        """Split the text of one page into chunks and queue them for textdb"""
+        try:
+            # Combine all text from the same page
+            text_items, spans = zip(*page_items)
+            page_text = alignment.PageText(list(text_items), list(spans))
+
+            # Split text into chunks
+            chunks = self.text_splitter.split_text(page_text.text)
+
+            # Process chunks with nested progress bar
+            chunk_desc = f"Page {page_idx} text chunks"
+            occurrences = Counter()
+            for chunk in tqdm(chunks, desc=chunk_desc, unit="chunks", leave=False):
+                # Get context around this chunk
+                span = page_text.chunk_span(chunk)
+                context = self._get_context(span, 500, default=chunk)
+
+                # The id covers the chunk's own text only, so editing a
+                # neighbouring page does not change it; a text repeated on the
+                # page is told apart by its occurrence
+                occurrences[chunk] += 1
+                chunk_id = metadata.make_chunk_id(
+                    self.filename,
+                    "text",
+                    page_idx,
+                    chunk if occurrences[chunk] == 1 else f"{chunk}#{occurrences[chunk]}",
+                )
+                if not self._is_new_chunk("textdb", chunk_id):
+                    continue
+
+                # Prepare metadata; the context itself is the document, so
+                # only its location in the markdown is kept alongside it
+                metadata_dict = {
+                    "page_idx": page_idx,
+                    "path": "",
+                    "type": "text",
+                    "filename": self.filename,
+                }
+                if span is not None:
+                    metadata_dict["md_start"], metadata_dict["md_end"] = span
+
+                # Queue for bulk insert into textdb
+                self.text_writer.add(
+                    id=chunk_id,
+                    document=context,
+                    metadata=metadata_dict,
+                )
+
+            tqdm.write(f"[OK] Processed page {page_idx}: {len(chunks)} text chunks")
 
-                tqdm.write(f"[OK] Processed page {page_idx}: {len(chunks)} text chunks")
+        except Exception as e:
+            self.failed_pages.add(page_idx)
+            tqdm.write(f"[ERROR] Failed to process text on page {page_idx}: {e}")
+            logger.error(f"Error processing text on page {page_idx}: {e}")
 
-            except Exception as e:
-                tqdm.write(f"[ERROR] Failed to process text on page {page_idx}: {e}")
-                logger.error(f"Error processing text on page {page_idx}: {e}")
+    def _index_table(self, item) -> bool:
+        """
+        Index a table from its extracted HTML body: the whole table into imgdb,
+        each row into textdb (type table_row) and its cells into the table store.
+
+        Returns False when the table has no usable body.
+        """
+        table_body = item.get("table_body", "")
+        rows = tables.parse_table(table_body) if table_body else []
+        if not rows:
+            return False
 
-    def _process_image(self, item):
-        """Process image content"""
+        img_path = item.get("img_path", "")
+        page_idx = item.get("page_idx", 0)
+        caption = " ".join(item.get("table_caption", [])).strip()
+
+        table_id = self._chunk_id(item)
+        self.store.put_table(table_id, self.filename, page_idx, rows, img_path, caption)
+        self.table_ids.append(table_id)
+
+        if self._is_new_chunk("imgdb", table_id):
+            self.img_writer.add(
+                id=table_id,
+                document=tables.table_text(rows, caption),
+                metadata={
+                    "page_idx": page_idx,
+                    "path": img_path,
+                    "type": "table",
+                    "filename": self.filename,
+                },
+            )
+
+        for row_idx, text in enumerate(tables.row_texts(rows)):
+            document = tables.row_document(text, caption)
+            row_id = tables.row_chunk_id(table_id, self.filename, page_idx, row_idx, document)
+            self.table_rows += 1
+            if not self._is_new_chunk("textdb", row_id):
+                continue
+
+            self.text_writer.add(
+                id=row_id,
+                document=document,
+                metadata={
+                    "page_idx": page_idx,
+                    "path": img_path,
+                    "type": "table_row",
+                    "filename": self.filename,
+                    "table_id": table_id,
+                    "row_idx": row_idx,
+                },
+            )
+        return True
+
+    def _process_image(self, item, context: str = "") -> Optional[Dict]:
+        """Summarize image content and return its imgdb record"""
         img_path = item.get("img_path", "")
         page_idx = item.get("page_idx", 0)
 
         if not img_path:
-            return
+            return None
 
-            # Encode image to base64
         full_img_path = pathlib.Path(self.json_path).parent / img_path
 
-        # Get image context from markdown
-        context = self._find_image_context(img_path, 500)
-
         # Generate summary with context
         summary = self._generate_summary_with_context(full_img_path, "image", context)
 
@@ -165,23 +292,39 @@ class MarkdownEmbedding:
             "filename": self.filename,
         }
 
-        # Insert into imgdb
-        self.imgdb.add(
-            documents=[summary],
-            metadatas=[metadata_dict],
-            ids=[f"image_{page_idx}_{hash(img_path)}"],
-        )
-
         tqdm.write(
             f"[OK] Processed image: {pathlib.Path(img_path).name} (Page: {page_idx})"
         )
 
+        return {
+            "id": self._chunk_id(item),
+            "document": summary,
+            "metadata": metadata_dict,
+        }
+
     def _generate_summary_with_context(
         self,
         content_or_path: Union[str, pathlib.Path],
         content_type: str,
         context: str = "",
     ) -> str:
+        # Images are sent downscaled; the payload actually sent is what the
+        # summary depends on, so it is also what the cache key is built from
+        is_image = isinstance(content_or_path, pathlib.Path)
+        if is_image:
+            content, mime_type = self.image_preprocessor.prepare(content_or_path)
+        else:
+            content = content_or_path
+
+        # Reuse the stored summary when the same content was already summarized
+        # with the same context, model and prompt
+        cache_key = cache.SummaryCache.make_key(
+            content, context, self.base_model.model, PROMPT_VERSION
+        )
+        summary = self.summary_cache.get(cache_key)
+        if summary is not None:
+            return summary
+
         # invoke LangChain model API to pass in images
         message = {
             "role": "user",
@@ -190,8 +333,8 @@ class MarkdownEmbedding:
                     "Based on the following markdown context and the image content, generate a detailed summary of what this image shows and its relevance to the document:"
                 ),
                 (
-                    functions.form_image(content_or_path)
-                    if isinstance(content_or_path, pathlib.Path)
+                    functions.form_image_bytes(content, mime_type)
+                    if is_image
                     else functions.form_text(content_or_path)
                 ),
                 functions.form_text(f"Context from Markdown: {context}"),
@@ -201,66 +344,170 @@ class MarkdownEmbedding:
             ],
         }
 
+        if is_image:
+            self.image_preprocessor.record_sent(content)
         response = self.base_model.invoke([message])
-        return response.text()
+        summary = response.text()
+        self.summary_cache.put(cache_key, summary)
+        return summary
 
-    def _process_table(self, item):
-        """Process table content"""
+    def _process_table(self, item, context: str = "") -> Optional[Dict]:
+        """Summarize table content and return its imgdb record"""
         img_path = item.get("img_path", "")
         table_body = item.get("table_body", "")
         page_idx = item.get("page_idx", 0)
 
-        try:
-            if img_path:
-                # Process as image if img_path is not empty
-                context = (
-                    self._find_table_context(table_body, 500)
-                    if table_body
-                    else self._find_image_context(img_path, 500)
-                )
-                full_img_path = pathlib.Path(self.json_path).parent / img_path
-                summary = self._generate_summary_with_context(
-                    full_img_path,
-                    "table",
-                    context,
-                )
-                path = img_path
-                tqdm.write(
-                    f"[OK] Processed table image: {pathlib.Path(img_path).name} (Page: {page_idx})"
-                )
-            else:
-                # Process table body text
-                context = self._find_table_context(table_body, 500)
-                summary = self._generate_summary_with_context(
-                    table_body, "table", context
-                )
-                path = ""
-                tqdm.write(f"[OK] Processed table text (Page: {page_idx})")
+        if img_path:
+            # Process as image if img_path is not empty
+            full_img_path = pathlib.Path(self.json_path).parent / img_path
+            summary = self._generate_summary_with_context(
+                full_img_path,
+                "table",
+                context,
+            )
+            path = img_path
+            tqdm.write(
+                f"[OK] Processed table image: {pathlib.Path(img_path).name} (Page: {page_idx})"
+            )
+        else:
+            # Process table body text
+            summary = self._generate_summary_with_context(
+                table_body, "table", context
+            )
+            path = ""
+            tqdm.write(f"[OK] Processed table text (Page: {page_idx})")
+
+        # Prepare metadata
+        metadata_dict = {
+            "page_idx": page_idx,
+            "summary": summary,
+            "path": path,
+            "type": "table",
+            "filename": self.filename,
+        }
 
-            # Prepare metadata
-            metadata_dict = {
-                "page_idx": page_idx,
+        # Stored in imgdb (as requested)
+        return {
+            "id": self._chunk_id(item),
+            "document": summary,
+            "metadata": metadata_dict,
+        }
+
+    def _duplicate_record(self, item, summary: str, context: str, duplicate_of: str) -> Dict:
+        """imgdb record of a repeated image, reusing the summary of its first occurrence"""
+        return {
+            "id": self._chunk_id(item),
+            # The summary describes the first occurrence; this page's context
+            # keeps the repeat retrievable where it appears
+            "document": f"{summary}\n\nContext from Markdown: {context}" if context else summary,
+            "metadata": {
+                "page_idx": item.get("page_idx", 0),
                 "summary": summary,
-                "path": path,
-                "type": "table",
+                "path": item.get("img_path", ""),
+                "type": "image",
                 "filename": self.filename,
-            }
+                "duplicate_of": duplicate_of,
+            },
+        }
 
-            # Insert into imgdb (as requested)
-            self.imgdb.add(
-                documents=[summary],
-                metadatas=[metadata_dict],
-                ids=[f"table_{page_idx}_{hash(str(item))}"],
+    def _add_duplicate(self, item, span, duplicate_of: str) -> bool:
+        """
+        Write (or hold until its summary is ready) the entry of a repeated image.
+
+        Returns False when the first occurrence is not summarized in this run
+        (it was stored by an earlier run), so the repeat must be summarized itself.
+        """
+        if duplicate_of in self.image_summaries:
+            summary = self.image_summaries[duplicate_of]
+            context = self._get_context(span, 500)
+            self.img_writer.add(**self._duplicate_record(item, summary, context, duplicate_of))
+        elif duplicate_of in self.submitted_images:
+            self.pending_duplicates[duplicate_of].append((item, self._get_context(span, 500)))
+        else:
+            return False
+        return True
+
+    def _submit_non_text_item(self, pool, item, span):
+        """Submit an image or table for summarization, or return None if it is already stored"""
+        handlers = {"image": self._process_image, "table": self._process_table}
+        item_type = item.get("type")
+        assert item_type in handlers, f"Unsupported item type: {item_type}"
+
+        img_path = item.get("img_path", "")
+        if item_type == "image" and img_path:
+            # Classified in submission order, so the first occurrence of a
+            # repeated image is the one that gets summarized
+            skipped = self.image_classifier.classify(
+                pathlib.Path(self.json_path).parent / img_path, img_path
             )
+            if skipped is not None and (
+                skipped["duplicate_of"] is None
+                or not self._is_new_chunk("imgdb", self._chunk_id(item))
+                or self._add_duplicate(item, span, skipped["duplicate_of"])
+            ):
+                self.skipped_images.append(
+                    {"img_path": img_path, "page_idx": item.get("page_idx", 0), **skipped}
+                )
+                return None
+
+        # Only tables MinerU could not extract as text go to the vision model
+        if item_type == "table" and self._index_table(item):
+            return None
 
+        if not self._is_new_chunk("imgdb", self._chunk_id(item)):
+            return None
+
+        if item_type == "image":
+            self.submitted_images.add(img_path)
+
+        # The markdown context is taken now, while its page is still loaded
+        return pool.submit(handlers[item_type], item, self._get_context(span, 500))
+
+    def _write_non_text_result(self, future, item):
+        """Queue a finished image/table summary for imgdb, logging failures"""
+        page_idx = item.get("page_idx", 0)
+        # Repeats of this image are written (or fail) along with it
+        duplicates = self.pending_duplicates.pop(item.get("img_path", ""), [])
+        try:
+            record = future.result()
         except Exception as e:
-            tqdm.write(f"[ERROR] Failed to process table (Page: {page_idx}): {e}")
-            print(f"Error processing table on page {page_idx}: {e}")
+            self.failed_items += 1 + len(duplicates)
+            tqdm.write(
+                f"[ERROR] Failed to process {item.get('type')} (Page: {page_idx}): {e}"
+            )
+            logger.error(f"Error processing {item.get('type')} on page {page_idx}: {e}")
+            return
 
-    def run(self):
-        """Process all content from JSON and embed into appropriate databases"""
-        print("Start processing document...")
+        if record:
+            self.img_writer.add(**record)
+            if item.get("type") == "image":
+                img_path = record["metadata"]["path"]
+                self.image_summaries[img_path] = record["document"]
+                for duplicate, context in duplicates:
+                    self.img_writer.add(
+                        **self._duplicate_record(duplicate, record["document"], context, img_path)
+                    )
+
+    def _process_non_text_items(self, non_text_items):
+        """Summarize (item, span) images and tables with a bounded number of in-flight vision requests"""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {}
+            for item, span in non_text_items:
+                future = self._submit_non_text_item(pool, item, span)
+                if future is not None:
+                    futures[future] = item
+
+            # Write each record to imgdb as soon as its summary is ready
+            for future in tqdm(
+                as_completed(futures),
+                desc="Processing images/tables",
+                unit="items",
+                total=len(futures),
+            ):
+                self._write_non_text_result(future, futures[future])
 
+    def _process_document(self):
+        """Process the fully loaded content list: all text pages, then images and tables"""
         # Count different types of content for progress tracking
         type_counts = defaultdict(int)
         for item in self.json_data:
@@ -271,14 +518,17 @@ class MarkdownEmbedding:
             f"Statistics: text: {type_counts['text']}, images: {type_counts['image']}, tables: {type_counts['table']}"
         )
 
+        # Locate every item in the markdown in a single forward pass
+        spans = self.markdown_index.align(self.json_data)
+
         # Group text content by page_idx for later processing
         text_by_page = defaultdict(list)
 
         # NOTE - Collect text items by page
-        text_items = [item for item in self.json_data if item.get("type") == "text"]
-        for item in text_items:
-            page_idx = item.get("page_idx", 0)
-            text_by_page[page_idx].append(item)
+        for item, span in zip(self.json_data, spans):
+            if item.get("type") == "text":
+                page_idx = item.get("page_idx", 0)
+                text_by_page[page_idx].append((item, span))
 
         # Process text content grouped by page with progress bar
         if text_by_page:
@@ -287,23 +537,190 @@ class MarkdownEmbedding:
 
         # NOTE - Process images and tables with progress bar
         non_text_items = [
-            item for item in self.json_data if item.get("type") in ["image", "table"]
+            (item, span)
+            for item, span in zip(self.json_data, spans)
+            if item.get("type") in ["image", "table"]
         ]
 
         if non_text_items:
-            print("Processing images and tables...")
-            for item in tqdm(
-                non_text_items, desc="Processing images/tables", unit="items"
-            ):
-                item_type = item.get("type")
-                assert item_type in [
-                    "image",
-                    "table",
-                ], f"Unsupported item type: {item_type}"
+            print(
+                f"Processing images and tables ({self.concurrency} concurrent requests)..."
+            )
+            self._process_non_text_items(non_text_items)
+
+    def _process_pages(self):
+        """
+        Stream the content list through the pipeline one page at a time.
+
+        Each page is aligned, its text is chunked and its images and tables are
+        submitted for summarization before the next page is read. At most
+        2 * concurrency summaries are pending, and markdown behind the current
+        page is released, so memory does not grow with the document.
+        """
+        type_counts = defaultdict(int)
+        max_pending = self.concurrency * 2
+
+        print(f"Streaming pages ({self.concurrency} concurrent requests)...")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {}
+            pages = iter_pages(iter_json_array(self.json_path))
+            for page_idx, items in tqdm(pages, desc="Processing pages", unit="pages"):
+                spans = self.markdown_index.align(items)
+
+                text_items = []
+                for item, span in zip(items, spans):
+                    item_type = item.get("type", "unknown")
+                    type_counts[item_type] += 1
+                    if item_type == "text":
+                        text_items.append((item, span))
+                        continue
+                    if item_type not in ("image", "table"):
+                        continue
+
+                    # Wait for a summary to finish before queueing more
+                    while len(futures) >= max_pending:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._write_non_text_result(future, futures.pop(future))
+
+                    future = self._submit_non_text_item(pool, item, span)
+                    if future is not None:
+                        futures[future] = item
+
+                if text_items:
+                    self._process_text_page(page_idx, text_items)
+
+                # Contexts of later pages start at most 500 chars before the cursor
+                self.markdown_index.markdown.release(self.markdown_index.cursor - 500)
+
+            for future in as_completed(futures):
+                self._write_non_text_result(future, futures[future])
+
+        print(
+            f"Statistics: text: {type_counts['text']}, images: {type_counts['image']}, tables: {type_counts['table']}"
+        )
 
-                if item_type == "image":
-                    self._process_image(item)
-                elif item_type == "table":
-                    self._process_table(item)
+    def run(self, incremental: bool = False):
+        """
+        Process all content from JSON and embed into appropriate databases.
 
+        With incremental=True, chunks already stored for this document are left
+        untouched, only new chunks are processed and chunks that no longer
+        exist in the document are deleted.
+
+        If a previous run of this document was interrupted, its journal is
+        replayed and only the chunks it had not yet written are processed.
+
+        If any text page, image or table failed, everything else is still
+        written but the document is not registered and its journal is kept,
+        so the next run resumes with the failed items. RuntimeError is raised
+        to report the incomplete document.
+        """
+        print("Start processing document...")
+
+        if incremental:
+            self.existing_ids = self.store.existing_ids(self.filename)
+
+        # Resume from the checkpoint journal of an interrupted run
+        journal = IngestJournal(self.filename)
+        resumed = journal.exists()
+        if resumed:
+            completed = journal.completed_ids()
+            for name in ("textdb", "imgdb"):
+                self.existing_ids[name] |= completed.get(name, set())
+            print(
+                f"[RESUME] Journal found: {len(completed['textdb'])} text and "
+                f"{len(completed['imgdb'])} image/table chunks already written"
+            )
+
+        if self.streaming:
+            self._process_pages()
+        else:
+            self._process_document()
+
+        if self.markdown_index.misses:
+            print(f"[WARN] {self.markdown_index.misses} items not found in markdown")
+
+        # Drop tables that are no longer part of the document
+        self.store.retain_tables(self.filename, self.table_ids)
+        if self.table_ids:
+            print(
+                f"[OK] Tables: {len(self.table_ids)} indexed from their extracted body "
+                f"({self.table_rows} rows)"
+            )
+
+        self._flush_writers()
+
+        if incremental or resumed:
+            removed = self._delete_stale_chunks()
+            for name in ("textdb", "imgdb"):
+                unchanged = len(self.existing_ids[name] & self.seen_ids[name])
+                added = len(self.seen_ids[name] - self.existing_ids[name])
+                print(
+                    f"[OK] {name} {'incremental' if incremental else 'resume'}: {unchanged} unchanged, "
+                    f"{added} added, {removed[name]} removed"
+                )
+
+        if self.failed_pages or self.failed_items:
+            raise RuntimeError(
+                f"{len(self.failed_pages)} text pages and {self.failed_items} images/tables "
+                f"of {self.filename} failed; the document was not registered and the next "
+                "run resumes from its journal"
+            )
+
+        self._register_document()
         logger.info("[OK] Document processing complete!")
+
+    def _register_document(self):
+        """Record the processed document in the document registry"""
+        self.store.register(
+            self.filename,
+            checksums={
+                "content_list": DocumentRegistry.file_checksum(self.json_path),
+                "markdown": DocumentRegistry.file_checksum(self.markdown_path),
+            },
+            models={
+                "vision": self.base_model.model,
+                "embedding": get_database.EMBEDDING_FUNCTION_NAME,
+                "prompt_version": PROMPT_VERSION,
+            },
+            skipped_images=self.skipped_images,
+        )
+
+    def _flush_writers(self):
+        """Flush pending bulk writes and report write throughput"""
+        for name, stats in self.store.flush().items():
+            print(
+                f"[OK] {name}: wrote {stats['chunks']} chunks in {stats['flushes']} batches "
+                f"({stats['chunks_per_sec']:.1f} chunks/sec)"
+            )
+
+        stats = self.summary_cache.stats()
+        print(
+            f"[OK] Summary cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB)"
+        )
+
+        if self.skipped_images:
+            reasons = defaultdict(int)
+            for image in self.skipped_images:
+                reasons[image["reason"]] += 1
+            print(
+                f"[OK] Skipped {len(self.skipped_images)} images: "
+                + ", ".join(f"{count} {reason}" for reason, count in sorted(reasons.items()))
+            )
+
+        stats = self.image_preprocessor.stats()
+        if stats["images"]:
+            print(
+                f"[OK] Images: {stats['images']} prepared, {stats['original_bytes'] / 1024:.0f} KB -> "
+                f"{stats['prepared_bytes'] / 1024:.0f} KB; {stats['sent_images']} sent to the vision "
+                f"model ({stats['sent_bytes'] / 1024:.0f} KB)"
+            )
+
+        if isinstance(self.store, ChromaStore):
+            stats = get_database.embedding_cache.stats()
+            print(
+                f"[OK] Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['entries']} entries)"
+            )
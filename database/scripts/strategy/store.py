@@ -0,0 +1,297 @@
+import sys, pathlib
+import time
+import threading
+from queue import Queue
+from typing import Callable, Dict, List, Optional, Set
+
+sys.path.append(pathlib.Path(__file__).parents[3].as_posix())
+
+from utils import get_database
+from utils.registry import COLLECTIONS
+from database.scripts.strategy.journal import IngestJournal
+
+
+class ChromaStore:
+    """
+    Destination of ingested chunks in the local Chroma store.
+
+    Owns one BatchWriter per collection; this is the only object that writes
+    to Chroma and the table store during ingestion. Every written batch is added to the lexical
+    index and checkpointed in the IngestJournal of the documents it belongs to.
+    """
+
+    def __init__(self, batch_size: int = get_database.INGEST_BATCH_SIZE):
+        self.collections = {name: get_database.get_database(name) for name in COLLECTIONS}
+        self.writers = {
+            name: get_database.BatchWriter(
+                collection,
+                batch_size,
+                on_flush=lambda ids, documents, metadatas, name=name: self._checkpoint(
+                    name, ids, documents, metadatas
+                ),
+            )
+            for name, collection in self.collections.items()
+        }
+
+    @staticmethod
+    def _checkpoint(
+        name: str, ids: List[str], documents: List[str], metadatas: List[Dict]
+    ) -> None:
+        """Index a written batch and journal its ids per document (a batch may mix documents)"""
+        get_database.get_lexical_index().add(name, ids, documents, metadatas)
+        get_database.get_document_registry().bump_version(name)
+
+        by_document: Dict[str, List[str]] = {}
+        for id, metadata in zip(ids, metadatas):
+            by_document.setdefault(metadata.get("filename", ""), []).append(id)
+        for filename, document_ids in by_document.items():
+            IngestJournal(filename).record(name, document_ids)
+
+    def existing_ids(self, filename: str) -> Dict[str, Set[str]]:
+        """Ids currently stored for a document, per collection"""
+        return {
+            name: set(collection.get(where={"filename": filename}, include=[])["ids"])
+            for name, collection in self.collections.items()
+        }
+
+    def delete(self, name: str, ids: List[str]) -> None:
+        batch_size = self.writers[name].batch_size
+        for i in range(0, len(ids), batch_size):
+            self.collections[name].delete(ids=ids[i : i + batch_size])
+        get_database.get_lexical_index().remove(name, ids)
+        get_database.get_document_registry().bump_version(name)
+
+    def put_table(
+        self,
+        table_id: str,
+        filename: str,
+        page_idx: int,
+        rows: List[List[str]],
+        img_path: str = "",
+        caption: str = "",
+    ) -> None:
+        get_database.get_table_store().put(table_id, filename, page_idx, rows, img_path, caption)
+
+    def retain_tables(self, filename: str, table_ids: List[str]) -> None:
+        """Drop the stored tables of a document that are not in table_ids"""
+        get_database.get_table_store().retain(filename, table_ids)
+
+    def register(
+        self,
+        filename: str,
+        checksums: Dict,
+        models: Dict,
+        skipped_images: Optional[List[Dict]] = None,
+    ) -> None:
+        """Flush pending writes, record the document in the registry and close its journal"""
+        self.flush()
+        get_database.get_document_registry().record(
+            filename,
+            chunk_counts=get_database.count_document_chunks(filename),
+            checksums=checksums,
+            models=models,
+            skipped_images=skipped_images,
+        )
+        IngestJournal(filename).close()
+
+    def flush(self) -> Dict[str, Dict]:
+        """Write all buffered chunks and return write stats per collection"""
+        for writer in self.writers.values():
+            writer.flush()
+        return {name: writer.stats() for name, writer in self.writers.items()}
+
+
+class QueueWriter:
+    """BatchWriter stand-in that ships batches to a StoreWriter over a queue."""
+
+    def __init__(self, queue: Queue, name: str, batch_size: int):
+        self.queue = queue
+        self.name = name
+        self.batch_size = batch_size
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+
+        self.written = 0
+        self.flushes = 0
+        self.started_at = time.perf_counter()
+
+    def add(self, id: str, document: str, metadata: Dict) -> None:
+        self.ids.append(id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+
+        if len(self.ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        if not self.ids:
+            return 0
+
+        sent = len(self.ids)
+        self.queue.put(("add", self.name, self.ids, self.documents, self.metadatas))
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.written += sent
+        self.flushes += 1
+        return sent
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "chunks": self.written,
+            "flushes": self.flushes,
+            "seconds": elapsed,
+            "chunks_per_sec": self.written / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class QueueStore:
+    """
+    Store used inside ingestion worker processes.
+
+    Workers never open Chroma or the table store: writes, deletions and
+    registrations are sent to the StoreWriter in the parent process, and the ids already stored for the
+    document are looked up by the parent before the worker starts.
+    """
+
+    def __init__(
+        self,
+        queue: Queue,
+        existing_ids: Optional[Dict[str, Set[str]]] = None,
+        batch_size: int = get_database.INGEST_BATCH_SIZE,
+    ):
+        self.queue = queue
+        self._existing_ids = existing_ids or {name: set() for name in COLLECTIONS}
+        self.writers = {name: QueueWriter(queue, name, batch_size) for name in COLLECTIONS}
+
+    def existing_ids(self, filename: str) -> Dict[str, Set[str]]:
+        return self._existing_ids
+
+    def delete(self, name: str, ids: List[str]) -> None:
+        self.queue.put(("delete", name, ids))
+
+    def put_table(
+        self,
+        table_id: str,
+        filename: str,
+        page_idx: int,
+        rows: List[List[str]],
+        img_path: str = "",
+        caption: str = "",
+    ) -> None:
+        self.queue.put(("put_table", table_id, filename, page_idx, rows, img_path, caption))
+
+    def retain_tables(self, filename: str, table_ids: List[str]) -> None:
+        self.queue.put(("retain_tables", filename, table_ids))
+
+    def register(
+        self,
+        filename: str,
+        checksums: Dict,
+        models: Dict,
+        skipped_images: Optional[List[Dict]] = None,
+    ) -> None:
+        self.flush()
+        self.queue.put(("register", filename, checksums, models, skipped_images))
+
+    def flush(self) -> Dict[str, Dict]:
+        for writer in self.writers.values():
+            writer.flush()
+        return {name: writer.stats() for name, writer in self.writers.items()}
+
+
+class StoreWriter(threading.Thread):
+    """
+    Single writer thread applying QueueStore messages to a ChromaStore.
+
+    Several worker processes feed one queue, so the persistent Chroma store is
+    only ever written from this thread. A failed batch write fails every
+    document that had chunks in it: such a document is not registered, so its
+    journal stays open and the next run resumes it, and it is listed in
+    `failed` with its errors.
+    """
+
+    STOP = ("stop",)
+
+    def __init__(self, queue: Queue, store: Optional[ChromaStore] = None):
+        super().__init__(name="store-writer", daemon=True)
+        self.queue = queue
+        self.store = store or ChromaStore()
+        self.errors: List[str] = []
+
+        # Documents with chunks buffered in each collection's writer, and
+        # documents whose writes failed, with their errors
+        self.pending: Dict[str, Set[str]] = {name: set() for name in self.store.writers}
+        self.failed: Dict[str, List[str]] = {}
+
+    def _fail(self, filenames: Set[str], error: str) -> None:
+        self.errors.append(error)
+        for filename in filenames:
+            self.failed.setdefault(filename, []).append(error)
+        print(f"[ERROR] Store writer failed on {error} ({', '.join(sorted(filenames))})")
+
+    def _write(self, name: str, write: Callable[[], object]) -> None:
+        """Run a write that may flush a collection, failing the documents of a failed batch"""
+        writer = self.store.writers[name]
+        try:
+            write()
+        except Exception as e:
+            # A failed flush has already dropped its buffer
+            self._fail(self.pending[name], f"add to {name}: {e}")
+            self.pending[name].clear()
+            return
+        if not writer.ids:
+            self.pending[name].clear()
+
+    def _add(self, name: str, ids: List[str], documents: List[str], metadatas: List[Dict]) -> None:
+        writer = self.store.writers[name]
+        for id, document, metadata in zip(ids, documents, metadatas):
+            self.pending[name].add(metadata.get("filename", ""))
+            self._write(name, lambda: writer.add(id, document, metadata))
+
+    def _register(self, filename: str, *args) -> None:
+        """Register a document once all its chunks are written, unless any write failed"""
+        for name, writer in self.store.writers.items():
+            self._write(name, writer.flush)
+
+        if filename in self.failed:
+            print(f"[ERROR] {filename} not registered: its writes failed; the journal is kept for resuming")
+            return
+        try:
+            self.store.register(filename, *args)
+        except Exception as e:
+            self._fail({filename}, f"register: {e}")
+
+    def run(self) -> None:
+        while True:
+            message = self.queue.get()
+            if message == self.STOP:
+                break
+
+            kind, *args = message
+            if kind == "add":
+                self._add(*args)
+            elif kind == "register":
+                self._register(*args)
+            elif kind in ("put_table", "retain_tables"):
+                filename = args[1] if kind == "put_table" else args[0]
+                try:
+                    getattr(self.store, kind)(*args)
+                except Exception as e:
+                    self._fail({filename}, f"{kind}: {e}")
+            elif kind == "delete":
+                try:
+                    self.store.delete(*args)
+                except Exception as e:
+                    self.errors.append(f"delete: {e}")
+                    print(f"[ERROR] Store writer failed on delete: {e}")
+
+        for name, writer in self.store.writers.items():
+            self._write(name, writer.flush)
+
+    def stop(self) -> Dict[str, Dict]:
+        """Drain the queue, flush and return write stats per collection"""
+        self.queue.put(self.STOP)
+        self.join()
+        return {name: writer.stats() for name, writer in self.store.writers.items()}
@@ -0,0 +1,133 @@
+import json
+import pathlib
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+# Characters read from disk at a time
+BLOCK_SIZE = 1 << 16
+
+
+def iter_json_array(path: Union[str, pathlib.Path], block_size: int = BLOCK_SIZE) -> Iterator[Dict]:
+    """
+    Yield the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded (plus one read block) is held in memory,
+    unlike `json.load`, which materializes the whole content list.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(block_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The element continues past the current block
+                if eof:
+                    raise
+                block = f.read(block_size)
+                eof = not block
+                buffer += block
+                continue
+
+            yield item
+            buffer = buffer[end:]
+
+
+def iter_pages(items: Iterable[Dict]) -> Iterator[Tuple[int, List[Dict]]]:
+    """Group consecutive content items by page_idx, yielding one page at a time"""
+    page_idx, page = None, []
+    for item in items:
+        item_page = item.get("page_idx", 0)
+        if page and item_page != page_idx:
+            yield page_idx, page
+            page = []
+        page_idx = item_page
+        page.append(item)
+
+    if page:
+        yield page_idx, page
+
+
+class StreamingMarkdown:
+    """
+    Forward-only window over a markdown file.
+
+    Supports the subset of `str` used by MarkdownIndex (`find`, slicing and
+    `len`) with absolute character offsets, reading ahead only as far as a
+    search needs and dropping text once the caller releases it, so memory is
+    bounded by a page plus the look-ahead rather than by the document.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        lookahead: int = 1 << 20,
+        block_size: int = BLOCK_SIZE,
+    ):
+        self.file = open(path, "r", encoding="utf-8")
+        self.lookahead = lookahead
+        self.block_size = block_size
+
+        self.buffer = ""
+        self.base = 0  # absolute offset of buffer[0]
+        self.eof = False
+
+    def _read(self) -> bool:
+        """Append one block to the window; False once the file is exhausted"""
+        if self.eof:
+            return False
+        block = self.file.read(self.block_size)
+        if not block:
+            self.eof = True
+            self.file.close()
+            return False
+        self.buffer += block
+        return True
+
+    def find(self, sub: str, start: int = None) -> int:
+        """
+        Absolute offset of `sub` at or after `start`, reading at most `lookahead`
+        characters ahead. Without `start`, only the current window is searched.
+        """
+        if start is None:
+            index = self.buffer.find(sub)
+            return self.base + index if index != -1 else -1
+
+        search_from = max(0, start - self.base)
+        while True:
+            index = self.buffer.find(sub, search_from)
+            if index != -1:
+                return self.base + index
+
+            if self.base + len(self.buffer) - start > self.lookahead or not self._read():
+                return -1
+            # Only the newly read tail (plus an overlap) needs searching again
+            search_from = max(search_from, len(self.buffer) - self.block_size - len(sub))
+
+    def __len__(self) -> int:
+        return self.base + len(self.buffer)
+
+    def __getitem__(self, key: slice) -> str:
+        # Read ahead so slices past the window end see the text a `str` would
+        while key.stop is not None and key.stop > len(self) and self._read():
+            pass
+        start = max(0, (key.start or 0) - self.base)
+        stop = None if key.stop is None else max(0, key.stop - self.base)
+        return self.buffer[start:stop]
+
+    def release(self, offset: int) -> None:
+        """Drop text before an absolute offset that will no longer be sliced"""
+        if offset > self.base:
+            self.buffer = self.buffer[offset - self.base :]
+            self.base = offset
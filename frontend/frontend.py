@@ -1,5 +1,10 @@
 import sys, pathlib
+import time
+import contextlib
+import uuid
+import json
 import streamlit as st
+import streamlit.components.v1 as components
 import re
 
 sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
@@ -10,12 +15,21 @@ from utils.get_model import (
     DEFAULT_PARAMETERS, 
     validate_parameters, 
     get_session_history,
-    add_referenced_context_to_history
+    get_session_backend,
+    delete_session_history,
+    add_referenced_context_to_history,
+    compact_session_history
 )
 from utils.functions import encode_image
+from utils.settings import STREAM_FLUSH_INTERVAL
+from utils.think import ThinkStreamParser
+from utils.scheduler import GenerationRejected, get_generation_scheduler
 from backend.backend import (
     get_knowledge, 
     form_context_info, 
+    get_retrieval_cache_stats,
+    get_cached_answer,
+    cache_answer,
     get_available_files,
     build_prompt_with_citations,
     extract_citations_from_response
@@ -23,19 +37,67 @@ from backend.backend import (
 from loguru import logger
 PROJECT_ROOT = pathlib.Path(__file__).parents[1]
 
+# Browser cookie holding the client id that chats are stored under. Anyone
+# holding the id can read the chats, so it is never put in the page URL.
+CLIENT_COOKIE = "rag_client"
+CLIENT_COOKIE_MAX_AGE = 365 * 24 * 3600
+
+
+def remember_client(client_id: str):
+    """Store the client id in a cookie of the app's page, so a reload finds this browser's chats"""
+    cookie = f"{CLIENT_COOKIE}={client_id}; path=/; max-age={CLIENT_COOKIE_MAX_AGE}; SameSite=Strict"
+    components.html(
+        f"<script>window.parent.document.cookie = {json.dumps(cookie)};</script>",
+        height=0,
+    )
+
+
+def start_new_client():
+    """Leave this browser's chats behind and continue under a fresh client id"""
+    switch_away(st.session_state.current_chat_index)
+    st.session_state.client_id = uuid.uuid4().hex
+    st.session_state.remember_client = True
+    st.session_state.chat_sessions = {}
+    create_session()
+    st.session_state.model = get_prompted_model_with_params(**st.session_state.current_parameters)
+
+
+def save_chat(index: int):
+    """Write a chat (and its messages, if loaded) to the session store"""
+    get_session_backend().put_chat(
+        st.session_state.client_id, index, st.session_state.chat_sessions[index]
+    )
+
+
+def load_chats():
+    """Restore this client's chats from the session store; only the last one's messages are loaded"""
+    for index, chat in enumerate(get_session_backend().list_chats(st.session_state.client_id), 1):
+        st.session_state.chat_sessions[index] = chat
+    if st.session_state.chat_sessions:
+        st.session_state.current_chat_index = max(st.session_state.chat_sessions)
+        current = st.session_state.chat_sessions[st.session_state.current_chat_index]
+        current["messages"] = get_session_backend().get_chat_messages(current["session_id"])
+        st.session_state.messages = current["messages"]
+        st.session_state.current_parameters = current.get("parameters", DEFAULT_PARAMETERS).copy()
+        st.session_state.current_selected_file = current.get("selected_file", st.session_state.current_selected_file)
+
+
 def create_session():
-    st.session_state.current_chat_index += 1
-    session_id = f"session_{st.session_state.current_chat_index}"
+    if st.session_state.chat_sessions:
+        # Unload the messages of the chat being left
+        switch_away(st.session_state.current_chat_index)
+    st.session_state.current_chat_index = max(st.session_state.chat_sessions, default=0) + 1
     chat = {
         "name": f"default chat session {st.session_state.current_chat_index}",
         "messages": [],
-        "session_id": session_id,
+        "session_id": uuid.uuid4().hex,
         "parameters": DEFAULT_PARAMETERS.copy(),
         "selected_file": st.session_state.get('available_files', ['all'])[0] if st.session_state.get('available_files') else 'all'
     }
     st.session_state.chat_sessions[st.session_state.current_chat_index] = chat
     st.session_state.messages = chat["messages"]
     st.session_state.current_parameters = chat["parameters"].copy()
+    save_chat(st.session_state.current_chat_index)
 
 
 def construct_chatting_session():
@@ -86,26 +148,40 @@ def load_components():
                         args=(index,),
                     )
         st.button("create new chat", on_click=create_session, type="primary")
+        st.button(
+            "start fresh",
+            on_click=start_new_client,
+            help="Continue under a new client id; the current chats are no longer shown in this browser",
+        )
         
         render_file_selection()
         render_parameter_controls()
 
 
+def switch_away(current_index: int):
+    """Save the chat being left and drop its messages from memory"""
+    current_session = st.session_state.chat_sessions[current_index]
+    current_session["messages"] = st.session_state.messages
+    current_session["parameters"] = st.session_state.current_parameters.copy()
+    current_session["selected_file"] = st.session_state.current_selected_file
+    save_chat(current_index)
+    current_session.pop("messages")
+
+
 def switch_tab(switch_to: int):
-    current_index = st.session_state.current_chat_index
-    st.session_state.chat_sessions[current_index]["messages"] = st.session_state.messages
-    
-    st.session_state.chat_sessions[current_index]["parameters"] = st.session_state.current_parameters.copy()
-    st.session_state.chat_sessions[current_index]["selected_file"] = st.session_state.current_selected_file
+    switch_away(st.session_state.current_chat_index)
 
     st.session_state.current_chat_index = switch_to
-    st.session_state.messages = st.session_state.chat_sessions[switch_to]["messages"]
-    
     target_session = st.session_state.chat_sessions[switch_to]
+    if "session_id" not in target_session:
+        target_session["session_id"] = uuid.uuid4().hex
+    # Messages of other chats live in the session store until switched to
+    if "messages" not in target_session:
+        target_session["messages"] = get_session_backend().get_chat_messages(target_session["session_id"])
+    st.session_state.messages = target_session["messages"]
+    
     if "parameters" not in target_session:
         target_session["parameters"] = DEFAULT_PARAMETERS.copy()
-    if "session_id" not in target_session:
-        target_session["session_id"] = f"session_{switch_to}"
     
     st.session_state.current_parameters = target_session["parameters"].copy()
     
@@ -124,12 +200,16 @@ def rename_session(renamed_session_index: int):
         value=st.session_state.chat_sessions[renamed_session_index]["name"],
         key=f"new_chat_{renamed_session_index}",
     )
-    st.session_state.chat_sessions[renamed_session_index]["name"] = new_name
+    if new_name != st.session_state.chat_sessions[renamed_session_index]["name"]:
+        st.session_state.chat_sessions[renamed_session_index]["name"] = new_name
+        save_chat(renamed_session_index)
 
 
 def delete_session(deleted_session_index: int):
+    deleted_session = st.session_state.chat_sessions[deleted_session_index]
+    delete_session_history(deleted_session["session_id"])
     if len(st.session_state.chat_sessions) == 1:
-        st.session_state.pop(deleted_session_index)
+        st.session_state.chat_sessions.pop(deleted_session_index)
         create_session()
     else:
         next_session = next(
@@ -138,7 +218,16 @@ def delete_session(deleted_session_index: int):
                 st.session_state.chat_sessions.keys(),
             )
         )
-        switch_tab(next_session)
+        if deleted_session_index == st.session_state.current_chat_index:
+            # Nothing to save for the chat being deleted
+            st.session_state.current_chat_index = next_session
+            target_session = st.session_state.chat_sessions[next_session]
+            if "messages" not in target_session:
+                target_session["messages"] = get_session_backend().get_chat_messages(target_session["session_id"])
+            st.session_state.messages = target_session["messages"]
+            st.session_state.current_parameters = target_session.get("parameters", DEFAULT_PARAMETERS).copy()
+            st.session_state.current_selected_file = target_session.get("selected_file", st.session_state.current_selected_file)
+            update_model_with_current_parameters()
         st.session_state.chat_sessions.pop(deleted_session_index)
 
 
@@ -420,6 +509,29 @@ def clean_response_citations(response: str) -> str:
     return response.strip()
 
 
+def render_stream(parser, thinking_placeholder, answer_placeholder, view, cursor="|"):
+    """
+    Draw the reasoning and answer streamed so far.
+
+    The thinking expander is created once, on the first reasoning text, and
+    only parts that changed since the last call are sent to the browser.
+    `view` holds the expander's text element and the lengths last drawn.
+    """
+    reasoning = parser.reasoning
+    if len(reasoning) != view["reasoning"]:
+        if view["thinking_text"] is None:
+            with thinking_placeholder.container():
+                with st.expander("🧠 Model Thinking Process", expanded=False):
+                    view["thinking_text"] = st.empty()
+        view["thinking_text"].text(reasoning.strip())
+        view["reasoning"] = len(reasoning)
+
+    answer = parser.answer
+    if not parser.thinking and (len(answer) != view["answer"] or not cursor):
+        answer_placeholder.markdown(answer + cursor)
+        view["answer"] = len(answer)
+
+
 def display_citations_in_response(citations_list):
     """Display extracted citations used in the response"""
     if not citations_list:
@@ -477,13 +589,28 @@ if "has_init" not in st.session_state:
     st.session_state.current_selected_file = st.session_state.available_files[0] if st.session_state.available_files else 'all'
     
     st.session_state.has_init = True
-    st.session_state.model = get_prompted_model_with_params(**st.session_state.current_parameters)
     logger.info("Streamlit session initialized with default parameters.")
     logger.info(f"Available files: {st.session_state.available_files}")
     
+    # Chats are kept per client id, carried in a browser cookie so a reload or
+    # a restarted container finds them again. Links from older versions had
+    # the id in the URL; it is dropped rather than adopted, since a shared
+    # link would otherwise hand the chats to whoever opens it.
+    st.session_state.client_id = st.context.cookies.get(CLIENT_COOKIE)
+    if not st.session_state.client_id:
+        st.session_state.client_id = uuid.uuid4().hex
+        st.session_state.remember_client = True
+    if "client" in st.query_params:
+        del st.query_params["client"]
+    load_chats()
+
     if not st.session_state.chat_sessions:
         create_session()
+    st.session_state.model = get_prompted_model_with_params(**st.session_state.current_parameters)
     
+if st.session_state.pop("remember_client", False):
+    remember_client(st.session_state.client_id)
+
 load_components()
 construct_chatting_session()
 
@@ -493,6 +620,7 @@ if user_input := st.chat_input("Ask something *w*"):
         st.markdown(user_input)
 
     st.session_state.messages.append({"role": "user", "content": user_input})
+    save_chat(st.session_state.current_chat_index)
     logger.info(f"User input: {user_input}")
 
     # Get current selected file
@@ -500,14 +628,39 @@ if user_input := st.chat_input("Ask something *w*"):
     
     # Get context info with detailed chunk metadata
     backend_filename = None if selected_file == 'all' else selected_file
-    texts, images, text_chunks, image_chunks = form_context_info(user_input, backend_filename)
+    # A paraphrase of an earlier question reuses its answer and sources
+    # (only when ANSWER_CACHE_ENABLED is set, and not for follow-up questions,
+    # whose meaning depends on the conversation)
+    follow_up = len(st.session_state.messages) > 1
+    cached_answer = get_cached_answer(user_input, backend_filename, follow_up=follow_up)
+    if cached_answer is not None:
+        text_chunks, image_chunks = cached_answer["text_chunks"], cached_answer["image_chunks"]
+        images = [chunk["metadata"] for chunk in image_chunks if chunk.get("metadata")]
+    else:
+        retrieval_timings = {}
+        texts, images, text_chunks, image_chunks = form_context_info(
+            user_input, backend_filename, retrieval_timings
+        )
+        logger.info(
+            f"Retrieval took {retrieval_timings['total'] * 1000:.0f} ms "
+            f"({'cached' if retrieval_timings.get('cache_hit') else 'searched'}); "
+            f"cache stats: {get_retrieval_cache_stats()}"
+        )
     
     # Get current session ID
     current_session = st.session_state.chat_sessions[st.session_state.current_chat_index]
-    session_id = current_session.get("session_id", f"session_{st.session_state.current_chat_index}")
+    session_id = current_session["session_id"]
     
     # Build prompt with citations
-    complete_prompt, citation_context = build_prompt_with_citations(user_input, text_chunks, image_chunks)
+    prompt_stats = {}
+    complete_prompt, citation_context = build_prompt_with_citations(
+        user_input, text_chunks, image_chunks, prompt_stats
+    )
+    logger.info(
+        f"Prompt ~{prompt_stats['prompt_tokens']} tokens "
+        f"(sources {prompt_stats['context_tokens']}: {prompt_stats['included']} whole, "
+        f"{prompt_stats['truncated']} truncated, {prompt_stats['dropped']} dropped)"
+    )
     
     # Prepare arguments for the model
     args = {
@@ -535,55 +688,66 @@ if user_input := st.chat_input("Ask something *w*"):
         thinking_placeholder = st.empty()
         answer_placeholder = st.empty()
 
-        full_response = "<think>"
-        in_thinking = False
-        thinking_content = ""
-        answer_content = ""
+        parser = ThinkStreamParser()
+        stream_view = {"thinking_text": None, "reasoning": 0, "answer": -1}
+        last_flush = 0.0
 
         # Stream the response with session history
-        for chunk in st.session_state.model.stream(args, config=config):
-            full_response += chunk
-            
-            # Check if we're in a thinking block
-            if "<think>" in full_response and "</think>" not in full_response:
-                in_thinking = True
-            elif "</think>" in full_response:
-                in_thinking = False
-                # Extract answer part after </think>
-                import re
-                match = re.search(r'</think>\s*(.*)', full_response, re.DOTALL)
-                if match:
-                    answer_content = match.group(1)
-            
-            if in_thinking:
-                # Show thinking in collapsed expander
-                with thinking_placeholder:
-                    with st.expander("🧠 Model Thinking Process", expanded=False):
-                        thinking_match = re.search(r'<think>(.*?)(?:</think>|$)', full_response, re.DOTALL)
-                        if thinking_match:
-                            st.text(thinking_match.group(1).strip())
-            else:
-                # Show answer in main area
-                if "</think>" in full_response:
-                    answer_placeholder.markdown(answer_content + "|")
-                else:
-                    # No thinking tags, show everything
-                    answer_placeholder.markdown(full_response + "|")
-
-        # Extract the answer part (after thinking) for display and citation extraction
-        display_response = full_response
-
-        # If model used extended thinking, extract only the answer part
-        if "<think>" in full_response and "</think>" in full_response:
-            import re
-            # The answer is everything AFTER </think>
-            match = re.search(r'</think>\s*(.*)', full_response, re.DOTALL)
-            if match:
-                display_response = match.group(1).strip()
-                logger.debug(f"Extracted answer from thinking: {display_response[:200]}")
-            else:
-                # Fallback: remove think tags completely
-                display_response = re.sub(r'<think>.*?</think>', '', full_response, flags=re.DOTALL).strip()
+        if cached_answer is not None:
+            # The cached answer replaces generation; record the turn in the
+            # session history as the model chain would have
+            history = get_session_history(session_id)
+            history.add_user_message(user_input)
+            history.add_ai_message(cached_answer["answer"])
+            response_stream = (text for text in [cached_answer["answer"]])
+        else:
+            # Generations are admitted by the shared scheduler; show the
+            # queue position while waiting for a slot
+            model = st.session_state.model
+
+            def start_generation():
+                answer_placeholder.empty()  # drop the queue notice
+                return model.stream(args, config=config)
+
+            response_stream = get_generation_scheduler().stream(
+                session_id,
+                start_generation,
+                on_wait=lambda position: answer_placeholder.info(
+                    f"⏳ The model is busy; your question is number {position} in the queue."
+                ),
+            )
+
+        # Closing the stream releases its generation slot even when the
+        # script is interrupted mid-stream (rerun or stop)
+        try:
+            with contextlib.closing(response_stream):
+                for chunk in response_stream:
+                    parser.feed(chunk)
+
+                    # Redraw at most once per STREAM_FLUSH_INTERVAL rather than per token
+                    now = time.monotonic()
+                    if now - last_flush >= STREAM_FLUSH_INTERVAL:
+                        last_flush = now
+                        render_stream(parser, thinking_placeholder, answer_placeholder, stream_view)
+        except GenerationRejected as e:
+            logger.warning(f"Generation rejected for {session_id}: {e}; {get_generation_scheduler().stats()}")
+            # The question was never answered; do not keep it in the saved chat
+            st.session_state.messages.pop()
+            save_chat(st.session_state.current_chat_index)
+            answer_placeholder.warning(
+                "The model is overloaded right now and your question could not be "
+                "started in time. Please try again in a moment."
+            )
+            st.stop()
+
+        logger.info(f"Generation scheduler: {get_generation_scheduler().stats()}")
+        parser.finish()
+        render_stream(parser, thinking_placeholder, answer_placeholder, stream_view, cursor="")
+
+        # Only the answer part (after thinking) is displayed and searched for citations
+        display_response = parser.answer.strip()
+        if parser.closed:
+            logger.debug(f"Extracted answer from thinking: {display_response[:200]}")
 
         # Extract citations from the display response (not the thinking part)
         citations_used = extract_citations_from_response(display_response, text_chunks, image_chunks)
@@ -593,12 +757,19 @@ if user_input := st.chat_input("Ask something *w*"):
             logger.warning(f"No citations found in response. Response preview: {display_response[:200]}")
             logger.warning(f"Text chunks available: {[c.get('citation_num') for c in text_chunks]}")
 
-        # Add the referenced RAG context to the chat history (Solution A: Full context, no length limit)
-        # This allows the model to refer back to previously retrieved content in follow-up questions
-        logger.info(f"Adding {len(text_chunks)} text chunks and {len(image_chunks)} image chunks to session history")
-        add_referenced_context_to_history(session_id, text_chunks, image_chunks)
+        # Record the cited sources in the chat history (once per chunk) so the model can
+        # refer back to them in follow-up questions, then fold old turns into the summary
+        cited_nums = {citation["num"] for citation in citations_used}
+        cited_text = [c for c in text_chunks if c.get("citation_num") in cited_nums]
+        cited_images = [c for c in image_chunks if c.get("citation_num") in cited_nums]
+        logger.info(f"Adding {len(cited_text)} text chunks and {len(cited_images)} image chunks to session history")
+        add_referenced_context_to_history(session_id, cited_text, cited_images)
+        compact_session_history(session_id)
         
         display_response = clean_response_citations(display_response)
+        if cached_answer is None:
+            cache_answer(user_input, backend_filename, display_response,
+                         citations_used, text_chunks, image_chunks, follow_up=follow_up)
         # Style the citations in the response text
         styled_response = style_citations_in_text(display_response, citations_used)
         
@@ -641,4 +812,5 @@ if user_input := st.chat_input("Ask something *w*"):
                 "image_chunks": image_chunks, # All retrieved image chunks
                 "selected_file": selected_file
             }
-        )
\ No newline at end of file
+        )
+        save_chat(st.session_state.current_chat_index)
@@ -6,7 +6,6 @@ This is a migration script for chunks that were created before filename support
 
 import sys
 import pathlib
-import chromadb
 from typing import Dict, List, Optional
 
 # Add parent directory to path
@@ -27,8 +26,7 @@ def update_chunks_with_filename(collection_name: str, filename: str = "manual")
     """
     try:
         # Get collection
-        storage = chromadb.PersistentClient("database/storage")
-        collection = storage.get_collection(name=collection_name)
+        collection = get_database.get_storage().get_collection(name=collection_name)
         
         # Get all chunks
         result = collection.get(include=['metadatas', 'documents'])
@@ -124,7 +122,7 @@ def verify_migration():
     print("-" * 30)
     
     try:
-        storage = chromadb.PersistentClient("database/storage")
+        storage = get_database.get_storage()
         
         for collection_name in ['textdb', 'imgdb']:
             try:
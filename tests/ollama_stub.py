@@ -0,0 +1,211 @@
+"""
+Minimal stand-in for an Ollama server, for exercising the endpoint router
+and the chat/embedding clients without GPUs or model downloads.
+
+    python tests/ollama_stub.py --port 11435 --model qwen3:8b --model bge-m3
+
+Serves /api/tags, /api/ps, /api/version, /api/chat (streamed or not) and
+/api/embed with canned replies and deterministic embeddings.
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def _model_key(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+def _embed(text: str, dimensions: int) -> List[float]:
+    """Unit vector seeded by the text, so equal inputs embed equally"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+class OllamaStub:
+    """
+    Threaded fake Ollama server.
+
+    Chat replies are `reply` split into words, streamed `token_delay`
+    seconds apart, with `thinking` text when the request asks for it.
+    Unknown models get a 404 like a real server; setting `healthy` to
+    False makes every request fail with a 503.
+    """
+
+    def __init__(
+        self,
+        models: Optional[List[str]] = None,
+        reply: str = "This is a stub reply.",
+        thinking: str = "Stub reasoning.",
+        token_delay: float = 0.0,
+        dimensions: int = 1024,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.models = [_model_key(m) for m in (models or ["qwen3:8b", "bge-m3"])]
+        self.reply = reply
+        self.thinking = thinking
+        self.token_delay = token_delay
+        self.dimensions = dimensions
+        self.healthy = True
+        self.loaded: List[str] = []
+        self.requests = 0
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OllamaStub":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _load(self, model: str) -> None:
+        if model not in self.loaded:
+            self.loaded.append(model)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _check(self) -> bool:
+                stub.requests += 1
+                if not stub.healthy:
+                    self._json(503, {"error": "stub server is unhealthy"})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._check():
+                    return
+                if self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": m, "model": m} for m in stub.models]})
+                elif self.path == "/api/ps":
+                    self._json(200, {"models": [{"name": m, "model": m} for m in stub.loaded]})
+                elif self.path == "/api/version":
+                    self._json(200, {"version": "0.0.0-stub"})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if not self._check():
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                model = _model_key(request.get("model", ""))
+                if model not in stub.models:
+                    self._json(404, {"error": f"model '{request.get('model')}' not found"})
+                    return
+                stub._load(model)
+
+                if self.path == "/api/chat":
+                    self._chat(request)
+                elif self.path == "/api/embed":
+                    inputs = request.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    self._json(200, {
+                        "model": request["model"],
+                        "embeddings": [_embed(text, stub.dimensions) for text in inputs],
+                    })
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def _chat(self, request: dict) -> None:
+                think = bool(request.get("think"))
+                words = stub.reply.split(" ")
+                tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+                def message(content: str = "", thinking: str = "") -> dict:
+                    body = {
+                        "model": request["model"],
+                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "message": {"role": "assistant", "content": content},
+                        "done": False,
+                    }
+                    if thinking:
+                        body["message"]["thinking"] = thinking
+                    return body
+
+                final = message()
+                final.update({
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": 0,
+                    "prompt_eval_count": 0,
+                    "eval_count": len(tokens),
+                })
+
+                if not request.get("stream", True):
+                    final["message"]["content"] = stub.reply
+                    if think:
+                        final["message"]["thinking"] = stub.thinking
+                    self._json(200, final)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                chunks = [message(thinking=stub.thinking)] if think else []
+                chunks += [message(token) for token in tokens] + [final]
+                for chunk in chunks:
+                    if stub.token_delay:
+                        time.sleep(stub.token_delay)
+                    self.wfile.write(json.dumps(chunk).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", action="append", help="Model to serve (repeatable)")
+    parser.add_argument("--reply", default="This is a stub reply.")
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    args = parser.parse_args()
+
+    stub = OllamaStub(
+        models=args.model,
+        reply=args.reply,
+        token_delay=args.token_delay,
+        dimensions=args.dimensions,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Stub Ollama server listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
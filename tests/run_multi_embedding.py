@@ -1,16 +1,21 @@
 import sys, pathlib
 import os
+import time
+import multiprocessing
 from glob import glob
-import chromadb
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
 
 from database.scripts.strategy.markdown import MarkdownEmbedding
+from database.scripts.strategy.store import QueueStore, StoreWriter
+from database.scripts.strategy.journal import IngestJournal
 from utils import get_database
 
 def check_if_document_processed(filename: str) -> bool:
     """
-    Check if a document has already been processed by looking for chunks with the filename.
+    Check if a document has already been processed by looking it up in the document registry.
     
     Args:
         filename: The filename to check
@@ -19,25 +24,7 @@ def check_if_document_processed(filename: str) -> bool:
         True if the document has already been processed, False otherwise
     """
     try:
-        # Initialize ChromaDB client
-        storage = chromadb.PersistentClient("database/storage")
-        
-        # Check both textdb and imgdb collections
-        for collection_name in ['textdb', 'imgdb']:
-            try:
-                collection = storage.get_collection(name=collection_name)
-                result = collection.get(include=['metadatas'])
-                
-                # Look for chunks with this filename
-                for metadata in result['metadatas']:
-                    if metadata and metadata.get('filename') == filename:
-                        return True
-                        
-            except Exception:
-                # Collection might not exist yet, continue checking
-                continue
-                
-        return False
+        return get_database.get_document_registry().is_processed(filename)
         
     except Exception as e:
         print(f"  [WARNING] Error checking if {filename} is processed: {e}")
@@ -51,34 +38,110 @@ def get_document_chunk_count(filename: str) -> dict:
         Dictionary with counts from each collection
     """
     try:
-        storage = chromadb.PersistentClient("database/storage")
-        counts = {'textdb': 0, 'imgdb': 0, 'total': 0}
-        
-        for collection_name in ['textdb', 'imgdb']:
-            try:
-                collection = storage.get_collection(name=collection_name)
-                result = collection.get(include=['metadatas'])
-                
-                count = sum(1 for metadata in result['metadatas']
-                           if metadata and metadata.get('filename') == filename)
-                counts[collection_name] = count
-                counts['total'] += count
-                
-            except Exception:
-                continue
-                
-        return counts
+        return get_database.get_document_registry().chunk_counts(filename)
         
     except Exception:
         return {'textdb': 0, 'imgdb': 0, 'total': 0}
 
-def process_multiple_documents(data_dir: str = ".data/result", force: bool = False):
+def ingest_document(json_path: str, md_path: str, doc_name: str, incremental: bool,
+                    existing_ids: Optional[dict], queue, streaming: bool = False) -> dict:
+    """
+    Worker entry point: embed one document, sending all writes to the parent process.
+    
+    Returns:
+        Dictionary with the document name and processing time in seconds
+    """
+    started = time.perf_counter()
+    processor = MarkdownEmbedding(
+        json_path=json_path,
+        markdown_path=md_path,
+        filename=doc_name,
+        store=QueueStore(queue, existing_ids),
+        streaming=streaming
+    )
+    processor.run(incremental=incremental)
+    return {'doc_name': doc_name, 'seconds': time.perf_counter() - started}
+
+def process_documents_in_parallel(jobs: list, incremental: bool, workers: int,
+                                  streaming: bool = False) -> tuple:
+    """
+    Embed documents on a pool of worker processes.
+    
+    Workers parse documents and call the vision model; every Chroma write goes
+    through a single StoreWriter thread in this process.
+    
+    Returns:
+        Tuple of (processed_count, error_count)
+    """
+    print(f"\n=== Embedding {len(jobs)} documents with {workers} workers ===")
+    
+    # Spawned workers do not inherit this process's open Chroma/SQLite handles
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    queue = manager.Queue(maxsize=workers * 8)
+    writer = StoreWriter(queue)
+    writer.start()
+    
+    # Documents whose worker finished; they count as processed only once the
+    # writer has also written and registered them
+    finished = {}
+    error_count = 0
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {}
+        for doc_name, json_file, md_file in jobs:
+            existing_ids = writer.store.existing_ids(doc_name) if incremental else None
+            future = pool.submit(ingest_document, str(json_file), str(md_file),
+                                 doc_name, incremental, existing_ids, queue, streaming)
+            futures[future] = doc_name
+        
+        for done, future in enumerate(as_completed(futures), 1):
+            doc_name = futures[future]
+            try:
+                result = future.result()
+                print(f"  [DONE] ({done}/{len(jobs)}) {doc_name} processed in {result['seconds']:.1f}s")
+                finished[doc_name] = result
+            except Exception as e:
+                print(f"  [ERROR] ({done}/{len(jobs)}) Failed to process {doc_name}: {e}")
+                error_count += 1
+    
+    write_stats = writer.stop()
+    manager.shutdown()
+    elapsed = time.perf_counter() - started
+    
+    processed_count = 0
+    for doc_name in finished:
+        if doc_name in writer.failed:
+            print(f"  [ERROR] {doc_name}: {len(writer.failed[doc_name])} store writes failed "
+                  f"({writer.failed[doc_name][0]}); rerun to resume")
+            error_count += 1
+            continue
+        chunk_counts = get_document_chunk_count(doc_name)
+        print(f"  [OK] {doc_name}: {chunk_counts['textdb']} text, {chunk_counts['imgdb']} image/table chunks")
+        processed_count += 1
+    
+    total_chunks = sum(stats['chunks'] for stats in write_stats.values())
+    print(f"  ⏱️  {processed_count} documents in {elapsed:.1f}s "
+          f"({processed_count / elapsed * 3600:.1f} documents/hour, "
+          f"{total_chunks / elapsed:.1f} chunks/sec written)")
+    if writer.errors:
+        print(f"  [ERROR] {len(writer.errors)} store operations failed")
+    
+    return processed_count, error_count
+
+def process_multiple_documents(data_dir: str = ".data/result", force: bool = False, incremental: bool = False,
+                               workers: int = 1, streaming: bool = False):
     """
     Process multiple documents from the data directory.
     
     Args:
         data_dir: Directory containing document folders
         force: If True, reprocess documents even if they already exist in database
+        incremental: If True, update already processed documents in place, only
+            adding new chunks and deleting removed ones
+        workers: Number of worker processes embedding documents in parallel
+        streaming: If True, read each document page by page instead of loading it whole
     
     Expected structure:
     .data/result/
@@ -109,6 +172,7 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
         print(f"  - {doc_dir.name}")
     
     print(f"\nForce mode: {'ON' if force else 'OFF'}")
+    print(f"Incremental mode: {'ON' if incremental else 'OFF'}")
     print("=" * 60)
     
     # Statistics
@@ -116,6 +180,9 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
     skipped_count = 0
     error_count = 0
     
+    # Documents to embed, as (doc_name, json_file, md_file)
+    jobs = []
+    
     # Process each document
     for doc_dir in document_dirs:
         doc_name = doc_dir.name
@@ -127,7 +194,7 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
         
         doc_processed = check_if_document_processed(doc_name)
         # Check if already processed (unless force mode is on)
-        if not force and doc_processed:
+        if not force and not incremental and doc_processed:
             chunk_counts = get_document_chunk_count(doc_name)
             print(f"  [SKIP] Document already processed:")
             print(f"    - Text chunks: {chunk_counts['textdb']}")
@@ -141,18 +208,17 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
             # delete existing chunks for this document
             print(f"  [FORCE] Reprocessing document, deleting existing chunks...")
             try:
-                storage = chromadb.PersistentClient("database/storage")
+                chunk_counts = get_document_chunk_count(doc_name)
                 for collection_name in ['textdb', 'imgdb']:
-                    try:
-                        collection = storage.get_collection(name=collection_name)
-                        result = collection.get(include=['ids', 'metadatas'])
-                        ids_to_delete = [result['ids'][i] for i, metadata in enumerate(result['metadatas'])
-                                         if metadata and metadata.get('filename') == doc_name]
-                        if ids_to_delete:
-                            collection.delete(ids=ids_to_delete)
-                            print(f"    - Deleted {len(ids_to_delete)} chunks from {collection_name}")
-                    except Exception:
-                        continue
+                    collection = get_database.get_database(collection_name)
+                    collection.delete(where={'filename': doc_name})
+                    if chunk_counts[collection_name]:
+                        print(f"    - Deleted {chunk_counts[collection_name]} chunks from {collection_name}")
+                get_database.get_document_registry().remove(doc_name)
+                get_database.get_document_registry().bump_version('textdb', 'imgdb')
+                get_database.get_table_store().remove(doc_name)
+                get_database.get_lexical_index().remove_document(doc_name)
+                IngestJournal(doc_name).close()
             except Exception as e:
                 print(f"  [ERROR] Failed to delete existing chunks: {e}")
                 error_count += 1
@@ -178,31 +244,41 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
         
         print(f"  JSON: {json_file.name}")
         print(f"  Markdown: {md_file.name}")
-        
-        try:
-            # Initialize processor with filename
-            processor = MarkdownEmbedding(
-                json_path=str(json_file),
-                markdown_path=str(md_file),
-                filename=doc_name
-            )
-            
-            # Execute processing
-            processor.run()
-            
-            # Show final chunk counts
-            chunk_counts = get_document_chunk_count(doc_name)
-            print(f"  [OK] Successfully processed {doc_name}")
-            print(f"    - Text chunks: {chunk_counts['textdb']}")
-            print(f"    - Image/Table chunks: {chunk_counts['imgdb']}")
-            print(f"    - Total chunks: {chunk_counts['total']}")
-            processed_count += 1
-            
-        except Exception as e:
-            print(f"  [ERROR] Failed to process {doc_name}: {e}")
-            error_count += 1
-            continue
+        jobs.append((doc_name, json_file, md_file))
     
+    if workers > 1 and len(jobs) > 1:
+        processed_count, failed_count = process_documents_in_parallel(
+            jobs, incremental and not force, workers, streaming
+        )
+        error_count += failed_count
+    else:
+        for doc_name, json_file, md_file in jobs:
+            print(f"\n=== Embedding document: {doc_name} ===")
+            try:
+                # Initialize processor with filename
+                processor = MarkdownEmbedding(
+                    json_path=str(json_file),
+                    markdown_path=str(md_file),
+                    filename=doc_name,
+                    streaming=streaming
+                )
+                
+                # Execute processing
+                processor.run(incremental=incremental and not force)
+                
+                # Show final chunk counts
+                chunk_counts = get_document_chunk_count(doc_name)
+                print(f"  [OK] Successfully processed {doc_name}")
+                print(f"    - Text chunks: {chunk_counts['textdb']}")
+                print(f"    - Image/Table chunks: {chunk_counts['imgdb']}")
+                print(f"    - Total chunks: {chunk_counts['total']}")
+                processed_count += 1
+                
+            except Exception as e:
+                print(f"  [ERROR] Failed to process {doc_name}: {e}")
+                error_count += 1
+                continue
+        
     # Final statistics
     print("\n" + "=" * 60)
     print("📊 PROCESSING SUMMARY:")
@@ -211,8 +287,8 @@ def process_multiple_documents(data_dir: str = ".data/result", force: bool = Fal
     print(f"   ❌ Errors: {error_count} documents")
     print(f"   📁 Total found: {len(document_dirs)} documents")
     
-    if skipped_count > 0 and not force:
-        print(f"\n💡 TIP: Use --force to reprocess skipped documents")
+    if skipped_count > 0 and not force and not incremental:
+        print(f"\n💡 TIP: Use --incremental to update or --force to reprocess skipped documents")
     
     print("=" * 60)
 
@@ -225,12 +301,22 @@ if __name__ == "__main__":
                        help="Directory containing document folders (default: .data/result)")
     parser.add_argument("--force", action="store_true", 
                        help="Force reprocessing of already processed documents")
+    parser.add_argument("--incremental", action="store_true",
+                       help="Update already processed documents in place, re-embedding only changed chunks")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Number of documents processed in parallel (default: 1); "
+                            "each worker keeps VISION_CONCURRENCY vision requests in flight")
+    parser.add_argument("--streaming", action="store_true",
+                       help="Read content lists and markdown page by page to bound memory on very large documents")
     
     args = parser.parse_args()
     
     print("🚀 Multi-Document Embedding Processor")
     print(f"📂 Data directory: {args.data_dir}")
     print(f"🔄 Force mode: {'Enabled' if args.force else 'Disabled'}")
+    print(f"🧩 Incremental mode: {'Enabled' if args.incremental else 'Disabled'}")
+    print(f"👷 Workers: {args.workers}")
+    print(f"🌊 Streaming mode: {'Enabled' if args.streaming else 'Disabled'}")
     print()
     
-    process_multiple_documents(args.data_dir, args.force)
\ No newline at end of file
+    process_multiple_documents(args.data_dir, args.force, args.incremental, args.workers, args.streaming)
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Tests of locating MinerU content items in the document markdown.
+"""
+
+import sys
+import pathlib
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+from database.scripts.strategy.alignment import MarkdownIndex
+
+
+def text(value: str):
+    return {"type": "text", "text": value}
+
+
+def test_items_are_located_in_order():
+    index = MarkdownIndex("intro\n\nfirst step\n\nsecond step\n\nfirst step")
+    first, second, repeated = index.align([text("first step"), text("second step"), text("first step")])
+
+    assert index.markdown[slice(*first)] == "first step"
+    assert index.markdown[slice(*second)] == "second step"
+    # The repeated text is matched after the cursor, not at its first occurrence
+    assert repeated[0] > second[1]
+    assert index.misses == 0
+
+
+def test_out_of_order_item_within_window():
+    index = MarkdownIndex("alpha\n\n" + "x" * 100 + "\n\nbeta", window=200)
+    index.locate(text("beta"))
+    cursor = index.cursor
+
+    assert index.locate(text("alpha")) == (0, 5)
+    assert index.cursor == cursor
+
+
+def test_earlier_match_outside_window_is_a_miss():
+    index = MarkdownIndex("alpha\n\n" + "x" * 1000 + "\n\nbeta", window=200)
+    index.locate(text("beta"))
+
+    assert index.locate(text("alpha")) is None
+    assert index.locate(text("missing")) is None
+    assert index.misses == 2
+
+
+if __name__ == "__main__":
+    for test in (
+        test_items_are_located_in_order,
+        test_out_of_order_item_within_window,
+        test_earlier_match_outside_window_is_a_miss,
+    ):
+        test()
+        print(f"[OK] {test.__name__}")
@@ -0,0 +1,159 @@
+"""
+Test of resuming an interrupted ingestion from its IngestJournal.
+
+A document whose vision calls start failing part-way is written as far as it
+got but not registered, and its journal is kept. Rerunning it makes only the
+missing vision calls and ends with the same chunk ids as a clean run.
+Vector embeddings are replaced by deterministic fakes, so no model is needed.
+"""
+
+import os
+import sys
+import uuid
+import hashlib
+import pathlib
+import tempfile
+
+# Keep the test's vector store, registry and journals out of the real storage
+os.environ.setdefault("STORAGE_PATH", tempfile.mkdtemp(prefix="ingest-resume-"))
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+import json
+
+from utils import cache, get_database
+from utils.registry import COLLECTIONS
+from database.scripts.strategy.journal import IngestJournal
+from database.scripts.strategy.markdown import MarkdownEmbedding
+
+IMAGES = 20
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self._text = text
+
+    def text(self) -> str:
+        return self._text
+
+
+class FakeVisionModel:
+    """Stands in for the vision model; fails every call after `fail_after` calls."""
+
+    model = "fake-vision"
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise TimeoutError("vision model timed out")
+        return FakeResponse(f"Summary number {self.calls}")
+
+
+def fake_embed_documents(documents):
+    return [
+        [b / 255 for b in hashlib.sha256(document.encode("utf-8")).digest()[:16]]
+        for document in documents
+    ]
+
+
+def write_document(directory: pathlib.Path) -> pathlib.Path:
+    """A content list of text pages with one image each, plus its markdown"""
+    items, markdown = [], []
+    (directory / "images").mkdir()
+    for page in range(IMAGES):
+        text = f"Page {page} describes maintenance step {page} of the platform screen doors. " * 4
+        img_path = f"images/figure_{page}.png"
+        # Not decodable: images are sent as they are and never deduplicated
+        (directory / img_path).write_bytes(f"figure {page}".encode("utf-8"))
+        items += [
+            {"type": "text", "text": text, "page_idx": page},
+            {"type": "image", "img_path": img_path, "page_idx": page},
+        ]
+        markdown += [text, f"![]({img_path})"]
+
+    json_path = directory / "manual_content_list.json"
+    json_path.write_text(json.dumps(items), encoding="utf-8")
+    (directory / "manual.md").write_text("\n\n".join(markdown), encoding="utf-8")
+    return json_path
+
+
+def ingest(json_path: pathlib.Path, filename: str, model: FakeVisionModel, summary_cache_path):
+    processor = MarkdownEmbedding(
+        json_path=str(json_path),
+        markdown_path=str(json_path.parent / "manual.md"),
+        filename=filename,
+        concurrency=1,
+    )
+    processor.base_model = model
+    processor.summary_cache = cache.SummaryCache(summary_cache_path)
+    processor.run()
+
+
+def stored_ids(filename: str):
+    """Chunk ids of a document per collection, without the document name"""
+    return {
+        name: sorted(
+            id[len(filename) :]
+            for id in get_database.get_database(name).get(where={"filename": filename}, include=[])["ids"]
+        )
+        for name in COLLECTIONS
+    }
+
+
+def remove_document(filename: str) -> None:
+    for name in COLLECTIONS:
+        get_database.get_database(name).delete(where={"filename": filename})
+    get_database.get_document_registry().remove(filename)
+    get_database.get_lexical_index().remove_document(filename)
+    IngestJournal(filename).close()
+
+
+def test_failed_run_is_not_registered_and_resumes_from_journal():
+    original_embed_documents = get_database.embed_documents
+    get_database.embed_documents = fake_embed_documents
+    resumed, clean = f"resumed-{uuid.uuid4().hex[:8]}", f"clean-{uuid.uuid4().hex[:8]}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        json_path = write_document(directory)
+        registry = get_database.get_document_registry()
+        try:
+            # The vision model starts timing out after 12 summaries
+            failing = FakeVisionModel(fail_after=12)
+            try:
+                ingest(json_path, resumed, failing, directory / "summaries-1.sqlite3")
+                raise AssertionError("expected the incomplete run to raise")
+            except RuntimeError:
+                pass
+            assert failing.calls == IMAGES
+            assert not registry.is_processed(resumed)
+            journal = IngestJournal(resumed)
+            assert journal.exists()
+            assert len(journal.completed_ids()["imgdb"]) == 12
+
+            # The rerun only summarizes the images that failed
+            retry = FakeVisionModel()
+            ingest(json_path, resumed, retry, directory / "summaries-2.sqlite3")
+            assert retry.calls == IMAGES - 12
+            assert registry.is_processed(resumed)
+            assert not IngestJournal(resumed).exists()
+
+            full = FakeVisionModel()
+            ingest(json_path, clean, full, directory / "summaries-3.sqlite3")
+            assert full.calls == IMAGES
+
+            assert stored_ids(resumed) == stored_ids(clean)
+            assert len(stored_ids(resumed)["imgdb"]) == IMAGES
+        finally:
+            get_database.embed_documents = original_embed_documents
+            remove_document(resumed)
+            remove_document(clean)
+
+
+if __name__ == "__main__":
+    test_failed_run_is_not_registered_and_resumes_from_journal()
+    print("[OK] test_failed_run_is_not_registered_and_resumes_from_journal")
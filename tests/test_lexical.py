@@ -0,0 +1,102 @@
+"""
+Tests of the BM25 lexical index: document-frequency cutoff, exact search and
+adoption of an index file in the older layout.
+"""
+
+import sys
+import sqlite3
+import pathlib
+import tempfile
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+from utils.lexical import LexicalIndex
+
+CHUNKS = {
+    "c0": "The platform screen door controller uses RS485 at 9600 baud.",
+    "c1": "Door X01-X40 passed the platform screen door inspection.",
+    "c2": "Replace the door motor fuse on the platform side.",
+    "c3": "The door status panel shows the +48V supply voltage.",
+}
+
+
+def make_index(directory: str) -> LexicalIndex:
+    index = LexicalIndex(pathlib.Path(directory) / "lexical.sqlite3")
+    index.add(
+        "textdb",
+        list(CHUNKS),
+        list(CHUNKS.values()),
+        [{"filename": "manual"} for _ in CHUNKS],
+    )
+    return index
+
+
+def test_hits_carry_only_ids_and_scores():
+    with tempfile.TemporaryDirectory() as directory:
+        index = make_index(directory)
+        hits = index.search("RS485 baud", "textdb", 3)
+
+        assert [hit["id"] for hit in hits] == ["c0"]
+        assert set(hits[0]) == {"id", "score"}
+        columns = {row[1] for row in index.conn.execute("PRAGMA table_info(docs)")}
+        assert "document" not in columns and "metadata" not in columns
+
+
+def test_frequent_terms_are_not_scored():
+    with tempfile.TemporaryDirectory() as directory:
+        index = make_index(directory)
+
+        # "door" is in every chunk and only "fuse" decides the ranking
+        hits = index.search("door fuse", "textdb", 3)
+        assert [hit["id"] for hit in hits] == ["c2"]
+
+        # Made only of frequent terms: searched by the rarest ("platform")
+        hits = index.search("door platform", "textdb", 3)
+        assert {hit["id"] for hit in hits} == {"c0", "c1", "c2"}
+
+
+def test_exact_search_checks_frequent_terms_on_candidates():
+    with tempfile.TemporaryDirectory() as directory:
+        index = make_index(directory)
+
+        assert [hit["id"] for hit in index.search("door X01-X40", "textdb", 3, exact=True)] == ["c1"]
+        assert index.search("fuse X01-X40", "textdb", 3, exact=True) == []
+        assert index.search("RS232", "textdb", 3, exact=True) == []
+
+
+def test_older_index_is_dropped_for_rebuild():
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory) / "lexical.sqlite3"
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            """
+            CREATE TABLE docs (
+                collection TEXT NOT NULL, chunk_id TEXT NOT NULL, filename TEXT NOT NULL,
+                length INTEGER NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL,
+                PRIMARY KEY (collection, chunk_id)
+            );
+            CREATE TABLE postings (
+                term TEXT NOT NULL, collection TEXT NOT NULL, chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL, PRIMARY KEY (term, collection, chunk_id)
+            ) WITHOUT ROWID;
+            INSERT INTO docs VALUES ('textdb', 'c0', 'manual', 1, 'fuse', '{}');
+            INSERT INTO postings VALUES ('fuse', 'textdb', 'c0', 1);
+            """
+        )
+        conn.close()
+
+        index = LexicalIndex(path)
+        assert index.is_empty()
+        index.add("textdb", ["c2"], [CHUNKS["c2"]], [{"filename": "manual"}])
+        assert [hit["id"] for hit in index.search("fuse", "textdb", 3)] == ["c2"]
+
+
+if __name__ == "__main__":
+    for test in (
+        test_hits_carry_only_ids_and_scores,
+        test_frequent_terms_are_not_scored,
+        test_exact_search_checks_frequent_terms_on_candidates,
+        test_older_index_is_dropped_for_rebuild,
+    ):
+        test()
+        print(f"[OK] {test.__name__}")
@@ -0,0 +1,138 @@
+"""
+Tests of the Ollama endpoint router against two local stub servers.
+
+Checks endpoint selection (model affinity, skipping unhealthy endpoints and
+endpoints without the model), failover of chat calls, and the routed chat
+model built by get_model.get_chat_model.
+"""
+
+import sys
+import pathlib
+from contextlib import contextmanager
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+import httpx
+import ollama
+
+from langchain_core.messages import HumanMessage
+
+from utils import get_model, router as router_module
+from utils.router import OllamaRouter
+from tests.ollama_stub import OllamaStub
+
+MODEL = "qwen3:8b"
+
+
+@contextmanager
+def stub_pool(**kwargs):
+    """Two running stub servers and a router over them (not probing in the background)"""
+    a = OllamaStub(reply="from a", **kwargs).start()
+    b = OllamaStub(reply="from b", **kwargs).start()
+    try:
+        yield a, b, OllamaRouter([a.url, b.url])
+    finally:
+        a.stop()
+        b.stop()
+
+
+def chat(endpoint, timeout=None) -> str:
+    client = ollama.Client(host=endpoint.url, timeout=timeout)
+    return client.chat(model=MODEL, messages=[{"role": "user", "content": "hi"}]).message.content
+
+
+def test_prefers_endpoint_with_model_loaded():
+    with stub_pool() as (a, b, router):
+        b.loaded.append(MODEL)
+        router.probe_all()
+
+        assert [e.url for e in router.candidates(MODEL)] == [b.url, a.url]
+        assert router.call(MODEL, chat) == "from b"
+
+
+def test_skips_unhealthy_endpoint():
+    with stub_pool() as (a, b, router):
+        a.loaded.append(MODEL)
+        a.healthy = False
+        router.probe_all()
+
+        assert [e.url for e in router.candidates(MODEL)] == [b.url, a.url]
+        assert router.call(MODEL, chat) == "from b"
+        assert a.requests == 1  # only the failed probe
+
+
+def test_fails_over_when_endpoint_goes_down():
+    with stub_pool() as (a, b, router):
+        a.loaded.append(MODEL)
+        router.probe_all()
+        assert router.candidates(MODEL)[0].url == a.url
+
+        # Goes down between probes: the call fails on a and is retried on b
+        a.healthy = False
+        assert router.call(MODEL, chat) == "from b"
+        assert not router.endpoints[0].healthy
+
+        # Back up: the next probe restores it
+        a.healthy = True
+        router.probe_all()
+        assert router.endpoints[0].healthy
+
+
+def test_missing_model_only_drops_that_model():
+    with stub_pool() as (a, b, router):
+        a.models.remove(MODEL)
+        # Not probed yet: affinity makes the router try a first
+        router.endpoints[0].loaded.add(MODEL)
+
+        assert router.call(MODEL, chat) == "from b"
+        assert router.endpoints[0].healthy
+        assert MODEL in router.endpoints[0].missing
+        assert [e.url for e in router.candidates(MODEL)][0] == b.url
+        assert router.candidates("bge-m3")[0].url in (a.url, b.url)
+
+
+def test_read_timeout_is_not_retried():
+    with stub_pool(token_delay=1.0) as (a, b, router):
+        a.loaded.append(MODEL)
+        router.probe_all()
+        requests_to_b = b.requests
+
+        def stream(endpoint):
+            client = ollama.Client(host=endpoint.url, timeout=0.2)
+            yield from client.chat(
+                model=MODEL, messages=[{"role": "user", "content": "hi"}], stream=True
+            )
+
+        try:
+            list(router.stream(MODEL, stream))
+            raise AssertionError("expected a read timeout")
+        except httpx.ReadTimeout:
+            pass
+        assert router.endpoints[0].healthy
+        assert b.requests == requests_to_b
+
+
+def test_chat_model_with_trailing_slash_urls():
+    with stub_pool() as (a, b, _):
+        previous = router_module._router
+        router_module._router = OllamaRouter([a.url + "/", b.url + "/"])
+        try:
+            model = get_model.get_chat_model(MODEL)
+            assert model.invoke([HumanMessage("hi")]).content in ("from a", "from b")
+            streamed = "".join(chunk.content for chunk in model.stream([HumanMessage("hi")]))
+            assert streamed in ("from a", "from b")
+        finally:
+            router_module._router = previous
+
+
+if __name__ == "__main__":
+    for test in (
+        test_prefers_endpoint_with_model_loaded,
+        test_skips_unhealthy_endpoint,
+        test_fails_over_when_endpoint_goes_down,
+        test_missing_model_only_drops_that_model,
+        test_read_timeout_is_not_retried,
+        test_chat_model_with_trailing_slash_urls,
+    ):
+        test()
+        print(f"[OK] {test.__name__}")
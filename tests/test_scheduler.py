@@ -0,0 +1,160 @@
+"""
+Tests of the generation scheduler, streaming replies from a stub Ollama server.
+
+Checks that admission stops at GENERATION_CONCURRENCY, that waiting sessions
+are served round-robin, and that a slot is released however its stream ends.
+"""
+
+import sys
+import time
+import pathlib
+import threading
+from contextlib import closing
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+import ollama
+
+from utils.settings import GENERATION_CONCURRENCY
+from utils.scheduler import GenerationScheduler
+from tests.ollama_stub import OllamaStub
+
+MODEL = "qwen3:8b"
+
+
+def open_stream(stub: OllamaStub, model: str = MODEL):
+    """Start a streamed chat on the stub; returns the text chunks"""
+    chunks = ollama.Client(host=stub.url).chat(
+        model=model, messages=[{"role": "user", "content": "hi"}], stream=True
+    )
+    return (chunk.message.content for chunk in chunks)
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def test_admission_stops_at_concurrency_limit():
+    stub = OllamaStub(reply="one two three four five", token_delay=0.05).start()
+    scheduler = GenerationScheduler(max_concurrent=GENERATION_CONCURRENCY)
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def start():
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        try:
+            yield from open_stream(stub)
+        finally:
+            with lock:
+                running["now"] -= 1
+
+    replies = []
+
+    def ask(session_id):
+        replies.append("".join(scheduler.stream(session_id, start)))
+
+    try:
+        threads = [
+            threading.Thread(target=ask, args=(f"session-{i}",))
+            for i in range(GENERATION_CONCURRENCY + 2)
+        ]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: scheduler.stats()["queued"] == 2)
+        assert scheduler.stats()["active"] == GENERATION_CONCURRENCY
+        for thread in threads:
+            thread.join()
+    finally:
+        stub.stop()
+
+    assert running["peak"] == GENERATION_CONCURRENCY
+    assert replies == ["one two three four five"] * (GENERATION_CONCURRENCY + 2)
+    stats = scheduler.stats()
+    assert stats["active"] == 0 and stats["completed"] == GENERATION_CONCURRENCY + 2
+
+
+def test_waiting_sessions_are_served_round_robin():
+    stub = OllamaStub(reply="ok", token_delay=0.05).start()
+    scheduler = GenerationScheduler(max_concurrent=1)
+    started = []
+
+    def ask(label):
+        session_id = label[0]
+
+        def start():
+            started.append(label)
+            return open_stream(stub)
+
+        "".join(scheduler.stream(session_id, start))
+
+    try:
+        # Hold the only slot while the others queue up in a known order
+        blocker = scheduler.stream("X", lambda: open_stream(stub))
+        next(blocker)
+
+        threads = []
+        for queued, label in enumerate(["A0", "A1", "A2", "B0", "C0"], 1):
+            thread = threading.Thread(target=ask, args=(label,))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: scheduler.stats()["queued"] == queued)
+
+        blocker.close()
+        for thread in threads:
+            thread.join()
+    finally:
+        stub.stop()
+
+    assert started == ["A0", "B0", "C0", "A1", "A2"]
+
+
+def test_slot_released_when_stream_is_closed_early():
+    stub = OllamaStub(reply="one two three four five", token_delay=0.05).start()
+    scheduler = GenerationScheduler(max_concurrent=1)
+    try:
+        response_stream = scheduler.stream("A", lambda: open_stream(stub))
+        # As the frontend does when the script is interrupted mid-stream
+        with closing(response_stream):
+            next(response_stream)
+            assert scheduler.stats()["active"] == 1
+        assert scheduler.stats()["active"] == 0
+
+        # The freed slot is granted right away
+        assert "".join(scheduler.stream("B", lambda: open_stream(stub), max_wait=1)) == (
+            "one two three four five"
+        )
+    finally:
+        stub.stop()
+
+
+def test_slot_released_when_stream_raises():
+    stub = OllamaStub().start()
+    scheduler = GenerationScheduler(max_concurrent=1)
+    try:
+        # The stub answers 404 for an unknown model once the stream is read
+        try:
+            list(scheduler.stream("A", lambda: open_stream(stub, "missing-model")))
+            raise AssertionError("expected the stream to fail")
+        except ollama.ResponseError as e:
+            assert e.status_code == 404
+        assert scheduler.stats()["active"] == 0
+
+        assert "".join(scheduler.stream("B", lambda: open_stream(stub), max_wait=1))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    for test in (
+        test_admission_stops_at_concurrency_limit,
+        test_waiting_sessions_are_served_round_robin,
+        test_slot_released_when_stream_is_closed_early,
+        test_slot_released_when_stream_raises,
+    ):
+        test()
+        print(f"[OK] {test.__name__}")
@@ -0,0 +1,93 @@
+"""
+Tests of utils.tables.parse_table on small HTML fixtures of the kind MinerU
+produces, including malformed ones.
+"""
+
+import sys
+import pathlib
+
+sys.path.append(pathlib.Path(__file__).parents[1].as_posix())
+
+from utils.tables import parse_table, row_texts
+
+RAGGED = """
+<table>
+  <tr><td>Door No.</td><td>Voltage</td><td>Remarks</td></tr>
+  <tr><td>PSD X01</td></tr>
+  <tr><td>PSD X02</td><td>48V</td><td>Done</td><td>extra</td></tr>
+  <tr><td></td><td> </td></tr>
+</table>
+"""
+
+ROWSPAN_PAST_END = """
+<table>
+  <tr><td>Station</td><td>Door</td><td>Status</td></tr>
+  <tr><td rowspan="5">Kovan</td><td>X01</td><td rowspan="2">OK</td></tr>
+  <tr><td>X02</td></tr>
+  <tr></tr>
+</table>
+"""
+
+NESTED_TH = """
+<html><body><table>
+  <tr><th>Item<th>Output <b>Voltage</b></th></th></tr>
+  <tr><td>PSU<br>main</td><td>+48V</td></tr>
+</table></body></html>
+"""
+
+NESTED_TABLE = """
+<table>
+  <tr><th>Item</th><th>Limits <table><tr><th>min</th><th>max</th></tr></table> (V)</th></tr>
+  <tr><td>PSU</td><td>44 - 52</td></tr>
+</table>
+"""
+
+
+def test_ragged_rows_are_padded():
+    rows = parse_table(RAGGED)
+    assert rows == [
+        ["Door No.", "Voltage", "Remarks", ""],
+        ["PSD X01", "", "", ""],
+        ["PSD X02", "48V", "Done", "extra"],
+    ]
+    assert row_texts(rows) == [
+        "Door No.: PSD X01",
+        "Door No.: PSD X02; Voltage: 48V; Remarks: Done; extra",
+    ]
+
+
+def test_rowspan_running_past_last_row():
+    rows = parse_table(ROWSPAN_PAST_END)
+    assert rows == [
+        ["Station", "Door", "Status"],
+        ["Kovan", "X01", "OK"],
+        ["Kovan", "X02", "OK"],
+        ["Kovan", "", ""],
+    ]
+    assert row_texts(rows) == [
+        "Station: Kovan; Door: X01; Status: OK",
+        "Station: Kovan; Door: X02; Status: OK",
+        "Station: Kovan",
+    ]
+
+
+def test_nested_th_is_closed_by_the_next_cell():
+    rows = parse_table(NESTED_TH)
+    assert rows == [["Item", "Output Voltage"], ["PSU main", "+48V"]]
+    assert row_texts(rows) == ["Item: PSU main; Output Voltage: +48V"]
+
+
+def test_nested_table_text_stays_in_its_cell():
+    rows = parse_table(NESTED_TABLE)
+    assert rows == [["Item", "Limits min max (V)"], ["PSU", "44 - 52"]]
+
+
+if __name__ == "__main__":
+    for test in (
+        test_ragged_rows_are_padded,
+        test_rowspan_running_past_last_row,
+        test_nested_th_is_closed_by_the_next_cell,
+        test_nested_table_text_stays_in_its_cell,
+    ):
+        test()
+        print(f"[OK] {test.__name__}")
@@ -0,0 +1,550 @@
+import json
+import time
+import sqlite3
+import hashlib
+import pathlib
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+from .settings import *
+
+
+def hash_bytes(data: Union[bytes, str]) -> str:
+    """Return the SHA-256 hex digest of bytes or UTF-8 text."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional time-to-live per entry.
+
+    Holds at most `max_entries` values; reading an entry marks it as recently
+    used, and entries older than `ttl` seconds are treated as missing.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+            }
+
+
+class SQLiteStore:
+    """
+    Base class for small on-disk stores kept in a single SQLite file.
+
+    A connection is shared between threads and guarded by a lock; WAL mode lets
+    several ingestion processes read and write the same file.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+class SQLiteCache(SQLiteStore):
+    """SQLite store that counts cache hits and misses."""
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SummaryCache(SQLiteCache):
+    """
+    Content-addressed cache of vision-model summaries.
+
+    Entries are keyed by the hash of the summarized content (image bytes or
+    table text), the context hash, the model name and the prompt version, and
+    evicted least-recently-used first once the stored summaries exceed
+    `max_bytes`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS summaries_accessed ON summaries (accessed_at);
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "summary_cache.sqlite3",
+        max_bytes: int = SUMMARY_CACHE_MAX_BYTES,
+    ):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(
+        content: Union[bytes, str], context: str, model: str, prompt_version: str
+    ) -> str:
+        """Build the cache key for one summarization request."""
+        return hash_bytes(
+            "\0".join([hash_bytes(content), hash_bytes(context), model, prompt_version])
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT summary FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.conn.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, summary: str) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (key, summary, len(summary.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used summaries until the cache fits in max_bytes."""
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM summaries"
+        ).fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM summaries ORDER BY accessed_at"
+        ):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM summaries WHERE key = ?", victims)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries"
+            ).fetchone()
+        return {**super().stats(), "entries": entries, "bytes": size}
+
+
+class ImageCache(SQLiteCache):
+    """
+    Cache of preprocessed (downscaled and re-encoded) image payloads.
+
+    Entries are keyed by the hash of the original image bytes and the
+    preprocessing parameters, and evicted least-recently-used first once the
+    stored payloads exceed `max_bytes`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS images (
+            key TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            mime_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS images_accessed ON images (accessed_at);
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "image_cache.sqlite3",
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+    ):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(content: bytes, max_edge: int, quality: int) -> str:
+        return f"{hash_bytes(content)}:{max_edge}:{quality}"
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return the cached (payload, mime type) for a key, if present."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, mime_type FROM images WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.conn.execute(
+                "UPDATE images SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def put(self, key: str, data: bytes, mime_type: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                (key, data, mime_type, len(data), time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used payloads until the cache fits in max_bytes."""
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM images"
+        ).fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM images ORDER BY accessed_at"
+        ):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM images WHERE key = ?", victims)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images"
+            ).fetchone()
+        return {**super().stats(), "entries": entries, "bytes": size}
+
+
+class EmbeddingCache(SQLiteCache):
+    """
+    Persistent cache of embedding vectors keyed by (embedding model, text hash).
+
+    Text is normalized before hashing so whitespace-only differences reuse the
+    same vector. At most `max_entries` vectors are kept; the least recently
+    used ones are evicted first.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY,
+            vector BLOB NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at);
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "embedding_cache.sqlite3",
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        return f"{model}:{hash_bytes(cls.normalize(text))}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the keys that are present."""
+        found = {}
+        with self.lock:
+            for key in set(keys):
+                row = self.conn.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    found[key] = np.frombuffer(row[0], dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self.conn.commit()
+
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items.items()
+                ],
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used vectors beyond max_entries."""
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        self.conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+            (count - self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {**super().stats(), "entries": entries}
+
+
+class AnswerCache(SQLiteCache):
+    """
+    Semantic cache of generated answers.
+
+    Each entry stores the question embedding, the document filter, the model,
+    the answer payload and a fingerprint of every chunk the answer depends on.
+    A new question is served from the most similar entry at or above the
+    similarity threshold whose chunks still have the same fingerprints.
+    Entries are evicted least-recently-used first beyond `max_entries`, and
+    dropped as soon as one of their chunks is edited or found changed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            model TEXT NOT NULL,
+            question TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            chunks TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS answers_filename ON answers (filename, model);
+        CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at);
+        CREATE TABLE IF NOT EXISTS answer_chunks (
+            answer_id INTEGER NOT NULL,
+            chunk_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS answer_chunks_chunk ON answer_chunks (chunk_id);
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "answer_cache.sqlite3",
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+
+    def put(
+        self,
+        filename: str,
+        model: str,
+        question: str,
+        embedding: np.ndarray,
+        chunks: Dict[str, Dict[str, str]],
+        payload: Dict,
+    ) -> None:
+        """
+        Store an answer. `chunks` maps collection name to {chunk id: fingerprint}
+        for the chunks the answer was generated from.
+        """
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO answers (filename, model, question, embedding, chunks, payload, "
+                "created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    model,
+                    question,
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                    json.dumps(chunks),
+                    json.dumps(payload),
+                    now,
+                    now,
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO answer_chunks VALUES (?, ?)",
+                [
+                    (cursor.lastrowid, chunk_id)
+                    for ids in chunks.values()
+                    for chunk_id in ids
+                ],
+            )
+            self._evict()
+            self.conn.commit()
+
+    def lookup(
+        self,
+        filename: str,
+        model: str,
+        embedding: np.ndarray,
+        threshold: float,
+        is_current: Callable[[Dict[str, Dict[str, str]]], bool],
+    ) -> Optional[Dict]:
+        """
+        Return the payload of the most similar valid entry, with its `similarity`.
+
+        `is_current` is called with an entry's chunk fingerprints and must return
+        whether they still match the store; entries that do not are deleted.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, embedding, chunks, payload FROM answers "
+                "WHERE filename = ? AND model = ?",
+                (filename, model),
+            ).fetchall()
+
+        candidates = []
+        for id, vector, chunks, payload in rows:
+            vector = np.frombuffer(vector, dtype=np.float32)
+            similarity = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+            if similarity >= threshold:
+                candidates.append((similarity, id, chunks, payload))
+
+        for similarity, id, chunks, payload in sorted(candidates, reverse=True):
+            if not is_current(json.loads(chunks)):
+                self._delete([id])
+                continue
+
+            with self.lock:
+                self.conn.execute(
+                    "UPDATE answers SET accessed_at = ? WHERE id = ?", (time.time(), id)
+                )
+                self.conn.commit()
+            self.hits += 1
+            return {**json.loads(payload), "similarity": similarity}
+
+        self.misses += 1
+        return None
+
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Drop every answer that depends on one of the chunks; returns how many."""
+        with self.lock:
+            ids = [
+                row[0]
+                for chunk_id in chunk_ids
+                for row in self.conn.execute(
+                    "SELECT answer_id FROM answer_chunks WHERE chunk_id = ?", (chunk_id,)
+                )
+            ]
+        self._delete(ids)
+        return len(set(ids))
+
+    def _delete(self, ids: List[int]) -> None:
+        with self.lock:
+            self.conn.executemany("DELETE FROM answers WHERE id = ?", [(id,) for id in ids])
+            self.conn.executemany(
+                "DELETE FROM answer_chunks WHERE answer_id = ?", [(id,) for id in ids]
+            )
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used answers beyond max_entries."""
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count <= self.max_entries:
+            return
+        victims = self.conn.execute(
+            "SELECT id FROM answers ORDER BY accessed_at LIMIT ?",
+            (count - self.max_entries,),
+        ).fetchall()
+        self.conn.executemany("DELETE FROM answers WHERE id = ?", victims)
+        self.conn.executemany("DELETE FROM answer_chunks WHERE answer_id = ?", victims)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return {**super().stats(), "entries": entries}
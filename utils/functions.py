@@ -21,11 +21,27 @@ def find_images(md: str) -> Iterable[Dict]:
         yield {"link": match.group(1), "index": match.start()}
 
 
+def image_mime_type(path: Union[str, pathlib.Path]) -> str:
+    """
+    Guess the MIME type of an image file from its extension.
+    Args:
+        path (Union[str, pathlib.Path]): The path to the image file.
+    Returns:
+        str: The MIME type, defaulting to image/png.
+    """
+
+    import mimetypes
+
+    mime_type, _ = mimetypes.guess_type(str(path))
+    return mime_type if mime_type and mime_type.startswith("image/") else "image/png"
+
+
 def encode_image(path: Union[str, pathlib.Path], prefix: bool = False) -> str:
     """
     Encode an image file to a base64 string.
     Args:
         path (Union[str, pathlib.Path]): The path to the image file.
+        prefix (bool): Whether to return a data URL instead of the bare base64 string.
     Returns:
         str: The base64 encoded string of the image.
     """
@@ -33,12 +49,8 @@ def encode_image(path: Union[str, pathlib.Path], prefix: bool = False) -> str:
     import base64
 
     with open(path, "rb") as f:
-        # return f"data:image/png;base64,{base64.b64encode(f.read()).decode('utf-8')}"
-        return (
-            f"{base64.b64encode(f.read()).decode('utf-8')}"
-            if not prefix
-            else f"data:image/png;base64,{base64.b64encode(f.read()).decode('utf-8')}"
-        )
+        encoded = base64.b64encode(f.read()).decode("utf-8")
+    return f"data:{image_mime_type(path)};base64,{encoded}" if prefix else encoded
 
 
 def form_text(text: str) -> Dict[str, str]:
@@ -50,5 +62,17 @@ def form_image(path: Union[str, pathlib.Path]) -> Dict[str, str]:
         "type": "image",
         "source_type": "base64",
         "data": encode_image(path),
-        "mime_type": "image/png",
+        "mime_type": image_mime_type(path),
+    }
+
+
+def form_image_bytes(data: bytes, mime_type: str) -> Dict[str, str]:
+    """Form an image message part from an already encoded image payload."""
+    import base64
+
+    return {
+        "type": "image",
+        "source_type": "base64",
+        "data": base64.b64encode(data).decode("utf-8"),
+        "mime_type": mime_type,
     }
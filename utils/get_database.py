@@ -1,11 +1,46 @@
+import time
+import threading
 import chromadb
 import numpy as np
 from .settings import *
+from .cache import AnswerCache, EmbeddingCache
+from .registry import COLLECTIONS, DocumentRegistry
+from .tables import TableStore
+from .lexical import LexicalIndex
+from typing import Callable, Dict, List, Optional
 from chromadb import Documents, Embeddings, EmbeddingFunction, Collection
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 from langchain_ollama import OllamaEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-storage = chromadb.PersistentClient("database/storage")
+# Guards the lazy creation of the process-wide resources below, which are
+# shared by every Streamlit session (each running in its own thread)
+_resource_lock = threading.RLock()
+
+_storage = None
+
+
+def get_storage() -> chromadb.ClientAPI:
+    """
+    Get the process-wide Chroma client, opening the persistent store on first use.
+
+    The client is created lazily so that processes which never touch Chroma
+    (such as ingestion workers) do not open the store.
+    """
+    global _storage
+    if _storage is None:
+        with _resource_lock:
+            if _storage is None:
+                _storage = chromadb.PersistentClient(STORAGE_PATH)
+    return _storage
+
+
+# Collections embed with Chroma's default model; it is set explicitly so that
+# write-time embeddings (served from the cache) match query-time embeddings.
+embedding_function = DefaultEmbeddingFunction()
+EMBEDDING_FUNCTION_NAME = "chroma-default/all-MiniLM-L6-v2"
+
+embedding_cache = EmbeddingCache()
 
 
 class MultiModalEmbedding(EmbeddingFunction):
@@ -20,21 +55,260 @@ class MultiModalEmbedding(EmbeddingFunction):
         return [np.asarray(embedding) for embedding in embeddings]
 
 
+_collections: Dict[str, Collection] = {}
+
+
 def get_database(name: str) -> Collection:
     """
     Get a ChromaDB collection by name, creating it if it doesn't exist.
 
+    Handles are cached per process, so only the first call for a collection
+    reaches the store.
+
     Args:
         name (str): The name of the collection to retrieve or create.
 
     Returns:
         Collection: The ChromaDB collection.
     """
-    return storage.get_or_create_collection(name=name)
+    collection = _collections.get(name)
+    if collection is None:
+        with _resource_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_storage().get_or_create_collection(
+                    name=name, embedding_function=embedding_function
+                )
+                _collections[name] = collection
+    return collection
+
+
+_registry = None
+
+
+def get_document_registry() -> DocumentRegistry:
+    """
+    Get the process-wide document registry.
+
+    A registry that is still empty while the collections already hold chunks
+    is filled from their metadata once, so stores ingested before the registry
+    existed keep working.
+
+    Returns:
+        DocumentRegistry: The document catalog.
+    """
+    global _registry
+    if _registry is None:
+        with _resource_lock:
+            if _registry is None:
+                registry = DocumentRegistry()
+                if registry.is_empty():
+                    registry.rebuild({name: get_database(name) for name in COLLECTIONS})
+                _registry = registry
+    return _registry
+
+
+_table_store = None
+
+
+def get_table_store() -> TableStore:
+    """
+    Get the process-wide store of parsed document tables.
+
+    Returns:
+        TableStore: The structured table side-store.
+    """
+    global _table_store
+    if _table_store is None:
+        with _resource_lock:
+            if _table_store is None:
+                _table_store = TableStore()
+    return _table_store
+
+
+_lexical_index = None
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Get the process-wide BM25 index over the collections.
+
+    An index that is still empty while the collections already hold chunks
+    is built from them once, so stores ingested before it existed keep working.
+
+    Returns:
+        LexicalIndex: The lexical index.
+    """
+    global _lexical_index
+    if _lexical_index is None:
+        with _resource_lock:
+            if _lexical_index is None:
+                index = LexicalIndex()
+                if index.is_empty():
+                    index.rebuild({name: get_database(name) for name in COLLECTIONS})
+                _lexical_index = index
+    return _lexical_index
+
+
+_answer_cache = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Get the process-wide semantic answer cache.
+
+    Returns:
+        AnswerCache: The cache of generated answers.
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        with _resource_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def count_document_chunks(filename: str) -> Dict[str, int]:
+    """Count the chunks stored for a document in each collection."""
+    return {
+        name: len(get_database(name).get(where={"filename": filename}, include=[])["ids"])
+        for name in COLLECTIONS
+    }
+
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Embed a query with the collection embedding function.
+
+    The vector can be passed as `query_embeddings` to any collection, so one
+    question is embedded once no matter how many collections are searched.
+
+    Args:
+        text (str): The query text.
+
+    Returns:
+        np.ndarray: The query vector.
+    """
+    return np.asarray(embedding_function([text])[0], dtype=np.float32)
+
+
+def embed_documents(documents: List[str]) -> List[np.ndarray]:
+    """
+    Embed documents with the collection embedding function, reusing cached
+    vectors for text that has been embedded before.
+
+    Args:
+        documents (List[str]): The texts to embed.
+
+    Returns:
+        List[np.ndarray]: One vector per document, in input order.
+    """
+    keys = [
+        EmbeddingCache.make_key(EMBEDDING_FUNCTION_NAME, document)
+        for document in documents
+    ]
+    vectors = embedding_cache.get_many(keys)
+
+    missing = {}
+    for key, document in zip(keys, documents):
+        if key not in vectors:
+            missing.setdefault(key, document)
+
+    if missing:
+        computed = embedding_function(list(missing.values()))
+        new_vectors = {
+            key: np.asarray(vector, dtype=np.float32)
+            for key, vector in zip(missing.keys(), computed)
+        }
+        embedding_cache.put_many(new_vectors)
+        vectors.update(new_vectors)
+
+    return [vectors[key] for key in keys]
+
+
+class BatchWriter:
+    """
+    Buffer chunk writes for a collection and flush them in bulk.
+
+    Every flush is a single `collection.add` call whose vectors come from one
+    `embed_documents` call, so a batch costs at most one embedding-function
+    call and unchanged chunks reuse their cached vectors. `on_flush` is called
+    with the ids, documents and metadatas of every batch once it has been written.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        batch_size: int = INGEST_BATCH_SIZE,
+        on_flush: Optional[Callable[[List[str], List[str], List[Dict]], None]] = None,
+    ):
+        self.collection = collection
+        self.on_flush = on_flush
+        self.batch_size = max(1, min(batch_size, get_storage().get_max_batch_size()))
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+
+        self.written = 0
+        self.flushes = 0
+        self.started_at = time.perf_counter()
+
+    def add(self, id: str, document: str, metadata: Dict) -> None:
+        """Queue one chunk, flushing when the buffer reaches the batch size."""
+        self.ids.append(id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+
+        if len(self.ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all buffered chunks and return how many were sent."""
+        if not self.ids:
+            return 0
+
+        # Chroma rejects a batch containing duplicate ids, whereas single adds
+        # silently ignored repeats; keep the first occurrence to match that.
+        seen = set()
+        ids, documents, metadatas = [], [], []
+        for id, document, metadata in zip(self.ids, self.documents, self.metadatas):
+            if id in seen:
+                continue
+            seen.add(id)
+            ids.append(id)
+            documents.append(document)
+            metadatas.append(metadata)
+
+        self.ids, self.documents, self.metadatas = [], [], []
+
+        self.collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embed_documents(documents),
+        )
+        self.written += len(ids)
+        self.flushes += 1
+
+        if self.on_flush is not None:
+            self.on_flush(ids, documents, metadatas)
+        return len(ids)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of chunks written and the write throughput."""
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "chunks": self.written,
+            "flushes": self.flushes,
+            "seconds": elapsed,
+            "chunks_per_sec": self.written / elapsed if elapsed > 0 else 0.0,
+        }
+
 
 def get_text_splitter(chunk_size: int = 2000, chunk_overlap: int = 500):
     return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
-    )
\ No newline at end of file
+    )
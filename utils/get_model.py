@@ -1,13 +1,34 @@
+import re
+import threading
+import httpx
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
 from langchain_ollama.chat_models import ChatOllama
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
 from langchain_core.runnables import Runnable, RunnableWithMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from pydantic import BaseModel, Field
-from typing import List, Dict
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    AIMessage,
+    SystemMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Iterator, List, Dict, Optional
+from .cache import LRUCache
+from .router import get_router
+from .sessions import SessionBackend, SessionStore
+from .tokens import count_tokens, truncate_to_tokens
 from .settings import *
 
+logger = getLogger(__name__)
+
 # Default parameter values for LLM configuration
 DEFAULT_PARAMETERS = {
     "temperature": 0.7,    # Range: 0.0 - 2.0, controls randomness
@@ -20,25 +41,116 @@ class InMemoryChatMessageHistory(BaseChatMessageHistory, BaseModel):
     """
     In-memory implementation of chat message history.
     Stores messages for a conversation session.
+
+    Besides the full message log, a session keeps the sources cited in its
+    answers (once per chunk id) and a rolling summary of the turns that have
+    dropped out of the prompt window; see BoundedChatHistory.
+
+    Histories with a session id are written through to the session backend
+    on every change, so the in-memory copy can be dropped at any time. New
+    messages are appended to the backend one by one, and backend writes
+    happen outside the history's lock, so prompt reads never wait on storage.
     """
+    session_id: str = ""
     messages: List[BaseMessage] = Field(default_factory=list)
+    # chunk_id -> rendered source, least recently cited first
+    sources: Dict[str, str] = Field(default_factory=dict)
+    summary: str = ""
+    # Number of conversation messages folded into the summary
+    summarized: int = 0
+
+    # Guards the fields against concurrent reads, summarization and
+    # serialization; backend writes of this history are serialized separately
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    _write_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def lock(self):
+        return self._lock
 
     def add_message(self, message: BaseMessage) -> None:
         """Add a message to the store"""
-        self.messages.append(message)
+        with self._write_lock:
+            with self._lock:
+                self.messages.append(message)
+                position = len(self.messages) - 1
+            if self.session_id:
+                get_session_backend().append_messages(
+                    self.session_id, position, messages_to_dict([message])
+                )
 
     def clear(self) -> None:
         """Clear all messages"""
-        self.messages = []
+        with self._lock:
+            self.messages = []
+            self.sources = {}
+            self.summary = ""
+            self.summarized = 0
+        self._write(include_messages=True)
+
+    def save(self) -> None:
+        """Write the sources and summary through to the session backend"""
+        self._write(include_messages=False)
+
+    def _write(self, include_messages: bool) -> None:
+        if not self.session_id:
+            return
+        with self._write_lock:
+            # Snapshot under the lock, write outside it
+            with self._lock:
+                data = {
+                    "sources": dict(self.sources),
+                    "summary": self.summary,
+                    "summarized": self.summarized,
+                }
+                if include_messages:
+                    data["messages"] = messages_to_dict(self.messages)
+            get_session_backend().put_history(self.session_id, data)
 
+    @classmethod
+    def load(cls, session_id: str, data: Dict) -> "InMemoryChatMessageHistory":
+        return cls(
+            session_id=session_id,
+            messages=messages_from_dict(data["messages"]),
+            sources=data["sources"],
+            summary=data["summary"],
+            summarized=data["summarized"],
+        )
 
-# Global store for all session histories
-_session_store = {}
+    def turns(self) -> List[BaseMessage]:
+        """The user and assistant messages of the conversation"""
+        with self._lock:
+            return [m for m in self.messages if isinstance(m, (HumanMessage, AIMessage))]
+
+# Hot session histories; the session backend holds every session
+_session_cache = LRUCache(SESSION_CACHE_SIZE)
+_session_load_lock = threading.Lock()
+_session_backend: Optional[SessionBackend] = None
+
+
+def get_session_backend() -> SessionBackend:
+    """Get the process-wide session backend (SQLite unless another was set)"""
+    global _session_backend
+    if _session_backend is None:
+        with _session_load_lock:
+            if _session_backend is None:
+                _session_backend = SessionStore()
+    return _session_backend
+
+
+def set_session_backend(backend: SessionBackend) -> None:
+    """Store sessions in another backend; histories cached so far are dropped"""
+    global _session_backend
+    _session_backend = backend
+    _session_cache.clear()
 
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
     """
     Retrieve or create chat history for a given session ID.
+
+    Recently used histories are served from a bounded in-memory LRU; others
+    are loaded from the session backend on first use.
     
     Args:
         session_id: Unique identifier for the chat session
@@ -46,9 +158,93 @@ def get_session_history(session_id: str) -> BaseChatMessageHistory:
     Returns:
         Chat message history for the session
     """
-    if session_id not in _session_store:
-        _session_store[session_id] = InMemoryChatMessageHistory()
-    return _session_store[session_id]
+    history = _session_cache.get(session_id)
+    if history is None:
+        backend = get_session_backend()
+        with _session_load_lock:
+            history = _session_cache.get(session_id)
+            if history is None:
+                data = backend.get_history(session_id)
+                history = (
+                    InMemoryChatMessageHistory.load(session_id, data)
+                    if data
+                    else InMemoryChatMessageHistory(session_id=session_id)
+                )
+                _session_cache.put(session_id, history)
+    return history
+
+
+def delete_session_history(session_id: str) -> None:
+    """Remove a session from memory and from the session backend"""
+    _session_cache.pop(session_id)
+    get_session_backend().delete(session_id)
+
+
+class BoundedChatHistory(BaseChatMessageHistory):
+    """
+    Prompt-side view of a session history with a token ceiling.
+
+    The model sees, within HISTORY_MAX_TOKENS:
+    - the rolling summary of older turns,
+    - the latest turns verbatim (newest first until the ceiling),
+    - the sources cited earlier, each chunk once, most recently cited first.
+    New messages are written through to the full session history.
+    """
+
+    def __init__(self, history: InMemoryChatMessageHistory, model: str = CHAT_MODEL):
+        self.history = history
+        self.model = model
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        remaining = HISTORY_MAX_TOKENS
+        with self.history.lock:
+            summary, summarized = self.history.summary, self.history.summarized
+            turns = self.history.turns()[summarized:]
+            cited = list(self.history.sources.values())
+
+        prefix = []
+        if summary:
+            prefix.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+            remaining -= count_tokens(summary, self.model)
+
+        # Turns not yet covered by the summary, newest first; the last
+        # exchange is always kept
+        recent = []
+        for message in reversed(turns):
+            cost = count_tokens(message.content, self.model)
+            if cost > remaining and len(recent) >= 2:
+                break
+            recent.insert(0, message)
+            remaining -= cost
+
+        sources = []
+        for rendered in reversed(cited):
+            cost = count_tokens(rendered, self.model)
+            if cost > remaining:
+                continue
+            sources.append(rendered)
+            remaining -= cost
+        if sources:
+            prefix.append(
+                SystemMessage(
+                    content="Sources referenced earlier in this conversation:\n\n"
+                    + "\n\n".join(sources)
+                )
+            )
+
+        return prefix + recent
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.history.add_message(message)
+
+    def clear(self) -> None:
+        self.history.clear()
+
+
+def get_prompt_history(session_id: str) -> BaseChatMessageHistory:
+    """History factory of the model chains: the bounded view of a session"""
+    return BoundedChatHistory(get_session_history(session_id))
 
 
 def add_referenced_context_to_history(
@@ -57,82 +253,215 @@ def add_referenced_context_to_history(
     image_chunks: List[Dict]
 ) -> None:
     """
-    Add the RAG-retrieved context that AI referenced to the chat history.
+    Record the RAG-retrieved sources the AI cited in the session history.
     This allows the model to refer back to previously retrieved content in follow-up questions.
-    
-    Solution A: Save full referenced context without length limit.
-    The context is saved as a system message to distinguish it from user/AI messages.
-    
+
+    Each chunk is stored once by chunk id; citing it again only marks it as
+    recently used, so repeated sources do not grow the prompt.
+
     Args:
         session_id: Session identifier for the chat history
-        text_chunks: List of text chunks retrieved from RAG (with metadata)
-        image_chunks: List of image chunks retrieved from RAG (with metadata)
+        text_chunks: Text chunks cited in the answer (with metadata)
+        image_chunks: Image/table chunks cited in the answer (with metadata)
     """
     history = get_session_history(session_id)
-    
-    # Build a formatted context string with all retrieved sources
-    context_parts = []
-    
-    context_parts.append("=" * 50)
-    context_parts.append("REFERENCED CONTEXT FROM RAG RETRIEVAL")
-    context_parts.append("=" * 50)
-    context_parts.append("")
-    
-    # Add text chunks
-    if text_chunks:
-        context_parts.append("📄 TEXT SOURCES:")
-        context_parts.append("-" * 50)
-        for chunk in text_chunks:
-            citation_num = chunk.get("citation_num", "?")
-            content = chunk.get("content", "")
-            meta = chunk.get("metadata", {})
-            filename = meta.get("filename", "unknown")
-            page = meta.get("page_idx", "?")
-            chunk_type = meta.get("type", "text")
-            
-            context_parts.append(f"\n[Source {citation_num}]")
-            context_parts.append(f"File: {filename} | Page: {page} | Type: {chunk_type}")
-            context_parts.append(f"Content:\n{content}")
-            context_parts.append("-" * 50)
-    
-    # Add image/table chunks
-    if image_chunks:
-        context_parts.append("\n🖼️ IMAGE/TABLE SOURCES:")
-        context_parts.append("-" * 50)
-        for chunk in image_chunks:
-            citation_num = chunk.get("citation_num", "?")
-            meta = chunk.get("metadata", {})
-            filename = meta.get("filename", "unknown")
-            page = meta.get("page_idx", "?")
-            chunk_type = meta.get("type", "image")
-            path = meta.get("path", "")
-            
-            context_parts.append(f"\n[Source {citation_num}]")
-            context_parts.append(f"File: {filename} | Page: {page} | Type: {chunk_type}")
-            if path:
-                context_parts.append(f"Path: {path}")
-            context_parts.append("-" * 50)
-    
-    context_parts.append("")
-    context_parts.append("=" * 50)
-    context_parts.append("END OF REFERENCED CONTEXT")
-    context_parts.append("=" * 50)
-    
-    # Combine all parts into a single context string
-    full_context = "\n".join(context_parts)
-    
-    # Add as a system message to preserve it in history
-    context_message = SystemMessage(content=full_context)
-    history.add_message(context_message)
 
+    for chunk in text_chunks + image_chunks:
+        meta = chunk.get("metadata", {})
+        chunk_id = chunk.get("chunk_id") or f"{meta.get('filename')}:{meta.get('page_idx')}"
+        with history.lock:
+            rendered = history.sources.pop(chunk_id, None)
+        if rendered is None:
+            rendered = "\n".join(
+                filter(
+                    None,
+                    [
+                        f"File: {meta.get('filename', 'unknown')} | "
+                        f"Page: {meta.get('page_idx', '?')} | Type: {meta.get('type', 'text')}",
+                        chunk.get("content", ""),
+                    ],
+                )
+            )
+        with history.lock:
+            history.sources[chunk_id] = rendered
+    history.save()
+
+
+_summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant about technical documents.
+Keep the facts, figures, procedures and open questions that later questions may refer to. Reply with the summary only, at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def _summarize_turns(session_id: str) -> None:
+    history = get_session_history(session_id)
+    turns = history.turns()
+    # Fold whole exchanges that have left the last HISTORY_TURNS turns
+    fold_until = max(0, len(turns) - 2 * HISTORY_TURNS)
+    fold_until -= fold_until % 2
+    with history.lock:
+        summary, summarized = history.summary, history.summarized
+    if fold_until <= summarized:
+        return
+
+    transcript = "\n".join(
+        f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+        for m in turns[summarized:fold_until]
+    )
+    summarizer = get_chat_model(CHAT_MODEL, temperature=0, reasoning=False)
+    response = summarizer.invoke(
+        SUMMARY_PROMPT.format(
+            words=int(HISTORY_SUMMARY_TOKENS * 0.7),
+            summary=summary or "(none)",
+            messages=transcript,
+        )
+    )
+    new_summary = re.sub(r"<think>.*?</think>", "", response.content, flags=re.DOTALL).strip()
+    new_summary = truncate_to_tokens(new_summary, HISTORY_SUMMARY_TOKENS)
+
+    with history.lock:
+        # Another run may have advanced the summary meanwhile
+        if history.summarized != summarized:
+            return
+        history.summary, history.summarized = new_summary, fold_until
+    history.save()
+
+
+def compact_session_history(session_id: str) -> Future:
+    """
+    Fold turns older than the last HISTORY_TURNS into the session's rolling summary.
+
+    Runs in the background after a turn has been answered; until it
+    finishes, the prompt view simply keeps those turns verbatim. The summary
+    is updated incrementally, so each turn is summarized once.
+    """
+    def run():
+        try:
+            _summarize_turns(session_id)
+        except Exception as e:
+            logger.warning(f"History summarization failed for {session_id}: {e}")
+
+    return _summary_pool.submit(run)
+
+
+# One connection pool per Ollama server, shared by every model client of the process
+_transports: Dict[str, httpx.HTTPTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_client_kwargs(base_url: str = CHAT_API_URL, timeout: Optional[float] = None) -> Dict:
+    """
+    ChatOllama client arguments that reuse the process-wide connection pool to a server.
+
+    Every ChatOllama otherwise opens its own HTTP client, so each Streamlit
+    session and each model instance would hold separate connections.
+
+    Args:
+        base_url: Ollama server URL
+        timeout: Per-request HTTP timeout in seconds (None waits indefinitely)
+
+    Returns:
+        Keyword arguments for the ChatOllama constructor
+    """
+    with _transports_lock:
+        transport = _transports.get(base_url)
+        if transport is None:
+            transport = _transports[base_url] = httpx.HTTPTransport()
+
+    return {
+        "client_kwargs": {"timeout": timeout} if timeout else {},
+        "sync_client_kwargs": {"transport": transport},
+    }
+
+
+class RoutedChatOllama(BaseChatModel):
+    """
+    Chat model over a pool of Ollama servers.
+
+    Holds one identically configured ChatOllama per endpoint and lets the
+    router pick the endpoint for every call, failing over to the next one
+    when a server is down (streams only before their first chunk).
+    """
+
+    model: str
+    clients: Dict[str, ChatOllama]
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-ollama"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return get_router().call(
+            self.model,
+            lambda endpoint: self.clients[endpoint.url]._generate(
+                messages, stop, run_manager, **kwargs
+            ),
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from get_router().stream(
+            self.model,
+            lambda endpoint: self.clients[endpoint.url]._stream(
+                messages, stop, run_manager, **kwargs
+            ),
+        )
+
+
+def get_chat_model(model: str, timeout: Optional[float] = None, **params) -> BaseChatModel:
+    """
+    Create a chat model served by the Ollama endpoint pool (OLLAMA_BASE_URLS).
+
+    A single endpoint gets a plain ChatOllama; several get a RoutedChatOllama
+    balancing calls across them. Clients are keyed by the router's endpoint
+    URLs, which are what the router hands back on every call.
+
+    Args:
+        model: Model name to use
+        timeout: Per-request HTTP timeout in seconds (None waits indefinitely)
+        **params: Further ChatOllama parameters (temperature, reasoning, ...)
+
+    Returns:
+        Configured chat model
+    """
+    clients = {
+        endpoint.url: ChatOllama(
+            model=model,
+            base_url=endpoint.url,
+            **params,
+            **get_client_kwargs(endpoint.url, timeout),
+        )
+        for endpoint in get_router().endpoints
+    }
+    if len(clients) == 1:
+        return next(iter(clients.values()))
+    return RoutedChatOllama(model=model, clients=clients)
 
 
 def get_base_model(
     use_model: str = CHAT_MODEL,
     temperature: float = DEFAULT_PARAMETERS["temperature"],
     top_p: float = DEFAULT_PARAMETERS["top_p"],
-    top_k: int = DEFAULT_PARAMETERS["top_k"]
-) -> ChatOllama:
+    top_k: int = DEFAULT_PARAMETERS["top_k"],
+    timeout: Optional[float] = None
+) -> BaseChatModel:
     """
     Create a base ChatOllama model with configurable parameters.
     
@@ -141,16 +470,17 @@ def get_base_model(
         temperature: Controls randomness in output (0.0-2.0)
         top_p: Nucleus sampling parameter (0.0-1.0)
         top_k: Top-k sampling parameter (1-100)
+        timeout: Per-request HTTP timeout in seconds (None waits indefinitely)
     
     Returns:
-        Configured ChatOllama instance
+        Configured chat model (routed when several Ollama endpoints are configured)
     """
-    llm = ChatOllama(
-        model=use_model, 
-        base_url=CHAT_API_URL,
+    llm = get_chat_model(
+        use_model,
+        timeout,
         temperature=temperature,
         top_p=top_p,
-        top_k=top_k
+        top_k=top_k,
     )
     return llm
 
@@ -189,13 +519,12 @@ def get_prompted_model(
     ])
 
     
-    llm = ChatOllama(
-        model=use_model, 
-        base_url=CHAT_API_URL,
+    llm = get_chat_model(
+        use_model,
         temperature=temperature,
         top_p=top_p,
         top_k=top_k,
-        reasoning=True
+        reasoning=True,
     )
     
     chain = prompt | llm | StrOutputParser()
@@ -203,7 +532,7 @@ def get_prompted_model(
     # Wrap the chain with message history support
     chain_with_history = RunnableWithMessageHistory(
         chain,
-        get_session_history,
+        get_prompt_history,
         input_messages_key="question",
         history_messages_key="history",
     )
@@ -239,6 +568,16 @@ def validate_parameters(
     return True, ""
 
 
+# Chains hold no per-session state (history is looked up by session id), so
+# one chain per parameter tuple is shared by every session of the process
+_chain_cache = LRUCache(MODEL_CHAIN_CACHE_SIZE)
+
+
+def get_chain_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters of the model chain cache"""
+    return _chain_cache.stats()
+
+
 def get_prompted_model_with_params(
     use_model: str = CHAT_MODEL,
     temperature: float = DEFAULT_PARAMETERS["temperature"],
@@ -246,7 +585,11 @@ def get_prompted_model_with_params(
     top_k: int = DEFAULT_PARAMETERS["top_k"]
 ) -> Runnable:
     """
-    Create a prompted model with validated parameters.
+    Get a prompted model with validated parameters.
+
+    Chains are cached per (model, temperature, top_p, top_k), so switching
+    chats or moving a slider back to a previous value reuses the chain (and
+    its HTTP client) instead of constructing a new one.
     
     Args:
         use_model: Model name to use
@@ -264,5 +607,11 @@ def get_prompted_model_with_params(
     is_valid, error_msg = validate_parameters(temperature, top_p, top_k)
     if not is_valid:
         raise ValueError(f"Invalid parameter: {error_msg}")
-    
-    return get_prompted_model(use_model, temperature, top_p, top_k)
+
+    # Slider floats such as 0.30000000000000004 should share a chain with 0.3
+    key = (use_model, round(float(temperature), 4), round(float(top_p), 4), int(top_k))
+    chain = _chain_cache.get(key)
+    if chain is None:
+        chain = get_prompted_model(*key)
+        _chain_cache.put(key, chain)
+    return chain
@@ -0,0 +1,218 @@
+import io
+import math
+import pathlib
+import threading
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple, Union
+from .settings import *
+from .cache import ImageCache
+from .functions import image_mime_type
+
+logger = getLogger(__name__)
+
+
+def downscale_image(content: bytes, max_edge: int, quality: int) -> Tuple[bytes, str]:
+    """
+    Shrink an image so its longest edge is at most max_edge and re-encode it as JPEG.
+
+    Raises ImportError when Pillow is not installed.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(content)) as image:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)  # never upscales
+
+        # JPEG has no alpha channel: flatten transparent images onto white
+        if image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info
+        ):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def image_features(content: bytes, hash_size: int = 16) -> Dict:
+    """
+    Size, grayscale histogram entropy (bits) and difference hash of an image.
+
+    The dHash compares horizontally adjacent pixels of a (hash_size + 1) x
+    hash_size grayscale thumbnail, giving a hash_size**2-bit perceptual hash
+    that is stable under re-encoding and rescaling. Raises ImportError when
+    Pillow is not installed.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(content)) as image:
+        width, height = image.size
+        gray = image.convert("L")
+
+    histogram = gray.histogram()
+    pixels = sum(histogram)
+    entropy = -sum(
+        count / pixels * math.log2(count / pixels) for count in histogram if count
+    )
+
+    thumbnail = gray.resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+    dhash = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            left, right = thumbnail[offset + col], thumbnail[offset + col + 1]
+            dhash = (dhash << 1) | (left > right)
+
+    return {"width": width, "height": height, "entropy": entropy, "dhash": dhash}
+
+
+class ImageClassifier:
+    """
+    Decides which images of a document are worth a vision-model summary.
+
+    Tiny images (rules, bullets, spacers) and near-blank images are skipped.
+    An image whose perceptual hash is within `max_distance` bits of an earlier
+    image with the same aspect ratio is a duplicate (repeated logos, banners,
+    warning icons) and reuses that image's summary. Without Pillow every image
+    is summarized.
+    """
+
+    TOO_SMALL = "too_small"
+    LOW_ENTROPY = "low_entropy"
+    DUPLICATE = "duplicate"
+
+    def __init__(
+        self,
+        min_edge: int = IMAGE_MIN_EDGE,
+        min_entropy: float = IMAGE_MIN_ENTROPY,
+        max_distance: int = IMAGE_DEDUP_DISTANCE,
+    ):
+        self.min_edge = min_edge
+        self.min_entropy = min_entropy
+        self.max_distance = max_distance
+        self.enabled = True
+
+        # (dhash, aspect ratio, img_path) of every image kept so far
+        self.seen: List[Tuple[int, float, str]] = []
+
+    def _find_duplicate(self, dhash: int, aspect: float) -> Optional[str]:
+        for seen_hash, seen_aspect, img_path in self.seen:
+            if abs(aspect - seen_aspect) > 0.1 * max(aspect, seen_aspect):
+                continue
+            if bin(dhash ^ seen_hash).count("1") <= self.max_distance:
+                return img_path
+        return None
+
+    def classify(self, path: Union[str, pathlib.Path], img_path: str) -> Optional[Dict]:
+        """
+        Return why an image should not be summarized, or None to summarize it.
+
+        The result holds the skip `reason` and, for duplicates, the img_path
+        of the image whose summary covers it (`duplicate_of`).
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            features = image_features(pathlib.Path(path).read_bytes())
+        except ImportError:
+            logger.warning("Pillow is not installed; image deduplication is disabled")
+            self.enabled = False
+            return None
+        except Exception as e:
+            logger.warning(f"Could not classify {path}: {e}")
+            return None
+
+        if min(features["width"], features["height"]) < self.min_edge:
+            return {"reason": self.TOO_SMALL, "duplicate_of": None}
+        if features["entropy"] < self.min_entropy:
+            return {"reason": self.LOW_ENTROPY, "duplicate_of": None}
+
+        aspect = features["width"] / features["height"]
+        duplicate_of = self._find_duplicate(features["dhash"], aspect)
+        if duplicate_of is not None:
+            return {"reason": self.DUPLICATE, "duplicate_of": duplicate_of}
+
+        self.seen.append((features["dhash"], aspect, img_path))
+        return None
+
+
+class ImagePreprocessor:
+    """
+    Prepares image payloads for the vision model.
+
+    Images are downscaled to `max_edge` and re-encoded, keeping the original
+    whenever it is already smaller. Payloads are cached on disk by content
+    hash, so re-running a document does not decode its images again. Byte
+    counters report how much image data each document sends.
+    """
+
+    def __init__(
+        self,
+        max_edge: int = VISION_IMAGE_MAX_EDGE,
+        quality: int = VISION_IMAGE_QUALITY,
+        cache: ImageCache = None,
+    ):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.cache = (cache or ImageCache()) if max_edge > 0 else None
+
+        self.lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.prepared_bytes = 0
+        self.sent_images = 0
+        self.sent_bytes = 0
+
+    def prepare(self, path: Union[str, pathlib.Path]) -> Tuple[bytes, str]:
+        """Return the (payload, mime type) to send for an image file"""
+        content = pathlib.Path(path).read_bytes()
+        payload, mime_type = content, image_mime_type(path)
+
+        if self.max_edge > 0:
+            key = ImageCache.make_key(content, self.max_edge, self.quality)
+            cached = self.cache.get(key)
+            if cached is not None:
+                payload, mime_type = cached
+            else:
+                try:
+                    downscaled, downscaled_type = downscale_image(
+                        content, self.max_edge, self.quality
+                    )
+                    if len(downscaled) < len(content):
+                        payload, mime_type = downscaled, downscaled_type
+                    self.cache.put(key, payload, mime_type)
+                except ImportError:
+                    logger.warning("Pillow is not installed; sending original images")
+                    self.max_edge = 0
+                except Exception as e:
+                    logger.warning(f"Could not preprocess {path}, sending original: {e}")
+
+        with self.lock:
+            self.images += 1
+            self.original_bytes += len(content)
+            self.prepared_bytes += len(payload)
+        return payload, mime_type
+
+    def record_sent(self, payload: bytes) -> None:
+        """Count a payload that was actually sent to the vision model"""
+        with self.lock:
+            self.sent_images += 1
+            self.sent_bytes += len(payload)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            stats = {
+                "images": self.images,
+                "original_bytes": self.original_bytes,
+                "prepared_bytes": self.prepared_bytes,
+                "sent_images": self.sent_images,
+                "sent_bytes": self.sent_bytes,
+            }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
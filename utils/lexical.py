@@ -0,0 +1,292 @@
+import math
+import heapq
+import pathlib
+import regex
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Union
+from .cache import SQLiteStore
+from .settings import *
+
+if TYPE_CHECKING:
+    from chromadb import Collection
+
+# Alphanumeric runs, keeping codes such as "1.2.3", "X01-X40" or "RS485" whole
+TOKEN = regex.compile(r"[\p{L}\p{N}]+(?:[./+\-][\p{L}\p{N}]+)*")
+SEPARATORS = regex.compile(r"[./+\-]")
+
+
+def tokenize(text: str, split_compounds: bool = True) -> List[str]:
+    """
+    Lower-cased index terms of a text.
+
+    Compound codes are indexed both whole and by their parts, so "X01-X40"
+    matches queries for "X01-X40" as well as for "X01".
+    """
+    terms = []
+    for match in TOKEN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        parts = SEPARATORS.split(term)
+        if split_compounds and len(parts) > 1:
+            terms.extend(part for part in parts if part)
+    return terms
+
+
+def _is_identifier(word: str) -> bool:
+    """Codes and acronyms: words with a digit, or upper-case words ("RS485", "PSD")"""
+    return bool(regex.search(r"\p{N}", word)) or (word.isalpha() and word.isupper())
+
+
+def is_exact_token_query(question: str) -> bool:
+    """
+    Whether a question is just a few identifiers ("RS485", "PSD", "1.2.3"),
+    which lexical search answers better than dense similarity.
+    """
+    words = question.strip(" \t\n?!.,;:").split()
+    return 0 < len(words) <= 3 and all(_is_identifier(word) for word in words)
+
+
+def identifier_terms(question: str) -> List[str]:
+    """Identifiers mentioned in a question ("baud rate of RS485?" -> ["RS485"])"""
+    words = (word.strip("\"'()[]{}?!.,;:") for word in question.split())
+    return [word for word in words if len(word) > 1 and _is_identifier(word)]
+
+
+class LexicalIndex(SQLiteStore):
+    """
+    BM25 inverted index over the documents of the Chroma collections.
+
+    Only postings (clustered by term) and each chunk's length and document
+    name are kept on disk; the text and metadata of the top hits are read
+    back from Chroma by the caller. Ingestion and the chunk viewer update the
+    index alongside every write and delete.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            collection TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (collection, chunk_id)
+        );
+        CREATE INDEX IF NOT EXISTS docs_filename ON docs (filename);
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            collection TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (term, collection, chunk_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_chunk ON postings (collection, chunk_id);
+    """
+
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "lexical.sqlite3",
+    ):
+        super().__init__(path)
+
+        # An index from before documents were left to Chroma is dropped; being
+        # empty, it is rebuilt from the collections by get_lexical_index
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(docs)")}
+        if "document" in columns:
+            self.conn.executescript("DROP TABLE docs; DROP TABLE postings;" + self.SCHEMA)
+            self.conn.commit()
+
+    def _delete(self, collection: str, ids: List[str]) -> None:
+        pairs = [(collection, id) for id in ids]
+        self.conn.executemany(
+            "DELETE FROM postings WHERE collection = ? AND chunk_id = ?", pairs
+        )
+        self.conn.executemany(
+            "DELETE FROM docs WHERE collection = ? AND chunk_id = ?", pairs
+        )
+
+    def add(
+        self,
+        collection: str,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict],
+    ) -> None:
+        """Index (or re-index) chunks of a collection."""
+        with self.lock:
+            self._delete(collection, ids)
+            for id, document, metadata in zip(ids, documents, metadatas):
+                counts = Counter(tokenize(document or ""))
+                self.conn.execute(
+                    "INSERT INTO docs VALUES (?, ?, ?, ?)",
+                    (collection, id, (metadata or {}).get("filename", ""), sum(counts.values())),
+                )
+                self.conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?, ?)",
+                    [(term, collection, id, tf) for term, tf in counts.items()],
+                )
+            self.conn.commit()
+
+    def remove(self, collection: str, ids: List[str]) -> None:
+        with self.lock:
+            self._delete(collection, ids)
+            self.conn.commit()
+
+    def remove_document(self, filename: str) -> None:
+        """Drop every chunk of a document from all collections."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT collection, chunk_id FROM docs WHERE filename = ?", (filename,)
+            ).fetchall()
+            self.conn.executemany(
+                "DELETE FROM postings WHERE collection = ? AND chunk_id = ?", rows
+            )
+            self.conn.execute("DELETE FROM docs WHERE filename = ?", (filename,))
+            self.conn.commit()
+
+    def _query_terms(self, query: str, collection: str) -> List[str]:
+        """
+        Terms to search for: a compound code is searched whole when it occurs
+        in the collection and by its parts otherwise.
+        """
+        terms = []
+        for term in tokenize(query, split_compounds=False):
+            parts = [part for part in SEPARATORS.split(term) if part]
+            if len(parts) > 1 and not self.conn.execute(
+                "SELECT 1 FROM postings WHERE term = ? AND collection = ? LIMIT 1",
+                (term, collection),
+            ).fetchone():
+                terms.extend(parts)
+            else:
+                terms.append(term)
+        return terms
+
+    def _frequent_terms(self, terms: Set[str], collection: str) -> Set[str]:
+        """
+        Terms occurring in more than LEXICAL_MAX_DF of the collection's chunks.
+        When every term that occurs is frequent, the rarest is still searched.
+        """
+        count = self.conn.execute(
+            "SELECT COUNT(*) FROM docs WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+        frequencies = {
+            term: self.conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE term = ? AND collection = ?",
+                (term, collection),
+            ).fetchone()[0]
+            for term in terms
+        }
+        present = {term for term, df in frequencies.items() if df}
+        frequent = {term for term in present if frequencies[term] > LEXICAL_MAX_DF * count}
+        if present and frequent == present:
+            frequent.discard(min(present, key=frequencies.get))
+        return frequent
+
+    def _contains(self, collection: str, chunk_id: str, terms: Set[str]) -> bool:
+        placeholders = ", ".join("?" for _ in terms)
+        found = self.conn.execute(
+            "SELECT COUNT(*) FROM postings WHERE collection = ? AND chunk_id = ? "
+            f"AND term IN ({placeholders})",
+            (collection, chunk_id, *terms),
+        ).fetchone()[0]
+        return found == len(terms)
+
+    def search(
+        self,
+        query: str,
+        collection: str,
+        n_results: int,
+        filename: Optional[str] = None,
+        exact: bool = False,
+    ) -> List[Dict]:
+        """
+        Top chunks of a collection by BM25 score, best first.
+
+        Terms found in more than LEXICAL_MAX_DF of the chunks are not scored,
+        which keeps common words from walking most of the postings. With
+        exact=True, only chunks containing every query term as written
+        (compound codes included) are returned; frequent terms are then
+        checked on the candidates only. Each hit is a dict with id and score.
+        """
+        document_filter = " AND d.filename = ?" if filename else ""
+        with self.lock:
+            terms = set(
+                tokenize(query, split_compounds=False)
+                if exact
+                else self._query_terms(query, collection)
+            )
+            if not terms:
+                return []
+
+            frequent = self._frequent_terms(terms, collection)
+            scored = terms - frequent
+
+            count, total_length = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs d "
+                f"WHERE d.collection = ?{document_filter}",
+                (collection, filename) if filename else (collection,),
+            ).fetchone()
+            if not count:
+                return []
+            average_length = total_length / count or 1.0
+
+            scores: Dict[str, float] = defaultdict(float)
+            matched: Dict[str, int] = defaultdict(int)
+            for term in scored:
+                postings = self.conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p "
+                    "JOIN docs d ON d.collection = p.collection AND d.chunk_id = p.chunk_id "
+                    f"WHERE p.term = ? AND p.collection = ?{document_filter}",
+                    (term, collection, filename) if filename else (term, collection),
+                ).fetchall()
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf, length in postings:
+                    norm = self.K1 * (1 - self.B + self.B * length / average_length)
+                    scores[chunk_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+                    matched[chunk_id] += 1
+
+            if not exact:
+                top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+            else:
+                candidates = sorted(
+                    ((id, score) for id, score in scores.items() if matched[id] == len(scored)),
+                    key=lambda item: item[1],
+                    reverse=True,
+                )
+                top = []
+                for chunk_id, score in candidates:
+                    if len(top) == n_results:
+                        break
+                    if not frequent or self._contains(collection, chunk_id, frequent):
+                        top.append((chunk_id, score))
+        return [{"id": chunk_id, "score": score} for chunk_id, score in top]
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone() is None
+
+    def rebuild(self, collections: Dict[str, "Collection"], batch_size: int = 1000) -> int:
+        """
+        Index every chunk of existing collections.
+
+        This is the one full scan needed to adopt a store that was filled
+        before the lexical index existed. Returns the number of chunks indexed.
+        """
+        indexed = 0
+        for name, collection in collections.items():
+            offset = 0
+            while True:
+                result = collection.get(
+                    include=["documents", "metadatas"], limit=batch_size, offset=offset
+                )
+                if not result["ids"]:
+                    break
+                self.add(name, result["ids"], result["documents"], result["metadatas"])
+                indexed += len(result["ids"])
+                offset += len(result["ids"])
+        return indexed
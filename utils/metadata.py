@@ -3,3 +3,16 @@ def format_metadata(path: str, page_idx: int):
         "path": path,
         "page_idx": page_idx,
     }
+
+
+def make_chunk_id(filename: str, chunk_type: str, page_idx: int, content: str) -> str:
+    """
+    Build a stable chunk id from the document name and the chunk content.
+
+    The same content always maps to the same id across runs and processes,
+    and ids never collide between documents.
+    """
+    import hashlib
+
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    return f"{filename}:{chunk_type}:{page_idx}:{digest}"
@@ -0,0 +1,199 @@
+import json
+import time
+import pathlib
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
+from .cache import SQLiteStore, hash_bytes
+from .settings import *
+
+if TYPE_CHECKING:
+    from chromadb import Collection
+
+COLLECTIONS = ("textdb", "imgdb")
+
+
+class DocumentRegistry(SQLiteStore):
+    """
+    Catalog of ingested documents.
+
+    One row per document holds its source checksums, chunk counts per
+    collection, ingest timestamp and the model versions used, so "which
+    documents exist" and "is this document processed" are answered without
+    scanning chunk metadata. Images that ingestion chose not to index
+    (decorative or duplicates) are listed per document alongside.
+
+    Each collection also has a version number that every writer bumps, so
+    caches of query results in other processes can tell when they are stale.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            filename TEXT PRIMARY KEY,
+            checksums TEXT NOT NULL,
+            textdb_chunks INTEGER NOT NULL,
+            imgdb_chunks INTEGER NOT NULL,
+            ingested_at REAL NOT NULL,
+            models TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS skipped_images (
+            filename TEXT NOT NULL,
+            img_path TEXT NOT NULL,
+            page_idx INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            duplicate_of TEXT,
+            PRIMARY KEY (filename, img_path, page_idx)
+        );
+        CREATE TABLE IF NOT EXISTS collection_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "registry.sqlite3",
+    ):
+        super().__init__(path)
+
+    def record(
+        self,
+        filename: str,
+        chunk_counts: Dict[str, int],
+        checksums: Optional[Dict[str, str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        skipped_images: Optional[List[Dict]] = None,
+    ) -> None:
+        """Insert or replace the catalog entry (and skipped images) of a document."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    json.dumps(checksums or {}),
+                    chunk_counts.get("textdb", 0),
+                    chunk_counts.get("imgdb", 0),
+                    time.time(),
+                    json.dumps(models or {}),
+                ),
+            )
+            self.conn.execute("DELETE FROM skipped_images WHERE filename = ?", (filename,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO skipped_images VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        filename,
+                        image["img_path"],
+                        image["page_idx"],
+                        image["reason"],
+                        image.get("duplicate_of"),
+                    )
+                    for image in skipped_images or []
+                ],
+            )
+            self.conn.commit()
+
+    def remove(self, filename: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+            self.conn.execute("DELETE FROM skipped_images WHERE filename = ?", (filename,))
+            self.conn.commit()
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """Return the catalog entry of a document, or None if it was never ingested."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        filename, checksums, textdb_chunks, imgdb_chunks, ingested_at, models = row
+        return {
+            "filename": filename,
+            "checksums": json.loads(checksums),
+            "chunk_counts": {
+                "textdb": textdb_chunks,
+                "imgdb": imgdb_chunks,
+                "total": textdb_chunks + imgdb_chunks,
+            },
+            "ingested_at": ingested_at,
+            "models": json.loads(models),
+        }
+
+    def is_processed(self, filename: str) -> bool:
+        return self.get(filename) is not None
+
+    def chunk_counts(self, filename: str) -> Dict[str, int]:
+        entry = self.get(filename)
+        if entry is None:
+            return {"textdb": 0, "imgdb": 0, "total": 0}
+        return entry["chunk_counts"]
+
+    def skipped_images(self, filename: str) -> List[Dict]:
+        """Images of a document that were not indexed, with the reason why."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT img_path, page_idx, reason, duplicate_of FROM skipped_images "
+                "WHERE filename = ? ORDER BY page_idx",
+                (filename,),
+            ).fetchall()
+        return [
+            {
+                "img_path": img_path,
+                "page_idx": page_idx,
+                "reason": reason,
+                "duplicate_of": duplicate_of,
+            }
+            for img_path, page_idx, reason, duplicate_of in rows
+        ]
+
+    def filenames(self) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename FROM documents ORDER BY filename"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def bump_version(self, *names: str) -> None:
+        """Record that the given collections have been modified."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO collection_versions VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+                [(name,) for name in names],
+            )
+            self.conn.commit()
+
+    def versions(self) -> Dict[str, int]:
+        """Current version of every collection (0 if never modified)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT name, version FROM collection_versions").fetchall()
+        return {**{name: 0 for name in COLLECTIONS}, **dict(rows)}
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    @staticmethod
+    def file_checksum(path: Union[str, pathlib.Path]) -> str:
+        return hash_bytes(pathlib.Path(path).read_bytes())
+
+    def rebuild(self, collections: Dict[str, "Collection"]) -> int:
+        """
+        Populate the catalog from chunk metadata of existing collections.
+
+        This is the one full scan needed to adopt a store that was filled
+        before the registry existed. Returns the number of documents found.
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        for name, collection in collections.items():
+            result = collection.get(include=["metadatas"])
+            for metadata in result["metadatas"]:
+                if metadata and metadata.get("filename"):
+                    document = counts.setdefault(
+                        metadata["filename"], {name: 0 for name in COLLECTIONS}
+                    )
+                    document[name] = document.get(name, 0) + 1
+
+        for filename, chunk_counts in counts.items():
+            self.record(filename, chunk_counts)
+        return len(counts)
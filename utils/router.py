@@ -0,0 +1,253 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, TypeVar
+import httpx
+from .settings import *
+
+T = TypeVar("T")
+
+
+def _model_key(model: str) -> str:
+    """Ollama model name with its implicit tag ("bge-m3" is "bge-m3:latest")"""
+    return model if ":" in model else f"{model}:latest"
+
+
+def is_model_missing(error: Exception) -> bool:
+    """Whether a call failed because the server does not have the model"""
+    return getattr(error, "status_code", None) == 404  # ollama.ResponseError
+
+
+def is_failover_error(error: Exception) -> bool:
+    """
+    Whether a failed call should be retried on another endpoint: the server
+    was unreachable, failed, or does not have the model.
+
+    Read and write timeouts are not retried: the server is up but busy, and
+    running the generation again elsewhere would only spread the overload.
+    """
+    if isinstance(error, (httpx.ReadTimeout, httpx.WriteTimeout)):
+        return False
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return is_model_missing(error) or (isinstance(status, int) and status >= 500)
+
+
+class Endpoint:
+    """Routing state of one Ollama server."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.in_flight = 0
+        # Models the server has (None until probed) and has loaded in memory,
+        # and models it answered 404 for since the last probe
+        self.available: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()
+        self.missing: Set[str] = set()
+        self.last_probe = 0.0
+        self.last_error = ""
+
+
+class OllamaRouter:
+    """
+    Load balancer over a pool of Ollama servers.
+
+    Each call goes to the healthy endpoint with the fewest requests in
+    flight. Endpoints that already have the model loaded are preferred; a
+    cold one counts as COLD_MODEL_PENALTY extra requests, since loading a
+    large model takes longer than waiting for a couple of generations.
+    Endpoints known not to have the model are skipped. A call to an
+    unreachable or failing server marks that endpoint unhealthy, and a 404
+    takes only the model off it; either way the call is retried on the next
+    candidate. A busy server that times out is not retried. A background
+    thread probes every endpoint periodically and brings recovered ones back.
+    """
+
+    COLD_MODEL_PENALTY = 2
+
+    def __init__(
+        self,
+        urls: List[str],
+        probe_interval: float = OLLAMA_PROBE_INTERVAL,
+        probe_timeout: float = OLLAMA_PROBE_TIMEOUT,
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama endpoint is required")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.probe_interval = probe_interval
+        self.http = httpx.Client(timeout=probe_timeout)
+
+        self.lock = threading.Lock()
+        self.turn = 0  # rotates ties between equally loaded endpoints
+        self.stopped = threading.Event()
+        self.prober: Optional[threading.Thread] = None
+
+    def start(self) -> "OllamaRouter":
+        """Probe all endpoints now and keep probing in the background"""
+        self.probe_all()
+        if self.prober is None:
+            self.prober = threading.Thread(target=self._run, name="ollama-probe", daemon=True)
+            self.prober.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.probe_interval):
+            self.probe_all()
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        """Refresh an endpoint's health and model lists; returns whether it is up"""
+        try:
+            tags = self.http.get(f"{endpoint.url}/api/tags")
+            tags.raise_for_status()
+            ps = self.http.get(f"{endpoint.url}/api/ps")
+            ps.raise_for_status()
+            available = {_model_key(m["name"]) for m in tags.json().get("models", [])}
+            loaded = {_model_key(m["name"]) for m in ps.json().get("models", [])}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            with self.lock:
+                endpoint.healthy = False
+                endpoint.last_error = str(e)
+            return False
+
+        with self.lock:
+            endpoint.healthy = True
+            endpoint.available = available
+            endpoint.loaded = loaded
+            endpoint.missing = set()
+            endpoint.last_probe = time.time()
+            endpoint.last_error = ""
+        return True
+
+    def probe_all(self) -> None:
+        for endpoint in self.endpoints:
+            self.probe(endpoint)
+
+    def candidates(self, model: str) -> List[Endpoint]:
+        """Endpoints to try for a model, best first; unhealthy ones come last"""
+        model = _model_key(model)
+        with self.lock:
+            self.turn += 1
+            count = len(self.endpoints)
+            order = {id(e): (i - self.turn) % count for i, e in enumerate(self.endpoints)}
+
+            pool = [e for e in self.endpoints if e.healthy] or list(self.endpoints)
+            having = [
+                e
+                for e in pool
+                if model not in e.missing and (e.available is None or model in e.available)
+            ]
+            pool = having or pool
+            ranked = sorted(
+                pool,
+                key=lambda e: (
+                    e.in_flight + (0 if model in e.loaded else self.COLD_MODEL_PENALTY),
+                    order[id(e)],
+                ),
+            )
+            return ranked + [e for e in self.endpoints if e not in ranked]
+
+    @contextmanager
+    def track(self, endpoint: Endpoint, model: str):
+        """Count a request against an endpoint while it runs"""
+        with self.lock:
+            endpoint.in_flight += 1
+            # The server loads the model to serve the request
+            endpoint.loaded.add(_model_key(model))
+        try:
+            yield endpoint
+        finally:
+            with self.lock:
+                endpoint.in_flight -= 1
+
+    def mark_failed(self, endpoint: Endpoint, model: str, error: Exception) -> None:
+        """
+        Record a failed call: a missing model only takes that model off the
+        endpoint, any other failure takes the endpoint down until a probe
+        succeeds.
+        """
+        with self.lock:
+            endpoint.last_error = str(error)
+            if is_model_missing(error):
+                model = _model_key(model)
+                endpoint.missing.add(model)
+                endpoint.loaded.discard(model)
+                if endpoint.available is not None:
+                    endpoint.available.discard(model)
+            else:
+                endpoint.healthy = False
+
+    def call(self, model: str, fn: Callable[[Endpoint], T]) -> T:
+        """Run `fn` against the best endpoint for a model, failing over on errors"""
+        error: Optional[Exception] = None
+        for endpoint in self.candidates(model):
+            with self.track(endpoint, model):
+                try:
+                    return fn(endpoint)
+                except Exception as e:
+                    if not is_failover_error(e):
+                        raise
+                    self.mark_failed(endpoint, model, e)
+                    error = e
+        raise error
+
+    def stream(self, model: str, fn: Callable[[Endpoint], Iterator[T]]) -> Iterator[T]:
+        """
+        Stream from the best endpoint for a model. A call that fails before
+        producing anything is retried on the next endpoint; once items have
+        been yielded, errors propagate.
+        """
+        error: Optional[Exception] = None
+        for endpoint in self.candidates(model):
+            with self.track(endpoint, model):
+                started = False
+                try:
+                    for item in fn(endpoint):
+                        started = True
+                        yield item
+                    return
+                except Exception as e:
+                    if started or not is_failover_error(e):
+                        raise
+                    self.mark_failed(endpoint, model, e)
+                    error = e
+        raise error
+
+    def stats(self) -> List[Dict]:
+        with self.lock:
+            return [
+                {
+                    "url": e.url,
+                    "healthy": e.healthy,
+                    "in_flight": e.in_flight,
+                    "loaded": sorted(e.loaded),
+                    "last_error": e.last_error,
+                }
+                for e in self.endpoints
+            ]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> OllamaRouter:
+    """
+    Get the process-wide router over OLLAMA_BASE_URLS.
+
+    Background probing only runs when there is more than one endpoint to
+    choose from.
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                router = OllamaRouter(OLLAMA_BASE_URLS)
+                if len(router.endpoints) > 1:
+                    router.start()
+                _router = router
+    return _router
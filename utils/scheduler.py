@@ -0,0 +1,204 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional
+from .settings import *
+
+
+class GenerationRejected(Exception):
+    """A generation request could not be started before its deadline."""
+
+
+class _Ticket:
+    __slots__ = ("session_id", "granted", "enqueued_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+def _percentile(values: Iterable[float], fraction: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of the chat model.
+
+    At most `max_concurrent` generations run at once. Waiting requests are
+    queued per session and sessions are served round-robin, so one user
+    sending several questions cannot starve the others. A request that is
+    not expected to start (or does not start) within `max_wait` seconds is
+    rejected with GenerationRejected instead of joining an ever-growing
+    backlog inside Ollama.
+    """
+
+    # Number of recent requests the wait and generation statistics cover
+    WINDOW = 1000
+
+    def __init__(
+        self,
+        max_concurrent: int = GENERATION_CONCURRENCY,
+        max_wait: float = GENERATION_MAX_WAIT,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_wait = max_wait
+
+        self.condition = threading.Condition()
+        self.queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self.active = 0
+
+        self.waits: Deque[float] = deque(maxlen=self.WINDOW)
+        self.generations: Deque[float] = deque(maxlen=self.WINDOW)
+        self.completed = 0
+        self.rejected = 0
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the head tickets of sessions, round-robin (lock held)"""
+        while self.active < self.max_concurrent and self.queues:
+            session_id, queue = next(iter(self.queues.items()))
+            ticket = queue.popleft()
+            ticket.granted = True
+            self.active += 1
+            # The session goes to the back of the rotation
+            del self.queues[session_id]
+            if queue:
+                self.queues[session_id] = queue
+        self.condition.notify_all()
+
+    def _position(self, ticket: _Ticket) -> int:
+        """1-based position of a waiting ticket in the round-robin order (lock held)"""
+        index = self.queues[ticket.session_id].index(ticket)
+        ahead = index + 1
+        before = True
+        for session_id, queue in self.queues.items():
+            if session_id == ticket.session_id:
+                before = False
+                continue
+            ahead += min(len(queue), index + 1 if before else index)
+        return ahead
+
+    def _expected_wait(self, position: int) -> float:
+        """Estimated seconds until a ticket at `position` starts (lock held)"""
+        if not self.generations:
+            return 0.0
+        average = sum(self.generations) / len(self.generations)
+        return position / self.max_concurrent * average
+
+    def _reject(self, ticket: _Ticket, reason: str) -> None:
+        """Withdraw a waiting ticket and raise (lock held)"""
+        queue = self.queues.get(ticket.session_id)
+        if queue is not None:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket.session_id]
+        self.rejected += 1
+        raise GenerationRejected(reason)
+
+    def acquire(
+        self,
+        session_id: str,
+        on_wait: Optional[Callable[[int], None]] = None,
+        max_wait: Optional[float] = None,
+    ) -> float:
+        """
+        Wait for a generation slot; returns the seconds spent queued.
+
+        `on_wait` is called with the queue position whenever it changes.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        ticket = _Ticket(session_id)
+        deadline = ticket.enqueued_at + max_wait
+        reported = None
+
+        with self.condition:
+            self.queues.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+
+            while not ticket.granted:
+                position = self._position(ticket)
+                if self._expected_wait(position) > max_wait:
+                    self._reject(
+                        ticket,
+                        f"{position} requests are ahead; the expected wait exceeds {max_wait:g}s",
+                    )
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject(ticket, f"no generation slot freed up within {max_wait:g}s")
+
+                if position != reported and on_wait is not None:
+                    reported = position
+                    # Release the lock while the caller updates its UI
+                    self.condition.release()
+                    try:
+                        on_wait(position)
+                    finally:
+                        self.condition.acquire()
+                    continue
+
+                self.condition.wait(timeout=min(remaining, 1.0))
+
+            waited = time.monotonic() - ticket.enqueued_at
+            self.waits.append(waited)
+        return waited
+
+    def release(self, generation_seconds: float) -> None:
+        with self.condition:
+            self.active -= 1
+            self.completed += 1
+            self.generations.append(generation_seconds)
+            self._dispatch()
+
+    def stream(
+        self,
+        session_id: str,
+        start: Callable[[], Iterable[str]],
+        on_wait: Optional[Callable[[int], None]] = None,
+        max_wait: Optional[float] = None,
+    ) -> Iterator[str]:
+        """
+        Run a streaming generation once admitted.
+
+        `start` opens the model stream; it is only called after a slot has
+        been granted, and the slot is held until the stream is exhausted or
+        closed.
+        """
+        self.acquire(session_id, on_wait, max_wait)
+        started = time.monotonic()
+        try:
+            yield from start()
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue and slot usage plus wait vs generation time over recent requests"""
+        with self.condition:
+            waits, generations = list(self.waits), list(self.generations)
+            return {
+                "active": self.active,
+                "queued": sum(len(queue) for queue in self.queues.values()),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95": _percentile(waits, 0.95),
+                "generation_avg": sum(generations) / len(generations) if generations else 0.0,
+                "generation_p95": _percentile(generations, 0.95),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """Get the process-wide generation scheduler shared by all chat sessions"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GenerationScheduler()
+    return _scheduler
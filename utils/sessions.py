@@ -0,0 +1,190 @@
+import json
+import time
+import pathlib
+from typing import Dict, List, Optional, Union
+from .cache import SQLiteStore
+from .settings import *
+
+
+class SessionBackend:
+    """
+    Durable tier of chat sessions.
+
+    Holds two kinds of records, both keyed by session id: the model-side
+    conversation history (messages, cited sources, rolling summary) and the
+    chat as shown in the UI (name, settings and rendered messages), grouped
+    per client. SessionStore is the SQLite implementation; a shared backend
+    (e.g. Redis or Postgres) can implement the same methods and be installed
+    with `get_model.set_session_backend`.
+    """
+
+    def get_history(self, session_id: str) -> Optional[Dict]:
+        """The history (messages, sources, summary, summarized), or None if unknown"""
+        raise NotImplementedError
+
+    def put_history(self, session_id: str, data: Dict) -> None:
+        """
+        Save the history state (sources, summary, summarized). Messages are
+        replaced only when `data` holds them; otherwise they are kept.
+        """
+        raise NotImplementedError
+
+    def append_messages(self, session_id: str, start: int, messages: List[Dict]) -> None:
+        """Store serialized messages at positions start, start + 1, ... of a history"""
+        raise NotImplementedError
+
+    def list_chats(self, client_id: str) -> List[Dict]:
+        """Chats of a client in display order, without their messages"""
+        raise NotImplementedError
+
+    def get_chat_messages(self, session_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def put_chat(self, client_id: str, position: int, chat: Dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        """Remove a session's history and chat"""
+        raise NotImplementedError
+
+
+class SessionStore(SQLiteStore, SessionBackend):
+    """
+    SQLite session backend, one row per session in each table.
+
+    History messages are stored one row each and only ever appended, so a
+    new message costs one small insert however long the conversation is.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS histories (
+            session_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS history_messages (
+            session_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            PRIMARY KEY (session_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS chats (
+            session_id TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            messages TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS chats_client ON chats (client_id, position);
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "sessions.sqlite3",
+    ):
+        super().__init__(path)
+
+    def get_history(self, session_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM histories WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            data = json.loads(row[0]) if row else None
+            if data is not None and "messages" in data:
+                # Saved before messages had their own rows: move them there
+                self._write_history(session_id, data)
+                self.conn.commit()
+            messages = self.conn.execute(
+                "SELECT message FROM history_messages WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        if data is None and not messages:
+            return None
+
+        data = data or {"sources": {}, "summary": "", "summarized": 0}
+        data["messages"] = [json.loads(message) for (message,) in messages]
+        return data
+
+    def put_history(self, session_id: str, data: Dict) -> None:
+        with self.lock:
+            self._write_history(session_id, data)
+            self.conn.commit()
+
+    def _write_history(self, session_id: str, data: Dict) -> None:
+        state = {key: value for key, value in data.items() if key != "messages"}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO histories VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time()),
+        )
+        if "messages" in data:
+            self.conn.execute("DELETE FROM history_messages WHERE session_id = ?", (session_id,))
+            self._insert_messages(session_id, 0, data["messages"])
+
+    def append_messages(self, session_id: str, start: int, messages: List[Dict]) -> None:
+        with self.lock:
+            self._insert_messages(session_id, start, messages)
+            self.conn.commit()
+
+    def _insert_messages(self, session_id: str, start: int, messages: List[Dict]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO history_messages VALUES (?, ?, ?)",
+            [
+                (session_id, start + i, json.dumps(message))
+                for i, message in enumerate(messages)
+            ],
+        )
+
+    def list_chats(self, client_id: str) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT session_id, name, settings FROM chats WHERE client_id = ? "
+                "ORDER BY position",
+                (client_id,),
+            ).fetchall()
+        return [
+            {"session_id": session_id, "name": name, **json.loads(settings)}
+            for session_id, name, settings in rows
+        ]
+
+    def get_chat_messages(self, session_id: str) -> List[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT messages FROM chats WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def put_chat(self, client_id: str, position: int, chat: Dict) -> None:
+        """
+        Save a chat. Messages are only written when present in `chat`, so
+        metadata updates of a chat that is not loaded keep its stored messages.
+        """
+        settings = {
+            key: chat[key] for key in ("parameters", "selected_file") if key in chat
+        }
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO chats VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET position = excluded.position, "
+                "name = excluded.name, settings = excluded.settings, "
+                "updated_at = excluded.updated_at"
+                + (", messages = excluded.messages" if "messages" in chat else ""),
+                (
+                    chat["session_id"],
+                    client_id,
+                    position,
+                    chat["name"],
+                    json.dumps(settings),
+                    json.dumps(chat.get("messages", [])),
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM histories WHERE session_id = ?", (session_id,))
+            self.conn.execute("DELETE FROM history_messages WHERE session_id = ?", (session_id,))
+            self.conn.execute("DELETE FROM chats WHERE session_id = ?", (session_id,))
+            self.conn.commit()
@@ -3,6 +3,16 @@ import os
 PORT = 11436
 CHAT_API_URL = os.getenv("OLLAMA_BASE_URL", f"http://localhost:{PORT}")
 
+# Pool of Ollama servers (comma-separated) that chat and vision model calls are
+# balanced over, and how often (seconds) their health is probed
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("OLLAMA_BASE_URLS", CHAT_API_URL).split(",")
+    if url.strip().rstrip("/")
+]
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", "15"))
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", "2"))
+
 CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "qwen3:30b")  
 # qwen3:30b
 
@@ -11,3 +21,80 @@ VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "qwen2.5vl:7b")
 # llava
 # qwen2.5vl,  BUT IT'S GONE???
 EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "bge-m3:latest")
+
+
+# Directory holding the Chroma store and ingestion caches
+STORAGE_PATH = os.getenv("STORAGE_PATH", "database/storage")
+
+# Number of chunks buffered per Chroma write (and per embedding call) during ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+# Vision summarization: number of requests kept in flight and per-request timeout (seconds)
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "300"))
+
+# Upper bound on the on-disk vision summary cache (bytes of stored summary text)
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Maximum number of vectors kept in the on-disk embedding cache
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Images sent to the vision model are downscaled to this longest edge (pixels) and
+# re-encoded; 0 sends the original files unchanged
+VISION_IMAGE_MAX_EDGE = int(os.getenv("VISION_IMAGE_MAX_EDGE", "1024"))
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+
+# Upper bound on the on-disk cache of preprocessed image payloads (bytes)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Ingest-time image filtering: images with an edge below IMAGE_MIN_EDGE pixels or a
+# grayscale entropy below IMAGE_MIN_ENTROPY bits are skipped as decorative, and
+# images within IMAGE_DEDUP_DISTANCE bits (of a 256-bit dHash) of an earlier image
+# of the same document reuse its summary instead of being indexed again
+IMAGE_MIN_EDGE = int(os.getenv("IMAGE_MIN_EDGE", "16"))
+IMAGE_MIN_ENTROPY = float(os.getenv("IMAGE_MIN_ENTROPY", "0.5"))
+IMAGE_DEDUP_DISTANCE = int(os.getenv("IMAGE_DEDUP_DISTANCE", "8"))
+
+# In-memory retrieval cache: entries per process and time-to-live (seconds).
+# Entries are also invalidated whenever a collection is modified
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+
+# Lexical (BM25) search skips query terms found in more than this fraction of
+# a collection's chunks; a query made only of such terms is scored by its rarest
+LEXICAL_MAX_DF = float(os.getenv("LEXICAL_MAX_DF", "0.5"))
+
+# Token budget of the reference sources placed in each chat prompt; chunks are
+# added by relevance and kept whole while they fit
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "3000"))
+
+# Conversation memory replayed to the model: turns kept verbatim, token ceiling
+# of the replayed history, and size of the rolling summary of older turns
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "4"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "3000"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+
+# Chat sessions whose history is kept in memory per process; colder sessions
+# are read back from the session store on demand
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+
+# Chat generations run concurrently against Ollama per process (two per
+# endpoint by default), and the longest a request may wait for a slot
+# (seconds) before it is rejected
+GENERATION_CONCURRENCY = int(
+    os.getenv("GENERATION_CONCURRENCY", str(2 * len(OLLAMA_BASE_URLS)))
+)
+GENERATION_MAX_WAIT = float(os.getenv("GENERATION_MAX_WAIT", "120"))
+
+# Minimum seconds between redraws of a streaming answer in the chat UI
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.1"))
+
+# Constructed chat chains kept per process, one per (model, temperature, top_p, top_k)
+MODEL_CHAIN_CACHE_SIZE = int(os.getenv("MODEL_CHAIN_CACHE_SIZE", "32"))
+
+# Opt-in semantic answer cache: answers are reused for questions whose embedding
+# has at least ANSWER_CACHE_THRESHOLD cosine similarity to a cached question
+# (same document filter, cited chunks unchanged)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
@@ -0,0 +1,312 @@
+import json
+import pathlib
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Union
+from .cache import SQLiteStore
+from .metadata import make_chunk_id
+from .settings import *
+
+
+class _TableHTMLParser(HTMLParser):
+    """
+    Collect the cell text of an HTML table, row by row, with span attributes.
+
+    A cell is closed by the next cell or row even without its end tag, as
+    browsers do. Tables nested inside a cell only contribute their text to it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[Dict]] = []
+        self.cell: Optional[Dict] = None
+        self.depth = 0  # open <table> tags
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth > 1 and tag in ("tr", "td", "th", "br"):
+            self.handle_data(" ")
+        elif tag == "table":
+            if self.depth and self.cell is not None:
+                self.handle_data(" ")
+            self.depth += 1
+        elif tag == "tr":
+            self._close_cell()
+            self.rows.append([])
+        elif tag in ("td", "th"):
+            self._close_cell()
+            if not self.rows:
+                self.rows.append([])
+            attrs = dict(attrs)
+            self.cell = {
+                "text": [],
+                "rowspan": _span(attrs.get("rowspan")),
+                "colspan": _span(attrs.get("colspan")),
+            }
+        elif tag == "br":
+            self.handle_data(" ")
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            self.depth = max(0, self.depth - 1)
+            if self.depth:
+                self.handle_data(" ")
+            else:
+                self._close_cell()
+        elif self.depth > 1:
+            if tag in ("tr", "td", "th"):
+                self.handle_data(" ")
+        elif tag in ("td", "th", "tr"):
+            self._close_cell()
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell["text"].append(data)
+
+    def close(self):
+        super().close()
+        self._close_cell()
+
+    def _close_cell(self):
+        if self.cell is not None:
+            self.rows[-1].append(self.cell)
+            self.cell = None
+
+
+def _span(value: Optional[str]) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def parse_table(html: str) -> List[List[str]]:
+    """
+    Parse an HTML table (as produced by MinerU) into a grid of cell texts.
+
+    Cells spanning several rows or columns are repeated in every position they
+    cover, so each row can be read on its own. Short (ragged) rows are padded
+    with empty cells to the width of the widest row, and rows without any text
+    are dropped.
+    """
+    parser = _TableHTMLParser()
+    parser.feed(html)
+    parser.close()
+
+    grid: List[List[str]] = []
+    pending: Dict[int, List] = {}  # column -> [text, rows still covered]
+    for cells in parser.rows:
+        row: List[str] = []
+        cells = iter(cells)
+        column = 0
+        while True:
+            if column in pending:
+                text, remaining = pending[column]
+                row.append(text)
+                if remaining > 1:
+                    pending[column][1] -= 1
+                else:
+                    del pending[column]
+                column += 1
+                continue
+
+            cell = next(cells, None)
+            if cell is None:
+                if any(key >= column for key in pending):
+                    # Only spanned cells remain on this row
+                    row.append("")
+                    column += 1
+                    continue
+                break
+
+            text = " ".join("".join(cell["text"]).split())
+            for _ in range(cell["colspan"]):
+                if cell["rowspan"] > 1:
+                    pending[column] = [text, cell["rowspan"] - 1]
+                row.append(text)
+                column += 1
+
+        if any(row):
+            grid.append(row)
+
+    width = max((len(row) for row in grid), default=0)
+    return [row + [""] * (width - len(row)) for row in grid]
+
+
+def row_texts(rows: List[List[str]]) -> List[str]:
+    """
+    Render each data row as standalone text.
+
+    The first row is taken as the header and each value is labelled with its
+    column ("Door No.: PSD X01-X40; Work Done/Remarks: Done ..."). A table with
+    a single row has no header and renders as its cells.
+    """
+    if len(rows) < 2:
+        return [" | ".join(cell for cell in row if cell) for row in rows]
+
+    header, body = rows[0], rows[1:]
+    texts = []
+    for row in body:
+        parts = []
+        for i, value in enumerate(row):
+            if not value:
+                continue
+            label = header[i] if i < len(header) else ""
+            parts.append(f"{label}: {value}" if label and label != value else value)
+        texts.append("; ".join(parts))
+    return texts
+
+
+def table_text(rows: List[List[str]], caption: str = "") -> str:
+    """The whole table as plain text, one line per row, preceded by its caption."""
+    lines = [caption] if caption else []
+    lines += [" | ".join(row) for row in rows]
+    return "\n".join(lines)
+
+
+def row_document(text: str, caption: str = "") -> str:
+    """The textdb document of a table row: its text, preceded by the table caption."""
+    return f"{caption}\n{text}" if caption else text
+
+
+def row_chunk_id(table_id: str, filename: str, page_idx: int, row_idx: int, document: str) -> str:
+    """Stable textdb id of a table row, shared by ingestion and table lookups."""
+    return make_chunk_id(filename, "table_row", page_idx, f"{table_id}:{row_idx}:{document}")
+
+
+class TableStore(SQLiteStore):
+    """
+    Structured side-store of the tables found in ingested documents.
+
+    Every parsed table keeps its caption, header and cell grid, so exact
+    questions ("the +48V output voltage") can be answered by looking rows up
+    directly instead of relying on vector similarity alone.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tables (
+            table_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            page_idx INTEGER NOT NULL,
+            img_path TEXT NOT NULL,
+            caption TEXT NOT NULL,
+            header TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tables_filename ON tables (filename);
+        CREATE TABLE IF NOT EXISTS table_rows (
+            table_id TEXT NOT NULL,
+            row_idx INTEGER NOT NULL,
+            cells TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (table_id, row_idx)
+        );
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path] = pathlib.Path(STORAGE_PATH) / "tables.sqlite3",
+    ):
+        super().__init__(path)
+
+    def put(
+        self,
+        table_id: str,
+        filename: str,
+        page_idx: int,
+        rows: List[List[str]],
+        img_path: str = "",
+        caption: str = "",
+    ) -> None:
+        """Insert or replace a table and its rows."""
+        header = rows[0] if len(rows) > 1 else []
+        body = rows[1:] if len(rows) > 1 else rows
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?, ?, ?)",
+                (table_id, filename, page_idx, img_path, caption, json.dumps(header)),
+            )
+            self.conn.execute("DELETE FROM table_rows WHERE table_id = ?", (table_id,))
+            self.conn.executemany(
+                "INSERT INTO table_rows VALUES (?, ?, ?, ?)",
+                [
+                    (table_id, i, json.dumps(cells), text)
+                    for i, (cells, text) in enumerate(zip(body, row_texts(rows)))
+                ],
+            )
+            self.conn.commit()
+
+    def get(self, table_id: str) -> Optional[Dict]:
+        """Return a table with its header and rows, or None if unknown."""
+        with self.lock:
+            table = self.conn.execute(
+                "SELECT filename, page_idx, img_path, caption, header FROM tables "
+                "WHERE table_id = ?",
+                (table_id,),
+            ).fetchone()
+            if table is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT cells FROM table_rows WHERE table_id = ? ORDER BY row_idx",
+                (table_id,),
+            ).fetchall()
+
+        filename, page_idx, img_path, caption, header = table
+        return {
+            "table_id": table_id,
+            "filename": filename,
+            "page_idx": page_idx,
+            "img_path": img_path,
+            "caption": caption,
+            "header": json.loads(header),
+            "rows": [json.loads(cells) for (cells,) in rows],
+        }
+
+    def find_rows(
+        self, terms: List[str], filename: Optional[str] = None, limit: int = 20
+    ) -> List[Dict]:
+        """
+        Rows whose text contains every term (case-insensitive), in document order.
+        """
+        conditions = ["instr(lower(r.text), ?) > 0" for _ in terms]
+        params: List = [term.lower() for term in terms]
+        if filename:
+            conditions.append("t.filename = ?")
+            params.append(filename)
+        where = " AND ".join(conditions) or "1"
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT r.table_id, r.row_idx, r.text, t.filename, t.page_idx, t.img_path, t.caption "
+                "FROM table_rows r JOIN tables t ON t.table_id = r.table_id "
+                f"WHERE {where} ORDER BY t.filename, t.page_idx, r.table_id, r.row_idx LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [
+            {
+                "table_id": table_id,
+                "row_idx": row_idx,
+                "text": text,
+                "filename": filename,
+                "page_idx": page_idx,
+                "img_path": img_path,
+                "caption": caption,
+            }
+            for table_id, row_idx, text, filename, page_idx, img_path, caption in rows
+        ]
+
+    def retain(self, filename: str, table_ids: List[str]) -> int:
+        """Delete the tables of a document that are not in table_ids; returns how many."""
+        keep = set(table_ids)
+        with self.lock:
+            stale = [
+                (table_id,)
+                for (table_id,) in self.conn.execute(
+                    "SELECT table_id FROM tables WHERE filename = ?", (filename,)
+                )
+                if table_id not in keep
+            ]
+            self.conn.executemany("DELETE FROM table_rows WHERE table_id = ?", stale)
+            self.conn.executemany("DELETE FROM tables WHERE table_id = ?", stale)
+            self.conn.commit()
+        return len(stale)
+
+    def remove(self, filename: str) -> None:
+        self.retain(filename, [])
@@ -0,0 +1,98 @@
+from typing import List
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest suffix of `text` that is a proper prefix of `tag`"""
+    # Tags contain a single "<", so only the last one can start a partial tag
+    start = text.rfind("<", max(0, len(text) - len(tag) + 1))
+    if start != -1 and tag.startswith(text[start:]):
+        return len(text) - start
+    return 0
+
+
+class ThinkStreamParser:
+    """
+    Incremental splitter of a streamed response into reasoning and answer.
+
+    Chunks are scanned once, with only a possible partial tag carried over,
+    so each chunk costs O(len(chunk)) however long the response grows.
+    Three shapes are handled:
+    - "<think>reasoning</think>answer"
+    - "reasoning</think>answer", when the chat template already opened the
+      think block (text seen before the closing tag is moved to reasoning)
+    - a plain answer without tags
+    Whitespace between the reasoning and the answer is dropped.
+    """
+
+    def __init__(self):
+        self.thinking = False
+        self.closed = False
+        self._pending = ""
+        self._reasoning: List[str] = []
+        self._answer: List[str] = []
+
+    def _emit(self, text: str) -> None:
+        if not text:
+            return
+        if self.thinking:
+            self._reasoning.append(text)
+        elif self._answer or text.strip():
+            self._answer.append(text if self._answer else text.lstrip())
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next chunk of the stream"""
+        text = self._pending + chunk
+        self._pending = ""
+
+        while text:
+            if self.thinking:
+                tags = [CLOSE_TAG]
+            elif self.closed:
+                # Tags after the reasoning are answer text
+                tags = []
+            else:
+                tags = [OPEN_TAG, CLOSE_TAG]
+
+            found = [(text.find(tag), tag) for tag in tags]
+            found = [(index, tag) for index, tag in found if index != -1]
+            if not found:
+                keep = max((_partial_tag(text, tag) for tag in tags), default=0)
+                self._emit(text[: len(text) - keep])
+                self._pending = text[len(text) - keep :]
+                return
+
+            index, tag = min(found)
+            self._emit(text[:index])
+            text = text[index + len(tag) :]
+            if tag == OPEN_TAG:
+                self.thinking = True
+            else:
+                if not self.thinking:
+                    # Implicitly opened think block: what looked like answer was reasoning
+                    self._reasoning.extend(self._answer)
+                    self._answer = []
+                self.thinking = False
+                self.closed = True
+
+    def finish(self) -> None:
+        """Flush a trailing partial tag as text"""
+        pending, self._pending = self._pending, ""
+        self._emit(pending)
+
+    @staticmethod
+    def _joined(parts: List[str]) -> str:
+        # Collapse to one part, so repeated reads stay linear overall
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+    @property
+    def reasoning(self) -> str:
+        return self._joined(self._reasoning)
+
+    @property
+    def answer(self) -> str:
+        return self._joined(self._answer)
@@ -0,0 +1,52 @@
+import regex
+from .settings import *
+
+# Average characters per token of Latin-script text, by model family. Ollama
+# exposes no tokenizer, so counts are estimated from these ratios; they lean
+# low so that estimates err on the side of overcounting.
+CHARS_PER_TOKEN = {
+    "qwen": 3.6,
+    "llama": 3.8,
+    "gemma": 3.8,
+    "mistral": 3.5,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# CJK characters are counted as one token each
+WIDE = regex.compile(r"[\p{Han}\p{Hiragana}\p{Katakana}\p{Hangul}]")
+
+
+def chars_per_token(model: str = CHAT_MODEL) -> float:
+    name = model.lower()
+    for family, ratio in CHARS_PER_TOKEN.items():
+        if name.startswith(family):
+            return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def count_tokens(text: str, model: str = CHAT_MODEL) -> int:
+    """Estimated number of prompt tokens `text` takes for a model"""
+    if not text:
+        return 0
+    wide = len(WIDE.findall(text))
+    return wide + int((len(text) - wide) / chars_per_token(model) + 0.999)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = CHAT_MODEL) -> str:
+    """
+    Longest prefix of `text` estimated to fit in `max_tokens`, cut at a
+    whitespace boundary when one is close.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    end = min(len(text), int(max_tokens * chars_per_token(model)))
+    while end > 0 and count_tokens(text[:end], model) > max_tokens:
+        end = int(end * 0.9)
+
+    space = text.rfind(" ", 0, end)
+    if space > end * 0.8:
+        end = space
+    return text[:end].rstrip()